@@ -1,109 +1,32 @@
 import streamlit as st
-import json
 import os
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-from neo4j import GraphDatabase
-
-rcParams['font.sans-serif'] = ['Microsoft YaHei']  # 设置为微软雅黑或其他支持中文的字体x
-rcParams['axes.unicode_minus'] = False  # 防止负号显示为方块
-
-# 配置 Neo4j 连接
-uri = st.secrets["neo4j"]["uri"]
-username = st.secrets["neo4j"]["username"]
-password = st.secrets["neo4j"]["password"]
-driver = GraphDatabase.driver(uri, auth=(username, password))
-
-
-# 从 Neo4j 获取知识图谱数据
-def fetch_graph_data(query):
-    with driver.session() as session:
-        result = session.run(query)
-        nodes = set()
-        edges = []
-        for record in result:
-            n = record["n"]
-            m = record["m"]
-            r = record["r"]
-            nodes.add((n.id, n["name"]))
-            nodes.add((m.id, m["name"]))
-            edges.append((n.id, m.id, r.type))
-        return list(nodes), edges
-
-
-# 构建 HTML 可视化
-def create_vis_html(nodes, edges):
-    graph_data = {
-        "nodes": [{"id": node[0], "label": node[1]} for node in nodes],
-        "edges": [{"from": edge[0], "to": edge[1], "label": edge[2]} for edge in edges],
-    }
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-      <script src="https://unpkg.com/vis-network/standalone/umd/vis-network.min.js"></script>
-    </head>
-    <body>
-    <div id="network" style="width: 100%; height: 600px;"></div>
-    <script>
-      var nodes = new vis.DataSet({json.dumps(graph_data['nodes'])});
-      var edges = new vis.DataSet({json.dumps(graph_data['edges'])});
-      var container = document.getElementById('network');
-      var data = {{ nodes: nodes, edges: edges }};
-      var options = {{
-        nodes: {{
-          shape: 'dot',
-          size: 15,
-          font: {{ size: 14, color: '#000' }},
-          borderWidth: 2
-        }},
-        edges: {{
-          width: 2,
-          font: {{ size: 12, align: 'middle' }},
-          arrows: {{ to: {{ enabled: true, scaleFactor: 0.5 }} }},
-          color: {{ color: '#848484', highlight: '#848484', hover: '#848484' }},
-          smooth: {{ type: 'dynamic' }}
-        }},
-        physics: {{
-          stabilization: false,
-          barnesHut: {{
-            gravitationalConstant: -8000,
-            centralGravity: 0.3,
-            springLength: 95,
-            springConstant: 0.04
-          }}
-        }}
-      }};
-      var network = new vis.Network(container, data, options);
-    </script>
-    </body>
-    </html>
-    """
+from cache_backend import cached_diagnosis
+from charts import bar_chart
+from graph_index import get_index
+from graph_reload import get_reloader
+from question_view import smart_question_module
+from result_view import show_diagnoses
+from session_store import GUIDE_KEY, load_symptoms, save_symptoms
+from graph_view import configure_neo4j, create_vis_html, diagnosis_graph_data
+
+configure_neo4j()  # 连接参数读取 st.secrets["neo4j"]
 
 
 # 整合到诊断结果模块
 def diagnosis_results_module(knowledge_graph):
     st.header("诊断结果")
-    if "symptoms" in st.session_state and st.session_state["symptoms"]:
-        selected_symptoms = st.session_state["symptoms"]
+    # 会话中只保存症状编号，读取时还原为症状字符串
+    selected_symptoms = load_symptoms(st.session_state, get_index(knowledge_graph))
+    if selected_symptoms:
         diagnoses = get_diagnosis(selected_symptoms, knowledge_graph)
 
         if diagnoses:
             st.write("以下是根据您选择的症状生成的可能患有的疾病：")
-            for diag in diagnoses:
-                st.markdown(f"### {diag['疾病']}")
-                st.markdown(f"**疾病描述：** {diag['疾病描述']}")
-                st.markdown(f"**诊断标准：** {diag['诊断标准']}")
-                st.markdown(f"**治疗建议：** {diag['治疗建议']}")
+            show_diagnoses(diagnoses, knowledge_graph, key="results")
 
             # 动态展示知识图谱
             st.subheader("关联知识图谱")
-            query = f"""
-            MATCH (n)-[r]->(m)
-            WHERE n.name IN {json.dumps([diag['疾病'] for diag in diagnoses])}
-            RETURN n, r, m
-            """
-            nodes, edges = fetch_graph_data(query)
+            nodes, edges = diagnosis_graph_data(diagnoses)
             vis_html = create_vis_html(nodes, edges)
             st.components.v1.html(vis_html, height=600)
 
@@ -147,7 +70,7 @@ def security_module():
         if st.button("清除会话数据"):
             st.session_state.clear()
             st.success("所有会话数据已清除！")
-            st.experimental_set_query_params()
+            st.query_params.clear()
 
         # 提示用户继续操作
         st.info("您已通过身份验证，可返回导航栏使用其他功能。")
@@ -158,10 +81,10 @@ def test_module(knowledge_graph):
     st.title("测试模块")
     st.markdown("本模块用于测试系统的功能和知识图谱的准确性。")
 
-    # 获取所有症状
-    all_symptoms = set()
-    for disorder in knowledge_graph:
-        all_symptoms.update(disorder["symptom"])
+    # 关联矩阵等分析数据按图谱版本缓存，页面重跑时不再重新遍历图谱
+    from graph_analytics import get_analytics  # 按需导入：numpy 只在打开测试模块时加载
+    analytics = get_analytics(knowledge_graph)
+    all_symptoms = analytics.index.symptoms
 
     # 模拟输入
     st.subheader("症状输入模拟")
@@ -173,10 +96,7 @@ def test_module(knowledge_graph):
             diagnoses = get_diagnosis(test_symptoms, knowledge_graph)
             if diagnoses:
                 st.write("以下是根据测试症状生成的诊断结果：")
-                for diag in diagnoses:
-                    st.markdown(f"### {diag['疾病']}")
-                    st.markdown(f"**诊断标准：** {diag['诊断标准']}")
-                    st.markdown(f"**治疗建议：** {diag['治疗建议']}")
+                show_diagnoses(diagnoses, knowledge_graph, key="test", expanders=True, page_size=None)
             else:
                 st.warning("未匹配到任何疾病。")
         else:
@@ -191,19 +111,13 @@ def test_module(knowledge_graph):
 
     # 数据可视化：疾病与症状数量
     st.write("#### 疾病和症状统计条形图")
-    fig, ax = plt.subplots()
-    ax.bar(["疾病数量", "症状数量"], [disorder_counts, symptom_counts], color=["lightblue", "salmon"])
-    ax.set_ylabel("数量")
-    ax.set_title("知识图谱统计数据")
-    st.pyplot(fig)
+    st.image(bar_chart(("疾病数量", "症状数量"), (disorder_counts, symptom_counts), ("lightblue", "salmon"),
+                       title="知识图谱统计数据", ylabel="数量"), use_column_width=True)
 
     # 提供诊断的覆盖率
     st.subheader("诊断覆盖率测试")
     st.markdown("通过测试输入症状集合的匹配程度，计算诊断覆盖率。")
-    matched_disorders = sum(
-        1 for disorder in knowledge_graph if any(symptom in test_symptoms for symptom in disorder["symptom"])
-    )
-    coverage_rate = (matched_disorders / disorder_counts) * 100 if disorder_counts else 0
+    matched_disorders, coverage_rate = analytics.coverage(test_symptoms)
     st.markdown(f"- **覆盖的疾病数量：** {matched_disorders}")
     st.markdown(f"- **覆盖率：** {coverage_rate:.2f}%")
 
@@ -212,29 +126,27 @@ def test_module(knowledge_graph):
     else:
         st.success("覆盖率正常，知识图谱表现良好。")
 
+    # 症状区分度：每个症状命中多少疾病，以及按有无该症状划分疾病的熵
+    st.subheader("症状区分度分析")
+    st.markdown("命中疾病数越少，症状越特异；区分度(熵)越接近 1，该症状越能把疾病分成两组。")
+    st.dataframe(analytics.symptom_table(), use_container_width=True)
+
+    # 疾病混淆度：症状集合越相似，仅凭症状越难区分
+    st.subheader("易混淆疾病")
+    st.markdown("按两种疾病症状集合的相似度（Jaccard）从高到低排列。")
+    st.dataframe(analytics.confusable_pairs(limit=10), use_container_width=True)
+
 
 # 加载知识图谱函数
+# 图谱和索引在进程内只加载一次；文件更新后由后台线程建好新版本的索引再切换，
+# 每次重跑开始时取一次当前版本，整个重跑都使用这个版本
 def load_knowledge_graph(file_path):
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_reloader(file_path).current.disorders
 
 
-# 根据症状获取诊断
+# 根据症状获取诊断（至少匹配一个症状），通过症状倒排索引查找，不再逐个遍历疾病
 def get_diagnosis(symptoms, knowledge_graph):
-    possible_diagnoses = []
-
-    # 遍历每个睡眠障碍（每个元素是一个字典）
-    for disorder in knowledge_graph:
-        # 判断症状是否至少匹配一个
-        if any(symptom in disorder["symptom"] for symptom in symptoms):
-            possible_diagnoses.append({
-                "疾病": disorder["name"],  # 获取疾病名称
-                "疾病描述": disorder["desc"],  # 获取疾病描述
-                "诊断标准": disorder["diag_criteria"],  # 获取诊断标准
-                "治疗建议": disorder["cure_way"],  # 获取治疗建议
-            })
-
-    return possible_diagnoses
+    return cached_diagnosis(get_index(knowledge_graph), symptoms, mode="any")
 
 
 # 主函数
@@ -270,7 +182,7 @@ def main():
         st.title("逐步引导模式")
 
         # 第一步：选择症状
-        step = st.radio("请选择步骤：", ["选择症状", "确认症状", "查看结果"])
+        step = st.radio("请选择步骤：", ["选择症状", "确认症状", "查看结果", "智能问诊"])
         if step == "选择症状":
             st.subheader("第1步：选择您的症状")
             all_symptoms = set()
@@ -278,14 +190,14 @@ def main():
                 all_symptoms.update(disorder["symptom"])
             selected_symptoms = st.multiselect("选择症状：", list(all_symptoms))
             if st.button("保存症状"):
-                st.session_state["selected_symptoms"] = selected_symptoms
+                save_symptoms(st.session_state, get_index(knowledge_graph), selected_symptoms, key=GUIDE_KEY)
                 st.success("症状已保存，请前往下一步。")
 
         # 第二步：确认症状
         elif step == "确认症状":
             st.subheader("第2步：确认选择的症状")
-            if "selected_symptoms" in st.session_state:
-                st.write("您选择的症状：", st.session_state["selected_symptoms"])
+            if GUIDE_KEY in st.session_state:
+                st.write("您选择的症状：", load_symptoms(st.session_state, get_index(knowledge_graph), key=GUIDE_KEY))
                 if st.button("确认并继续"):
                     st.session_state["confirmed"] = True
                     st.success("症状确认成功！请前往下一步。")
@@ -296,17 +208,19 @@ def main():
         elif step == "查看结果":
             st.subheader("第3步：诊断结果")
             if "confirmed" in st.session_state and st.session_state["confirmed"]:
-                diagnoses = get_diagnosis(st.session_state["selected_symptoms"], knowledge_graph)
+                diagnoses = get_diagnosis(load_symptoms(st.session_state, get_index(knowledge_graph), key=GUIDE_KEY),
+                                          knowledge_graph)
                 if diagnoses:
-                    for diag in diagnoses:
-                        st.markdown(f"### {diag['疾病']}")
-                        st.markdown(f"**疾病描述：** {diag['疾病描述']}")
-                        st.markdown(f"**诊断标准：** {diag['诊断标准']}")
-                        st.markdown(f"**治疗建议：** {diag['治疗建议']}")
+                    show_diagnoses(diagnoses, knowledge_graph, key="guide")
                 else:
                     st.warning("未找到符合条件的疾病。")
             else:
                 st.warning("请先完成症状确认。")
+
+        # 智能问诊：逐个回答系统挑选的症状问题
+        elif step == "智能问诊":
+            st.subheader("智能问诊：请回答以下问题")
+            smart_question_module(knowledge_graph)
     elif choice == "症状选择":
         st.header("症状选择")
         st.markdown("请根据您的情况选择症状：")
@@ -323,7 +237,7 @@ def main():
         selected_symptoms = st.multiselect("选择症状", list(all_symptoms))
 
         if st.button("保存症状"):
-            st.session_state["symptoms"] = selected_symptoms
+            save_symptoms(st.session_state, get_index(knowledge_graph), selected_symptoms)
             st.success("症状已保存！")
     elif choice == "诊断结果":
         diagnosis_results_module(knowledge_graph)
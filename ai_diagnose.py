@@ -1,112 +1,66 @@
 import streamlit as st
-import json
-from matplotlib import rcParams
-from neo4j import GraphDatabase
+from cache_backend import cached_diagnosis, diagnosis_cache, subgraph_cache
+from graph_partition import get_router
+from result_view import disorder_page_panel, feedback_form, show_diagnoses
+from symptom_extractor import extract_symptoms
+from warmup import record_usage, start_warmup, warmup_status
+from session_store import (save_symptoms, load_symptoms, session_diagnosis_rows,
+                           session_bytes, track_session, registry, current_session_id, symptom_ids)
+from usage_analytics import analytics, usage_summary
+from graph_index import get_index, diagnosis_record
+from graph_reload import get_reloader, reload_statuses
+from graph_store import PIN_KEY, ab_graphs, pinned_graph, store
+from search_view import fulltext_search_module, reverse_index_module
+from graph_view import configure_neo4j, create_vis_html, diagnosis_graph_data, related_graph_panel
 import time
-import io
-
-rcParams['font.sans-serif'] = ['SimHei']  # 正常显示为中文标签
-rcParams['axes.unicode_minus'] = False  # 防止负号显示为方块
 
 # 配置 Neo4j 连接
 URI = "neo4j://localhost:7687"  # 替换为你的 Neo4j 实例地址
 USERNAME = "neo4j"  # 替换为你的用户名
 PASSWORD = "20020000"  # 替换为你的密码
-driver = GraphDatabase.driver(URI, auth=(USERNAME, PASSWORD))
-
-
-# 从 Neo4j 获取知识图谱数据
-def fetch_graph_data(query):
-    with driver.session() as session:
-        result = session.run(query)
-        nodes = set()
-        edges = []
-        for record in result:
-            n = record["n"]
-            m = record["m"]
-            r = record["r"]
-            nodes.add((n.element_id, n["name"]))
-            nodes.add((m.element_id, m["name"]))
-            edges.append((n.element_id, m.element_id, r.type))
-        return list(nodes), edges
-
-
-# 构建 HTML 可视化
-def create_vis_html(nodes, edges):
-    graph_data = {
-        "nodes": [{"id": node[0], "label": node[1]} for node in nodes],
-        "edges": [{"from": edge[0], "to": edge[1], "label": edge[2]} for edge in edges],
-    }
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-      <script src="https://unpkg.com/vis-network/standalone/umd/vis-network.min.js"></script>
-    </head>
-    <body>
-    <div id="network" style="width: 100%; height: 600px;"></div>
-    <script>
-      var nodes = new vis.DataSet({json.dumps(graph_data['nodes'])});
-      var edges = new vis.DataSet({json.dumps(graph_data['edges'])});
-      var container = document.getElementById('network');
-      var data = {{ nodes: nodes, edges: edges }};
-      var options = {{
-        nodes: {{
-          shape: 'dot',
-          size: 15,
-          font: {{ size: 14, color: '#000' }},
-          borderWidth: 2
-        }},
-        edges: {{
-          width: 2,
-          font: {{ size: 12, align: 'middle' }},
-          arrows: {{ to: {{ enabled: true, scaleFactor: 0.5 }} }},
-          color: {{ color: '#848484', highlight: '#848484', hover: '#848484' }},
-          smooth: {{ type: 'dynamic' }}
-        }},
-        physics: {{
-          stabilization: false,
-          barnesHut: {{
-            gravitationalConstant: -8000,
-            centralGravity: 0.3,
-            springLength: 95,
-            springConstant: 0.04
-          }}
-        }}
-      }};
-      var network = new vis.Network(container, data, options);
-    </script>
-    </body>
-    </html>
-    """
+configure_neo4j(URI, USERNAME, PASSWORD)
 
 
 # 整合到诊断结果模块
 def diagnosis_results_module(knowledge_graph):
     st.header("诊断结果")
-    if "symptoms" in st.session_state and st.session_state["symptoms"]:
-        selected_symptoms = st.session_state["symptoms"]
-        diagnoses = get_diagnosis(selected_symptoms, knowledge_graph)
+    # 会话中只保存症状编号，诊断结果的疾病行号也缓存在会话中
+    index = get_index(knowledge_graph)
+    selected_symptoms = load_symptoms(st.session_state, index)
+    if selected_symptoms:
+        # 按朴素贝叶斯后验概率从高到低排列，概率随用户的满意/不满意反馈更新
+        from naive_bayes import get_model  # 按需导入：numpy 只在需要排序时加载
+        rows = session_diagnosis_rows(st.session_state, index)
+        # 图谱中有多个疾病类别时可以限定类别，只在这些类别的分区中诊断
+        router = get_router(knowledge_graph)
+        categories = st.multiselect("限定疾病类别（可选）：", router.categories) if len(router.categories) > 1 else []
+        if categories:
+            rows = router.match_rows(selected_symptoms, categories=categories)
+        ranked = get_model(knowledge_graph).rank(selected_symptoms, rows)
+        diagnoses = [diagnosis_record(knowledge_graph[row]) for row, _ in ranked]
+        # 使用统计：同一组症状的诊断结果每个会话只记一次，重跑和翻页不重复计数
+        analytics_key = (index.version, symptom_ids(st.session_state, index), tuple(categories))
+        if st.session_state.get("analytics_recorded") != analytics_key:
+            analytics.record_diagnoses(current_session_id(), [diag["疾病"] for diag in diagnoses])
+            st.session_state["analytics_recorded"] = analytics_key
 
         if diagnoses:
             st.write("以下是根据您选择的症状生成的可能患有的疾病：")
-            for diag in diagnoses:
-                st.markdown(f"### {diag['疾病']}")
-                st.markdown(f"**疾病描述：** {diag['疾病描述']}")
-                st.markdown(f"**诊断标准：** {diag['诊断标准']}")
-                st.markdown(f"**治疗建议：** {diag['治疗建议']}")
+            st.dataframe([{"疾病": knowledge_graph[row]["name"], "概率": f"{prob:.1%}"} for row, prob in ranked],
+                         use_container_width=True)
+            show_diagnoses(diagnoses, knowledge_graph, key="results")
 
-            # 动态展示知识图谱
+            # 动态展示知识图谱（没有控件，只在整页重跑时重新生成）
             st.subheader("关联知识图谱")
-            query = f"""
-            MATCH (n)-[r]->(m)
-            WHERE n.name IN {json.dumps([diag['疾病'] for diag in diagnoses])}
-            RETURN n, r, m
-            """
-            nodes, edges = fetch_graph_data(query)
+            nodes, edges = diagnosis_graph_data(diagnoses)
             vis_html = create_vis_html(nodes, edges)
             st.components.v1.html(vis_html, height=600)
 
+            related_graph_panel(knowledge_graph, rows)
+
+            st.subheader("疾病详情页")
+            disorder_page_panel(knowledge_graph, [row for row, _ in ranked], key="results")
+
         else:
             st.warning("根据选择的症状，未能匹配到已知的疾病。")
     else:
@@ -149,7 +103,7 @@ def security_module():
         if st.button("清除会话数据"):
             st.session_state.clear()
             st.success("所有会话数据已清除！")
-            st.experimental_set_query_params()
+            st.query_params.clear()
 
         # 提示用户继续操作
         st.info("您已通过身份验证，可返回导航栏使用其他功能。")
@@ -160,10 +114,10 @@ def test_module(knowledge_graph):
     st.title("测试模块")
     st.markdown("本模块用于测试系统的功能和知识图谱的准确性。")
 
-    # 获取所有症状
-    all_symptoms = set()
-    for disorder in knowledge_graph:
-        all_symptoms.update(disorder["symptom"])
+    # 关联矩阵等分析数据按图谱版本缓存，页面重跑时不再重新遍历图谱
+    from graph_analytics import get_analytics  # 按需导入：numpy 只在打开测试模块时加载
+    analytics = get_analytics(knowledge_graph)
+    all_symptoms = analytics.index.symptoms
 
     # 模拟输入
     st.subheader("症状输入模拟")
@@ -175,11 +129,7 @@ def test_module(knowledge_graph):
             diagnoses = get_diagnosis(test_symptoms, knowledge_graph)
             if diagnoses:
                 st.write("以下是根据测试症状生成的诊断结果：")
-                for diag in diagnoses:
-                    st.markdown(f"### {diag['疾病']}")
-                    st.markdown(f"**疾病描述：** {diag['疾病描述']}")
-                    st.markdown(f"**诊断标准：** {diag['诊断标准']}")
-                    st.markdown(f"**治疗建议：** {diag['治疗建议']}")
+                show_diagnoses(diagnoses, knowledge_graph, key="test", expanders=True, page_size=None)
             else:
                 st.warning("未匹配到任何疾病。")
         else:
@@ -195,10 +145,7 @@ def test_module(knowledge_graph):
     # 提供诊断的覆盖率
     st.subheader("诊断覆盖率测试")
     st.markdown("通过测试输入症状集合的匹配程度，计算诊断覆盖率。")
-    matched_disorders = sum(
-        1 for disorder in knowledge_graph if any(symptom in test_symptoms for symptom in disorder["symptom"])
-    )
-    coverage_rate = (matched_disorders / disorder_counts) * 100 if disorder_counts else 0
+    matched_disorders, coverage_rate = analytics.coverage(test_symptoms)
     st.markdown(f"- **覆盖的疾病数量：** {matched_disorders}")
     st.markdown(f"- **覆盖率：** {coverage_rate:.2f}%")
 
@@ -207,81 +154,89 @@ def test_module(knowledge_graph):
     else:
         st.success("诊断覆盖率较高，测试症状较多。")
 
+    # 症状区分度：每个症状命中多少疾病，以及按有无该症状划分疾病的熵
+    st.subheader("症状区分度分析")
+    st.markdown("命中疾病数越少，症状越特异；区分度(熵)越接近 1，该症状越能把疾病分成两组。")
+    st.dataframe(analytics.symptom_table(), use_container_width=True)
+
+    # 疾病混淆度：症状集合越相似，仅凭症状越难区分
+    st.subheader("易混淆疾病")
+    st.markdown("按两种疾病症状集合的相似度（Jaccard）从高到低排列。")
+    st.dataframe(analytics.confusable_pairs(limit=10), use_container_width=True)
+
+    # 准确率基准：由图谱随机生成带标注的用例，比较各诊断引擎与参考实现的结果；完整测试集用 benchmark.py 并行运行
+    st.subheader("准确率基准")
+    case_count = st.number_input("用例数：", min_value=100, max_value=5000, value=500, step=100)
+    if st.button("运行基准"):
+        from benchmark import ENGINES, evaluate_cases, generate_cases, summarize
+        cases = generate_cases(knowledge_graph, int(case_count))
+        rows = []
+        for name in ("reference", "index_any", "naive_bayes"):
+            summary = summarize(evaluate_cases(cases, ENGINES[name], knowledge_graph))
+            rows.append({"引擎": name, "精确率": round(summary["precision"], 4), "召回率": round(summary["recall"], 4),
+                         "top1": round(summary["top1"], 4), "top3": round(summary["top3"], 4),
+                         "p50(ms)": round(summary["latency_p50_ms"], 4), "p95(ms)": round(summary["latency_p95_ms"], 4)})
+        st.dataframe(rows, use_container_width=True)
+
+    # 会话内存：当前会话和所有在线会话的会话状态大小
+    st.subheader("会话内存")
+    stats = registry.stats()
+    st.markdown(f"- **当前会话状态：** {session_bytes(st.session_state)} 字节")
+    st.markdown(f"- **在线会话数：** {stats['sessions']}，合计 {stats['total_bytes']} 字节，最大 {stats['max_bytes']} 字节")
+    st.markdown(f"- **已回收：** 精简 {stats['trimmed']} 次，清空 {stats['expired']} 个空闲会话")
+
+    # 结果缓存：进程内命中、共享层（Redis）命中和未命中次数
+    st.subheader("结果缓存")
+    st.dataframe([diagnosis_cache.stats(), subgraph_cache.stats()], use_container_width=True)
+    status = warmup_status(knowledge_graph)
+    st.markdown(f"- **缓存预热：** {status['state']}，已完成 {status['done']}/{status['total']} 组症状，"
+                f"失败 {status['errors']} 组，用时 {status['seconds']:.2f} 秒")
+
+    # 使用统计：所有进程合并后的草图估计，内存和快照大小固定，与用户数无关；未设置 SLEEP_ANALYTICS_DIR 时不统计
+    st.subheader("使用统计")
+    summary = usage_summary(top_n=10)
+    if summary is None:
+        st.markdown("- 未开启（设置 SLEEP_ANALYTICS_DIR 后才统计）")
+    else:
+        st.markdown(f"- **不同会话数（估计）：** {summary['distinct_sessions']}，保存症状 {summary['selections']} 次，"
+                    f"给出诊断 {summary['diagnosis_events']} 次")
+    for kind, title in (("symptom", "常选症状"), ("pair", "常见症状组合"), ("diagnosis", "常见诊断")):
+        if summary is not None and summary["top"][kind]:
+            st.markdown(f"**{title}**")
+            st.dataframe([{"名称": item, "次数（估计）": count} for item, count in summary["top"][kind]],
+                         use_container_width=True)
+
+    # 多版本图谱（A/B 测试）：当前会话固定的版本，以及各版本共用的记录、字段值和字符串数量
+    if ab_graphs():
+        st.subheader("多版本图谱")
+        stats = store.stats()
+        st.markdown(f"- **当前会话版本：** {st.session_state.get(PIN_KEY)}")
+        st.markdown(f"- **共享存储：** 疾病记录 {stats['records']} 条，字段值 {stats['shared_values']} 个，"
+                    f"字符串 {stats['strings']} 个（各版本共引用 {stats['string_references']} 次）")
+        st.dataframe([{"标签": label, **info} for label, info in stats["versions"].items()], use_container_width=True)
+
+    # 图谱热更新：当前版本、最近几次切换的构建和切换耗时
+    st.subheader("图谱热更新")
+    for status in reload_statuses():
+        st.markdown(f"- **{status['file']}：** 当前版本 {status['version']}，"
+                    f"{'正在检查文件更新' if status['watching'] else '未启动后台检查'}，"
+                    f"待释放旧版本 {status['retiring']} 个，仍被引用的旧版本 {status['retired_alive']} 个")
+        if status["last_error"]:
+            st.warning(f"最近一次加载失败，继续使用当前版本：{status['last_error']}")
+        if status["history"]:
+            st.dataframe(status["history"], use_container_width=True)
+
 
 # 加载知识图谱函数
+# 图谱和索引在进程内只加载一次；文件更新后由后台线程建好新版本的索引再切换，
+# 每次重跑开始时取一次当前版本，整个重跑都使用这个版本
 def load_knowledge_graph(file_path):
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_reloader(file_path).current.disorders
 
 
-# 根据症状获取诊断
+# 根据症状获取诊断（至少匹配一个症状），通过症状倒排索引查找，不再逐个遍历疾病
 def get_diagnosis(symptoms, knowledge_graph):
-    possible_diagnoses = []
-
-    # 遍历每个睡眠障碍（每个元素是一个字典）
-    for disorder in knowledge_graph:
-        # 判断症状是否至少匹配一个
-        if any(symptom in disorder["symptom"] for symptom in symptoms):
-            possible_diagnoses.append({
-                "id": disorder["_id"],  # 获取疾病ID
-                "疾病": disorder["name"],  # 获取疾病名称
-                "疾病描述": disorder["desc"],  # 获取疾病描述
-                "诊断标准": disorder["diag_criteria"],  # 获取诊断标准
-                "治疗建议": disorder["cure_way"],  # 获取治疗建议
-            })
-
-    return possible_diagnoses
-
-
-def modify_probability(data, step, target_ids):
-    """
-      根据多个target_ids修改数据中的probability字段
-      :param data: JSON数据
-      :param target_ids: 目标_id的列表
-      :return: 修改后的数据
-    """
-    for item in data:
-        if item.get('_id') in target_ids:  # 如果 _id 在目标列表中
-            # 获取当前的 probability 字段
-            if 'probability' in item:
-                # 将概率值从字符串转换为数字并加 1%
-                updated_probabilities = []
-                for prob in item['probability']:
-                    if step == "满意":
-                        try:
-                            prob_value = float(prob.replace('%', ''))  # 去掉百分号并转为浮动数值
-                            numerator = prob_value  # 分子是百分数的值
-                            denominator = 100  # 默认分母为100
-
-                            # 分子分母同时加1
-                            new_numerator = numerator + 1
-                            new_denominator = denominator + 1
-
-                            # 转换回百分数形式
-                            new_prob = (new_numerator / new_denominator) * 100  # 计算百分数
-                            updated_probabilities.append(f"{new_prob:.1f}%")  # 保留一位小数并加回百分号
-                        except ValueError:
-                            updated_probabilities.append(prob)  # 如果转换失败，保留原值
-                    elif step == "不满意":
-                        try:
-                            prob_value = float(prob.replace('%', ''))  # 去掉百分号并转为浮动数值
-                            numerator = prob_value  # 分子是百分数的值
-                            denominator = 100  # 默认分母为100
-
-                            # 分子分母同时加1
-                            new_numerator = numerator - 1
-                            new_denominator = denominator - 1
-
-                            # 转换回百分数形式
-                            new_prob = (new_numerator / new_denominator) * 100  # 计算百分数
-                            updated_probabilities.append(f"{new_prob:.1f}%")  # 保留一位小数并加回百分号
-                        except ValueError:
-                            updated_probabilities.append(prob)  # 如果转换失败，保留原值
-                    else:
-                        updated_probabilities.append(prob)  # 如果转换失败，保留原值
-
-                item['probability'] = updated_probabilities
-    return data
+    return cached_diagnosis(get_index(knowledge_graph), symptoms, mode="any")
 
 
 # 主函数
@@ -289,15 +244,21 @@ def main():
     if "feedback_work" not in st.session_state:
         st.session_state["feedback_work"] = 0
     st.set_page_config(page_title="疾病诊断系统", layout="wide")
+    track_session(st.session_state)  # 记录会话大小并回收空闲会话
 
     # 加载知识图谱
     file_path = "sleep_konwledge_graph.json"
     # file_path = r"sleep_konwledge_graph.json"
-    knowledge_graph = load_knowledge_graph(file_path)
+    # 配置了 SLEEP_AB_GRAPHS 时，每个会话固定使用其中一个图谱版本（A/B 测试），各版本共用去重后的存储
+    if ab_graphs():
+        _, knowledge_graph = pinned_graph(st.session_state, current_session_id())
+    else:
+        knowledge_graph = load_knowledge_graph(file_path)
+    start_warmup(knowledge_graph, extra=diagnosis_graph_data)  # 后台预热常见症状组合，每个图谱版本只执行一次
 
     st.sidebar.markdown('<div style="font-size: 30px; font-weight: bold;">导航菜单</div>', unsafe_allow_html=True)
     # 使用 HTML 设置更大的字体
-    tab_options = ["安全模块", "首页", "症状选择", "诊断结果", "测试模块", "反馈", "隐私管理"]
+    tab_options = ["安全模块", "首页", "症状选择", "诊断结果", "全文检索", "反向索引", "测试模块", "反馈", "隐私管理"]
 
     choice = st.sidebar.radio("选择页面：", tab_options)
 
@@ -339,8 +300,24 @@ def main():
         # 症状选择
         selected_symptoms = st.multiselect("选择症状", list(all_symptoms))
 
+        # 也可以直接用文字描述，自动识别其中的已知症状，与上面选择的症状一起保存
+        description = st.text_area("或直接描述您的症状：", "")
+        if description.strip():
+            found_symptoms, found_accompany = extract_symptoms(description, knowledge_graph)
+            st.markdown(f"**识别到的症状：** {'、'.join(found_symptoms) or '无'}")
+            if found_accompany:
+                st.markdown(f"**提到的相关疾病：** {'、'.join(found_accompany)}")
+            selected_symptoms = list(dict.fromkeys(selected_symptoms + found_symptoms))
+            # 没有精确识别出症状的分句再做近似匹配（错字、前缀、词序不同），由用户确认
+            from fuzzy_match import suggest_symptoms  # 按需导入：numpy 只在输入症状描述时加载
+            suggestions = suggest_symptoms(description, knowledge_graph, known=selected_symptoms)
+            if suggestions:
+                selected_symptoms += st.multiselect("可能指的症状（可取消）：", suggestions, default=suggestions)
+
         if st.button("保存症状"):
-            st.session_state["symptoms"] = selected_symptoms
+            save_symptoms(st.session_state, get_index(knowledge_graph), selected_symptoms)
+            record_usage(selected_symptoms)
+            analytics.record_selection(current_session_id(), selected_symptoms)
             st.success("症状已保存！即将跳转到诊断结果页面...")
             st.session_state["go_to_diagnosis"] = True  # 标记跳转
             st.session_state["feedback_work"] = 1
@@ -362,33 +339,19 @@ def main():
         diagnosis_results_module(knowledge_graph)
 
 
+    elif choice == "全文检索":
+        fulltext_search_module(knowledge_graph)
+
+
+    elif choice == "反向索引":
+        reverse_index_module(knowledge_graph)
+
+
     elif choice == "反馈":
 
         if st.session_state["feedback_work"] != 0:
             st.header("用户反馈")
-            feedback = st.text_area("请留下您的宝贵意见：", "")
-            step = st.radio("您对本次诊断满意吗？", [" ", "不确定", "满意", "不满意"])
-            # 处理 probability 字段
-            if "symptoms" in st.session_state and st.session_state["symptoms"]:
-                selected_symptoms = st.session_state["symptoms"]
-                possible_diagnoses = get_diagnosis(selected_symptoms, knowledge_graph)
-
-            target_ids = [diag["id"] for diag in possible_diagnoses]
-            updated_data = modify_probability(knowledge_graph, step, target_ids)
-
-            # 将修改后的数据转为 JSON 字符串
-            json_data = json.dumps(updated_data, ensure_ascii=False, indent=4)
-
-            # 使用 StringIO 将 JSON 数据转为类文件对象
-            json_buffer = io.StringIO(json_data)
-            if step != " ":
-                # 创建文件的下载链接
-                st.download_button(
-                    label="下载修改后的 JSON 文件",
-                    data=json_buffer.getvalue(),
-                    file_name="data_modified.json",
-                    mime="application/json"
-                )
+            feedback_form(knowledge_graph)
         else:
             st.markdown("""
                               -请先进行症状选择与诊断结果获取
@@ -0,0 +1,202 @@
+# @File   : benchmark.py
+# 诊断准确率回归基准：用标注好的测试集（症状集合 -> 期望的疾病名称）评估任意诊断引擎，
+# 多进程并行跑完成千上万个用例，输出精确率、召回率、top-k 准确率和每个用例的耗时，
+# 用来证明更快的引擎没有改变结果，并跟踪不同图谱版本之间的准确率变化。
+#
+# 测试集为 JSON Lines，每行一个用例：
+#   {"symptoms": ["持续打鼾", "日间嗜睡"], "expected": ["发作性睡病", "阻塞性睡眠呼吸暂停"], "target": "阻塞性睡眠呼吸暂停"}
+# expected 为应返回的疾病名称集合，target（可选）为最可能的疾病，用于计算 top-k 准确率。
+# 用名称而不用 _id 作为键：_id 在图谱中并不唯一（例如 sleep_konwledge_graph.json 中有三个疾病的 _id 都是 22），
+# 返回了同 _id 的另一个疾病也会被算作正确。
+#
+# 运行方式：
+#   python benchmark.py generate --graph sleep_konwledge_graph.json --cases 5000 --out golden.jsonl
+#   python benchmark.py run --graph sleep_konwledge_graph.json --golden golden.jsonl --engine index_any --workers 4
+# --engine 可以是内置引擎名，也可以是 “模块名:函数名”，函数签名为 f(symptoms, knowledge_graph)，
+# 返回按可能性排序的诊断列表（每项至少含 "疾病" 字段，与 diagnosis_record 相同）。
+import argparse
+import importlib
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from graph_index import load_index, get_index
+
+TOP_K = (1, 3, 5)
+
+
+# 参考实现：与最初 get_diagnosis 相同的逐个遍历（至少匹配一个症状），作为生成测试集的标准答案
+def reference_engine(symptoms, knowledge_graph):
+    return [{"id": d["_id"], "疾病": d["name"]} for d in knowledge_graph
+            if any(symptom in d["symptom"] for symptom in symptoms)]
+
+
+def index_any_engine(symptoms, knowledge_graph):
+    return get_index(knowledge_graph).diagnose(symptoms, mode="any")
+
+
+def index_all_engine(symptoms, knowledge_graph):
+    return get_index(knowledge_graph).diagnose(symptoms, mode="all")
+
+
+_models = {}  # 图谱版本 -> 只由图谱初始化的朴素贝叶斯模型
+
+
+# 在至少匹配一个症状的疾病中按朴素贝叶斯后验概率排序。
+# 使用只由图谱初始化、不含用户反馈的模型，既不读也不写 .cache 中保存的模型，同一图谱每次运行的结果相同
+def naive_bayes_engine(symptoms, knowledge_graph):
+    from naive_bayes import NaiveBayesModel
+    index = get_index(knowledge_graph)
+    model = _models.get(index.version)
+    if model is None:
+        model = _models[index.version] = NaiveBayesModel(index)
+    ranked = model.rank(symptoms, index.match_any(symptoms))
+    return [{"id": knowledge_graph[row]["_id"], "疾病": knowledge_graph[row]["name"]} for row, _ in ranked]
+
+
+ENGINES = {
+    "reference": reference_engine,
+    "index_any": index_any_engine,
+    "index_all": index_all_engine,
+    "naive_bayes": naive_bayes_engine,
+}
+
+
+def resolve_engine(name):
+    if name in ENGINES:
+        return ENGINES[name]
+    module, _, func = name.partition(":")
+    return getattr(importlib.import_module(module), func)
+
+
+# 由图谱生成测试集：随机选一个疾病作为 target，抽取它的 1~max_symptoms 个症状，
+# 有一定概率再混入其他疾病的症状；expected 由参考实现给出
+def generate_cases(knowledge_graph, count=1000, max_symptoms=4, noise=0.2, seed=0):
+    rng = random.Random(seed)
+    all_symptoms = sorted({s for d in knowledge_graph for s in d["symptom"]})
+    cases = []
+    for _ in range(count):
+        disorder = rng.choice(knowledge_graph)
+        own = sorted(set(disorder["symptom"]))
+        symptoms = rng.sample(own, rng.randint(1, min(max_symptoms, len(own))))
+        if rng.random() < noise:
+            symptoms.append(rng.choice(all_symptoms))
+        symptoms = list(dict.fromkeys(symptoms))
+        expected = sorted({diag["疾病"] for diag in reference_engine(symptoms, knowledge_graph)})
+        cases.append({"symptoms": symptoms, "expected": expected, "target": disorder["name"]})
+    return cases
+
+
+def load_cases(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_cases(cases, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for case in cases:
+            f.write(json.dumps(case, ensure_ascii=False) + "\n")
+
+
+# 评估一批用例，返回每个用例的指标：
+# (真阳性数, 返回数, 期望数, 集合完全一致, 是否标注了 target, target 的名次（未返回为 None）, 耗时秒)
+def evaluate_cases(cases, engine, knowledge_graph):
+    results = []
+    for case in cases:
+        start = time.perf_counter()
+        diagnoses = engine(case["symptoms"], knowledge_graph)
+        elapsed = time.perf_counter() - start
+        ranked = list(dict.fromkeys(diag["疾病"] for diag in diagnoses))
+        predicted, expected = set(ranked), set(case["expected"])
+        target = case.get("target")
+        rank = ranked.index(target) + 1 if target in predicted else None
+        results.append((len(predicted & expected), len(predicted), len(expected), predicted == expected,
+                        target is not None, rank, elapsed))
+    return results
+
+
+# 工作进程入口：每个进程自己加载图谱和引擎
+def _evaluate_chunk(graph_path, engine_name, cases):
+    knowledge_graph = load_index(graph_path).disorders
+    engine = resolve_engine(engine_name)
+    engine(cases[0]["symptoms"], knowledge_graph) if cases else None  # 预热，构建索引的时间不计入用例耗时
+    return evaluate_cases(cases, engine, knowledge_graph)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] if values else 0.0
+
+
+# 汇总指标：微平均精确率/召回率、结果与期望完全一致的比例、top-k 准确率、耗时分位数
+def summarize(results):
+    tp = sum(r[0] for r in results)
+    returned = sum(r[1] for r in results)
+    expected = sum(r[2] for r in results)
+    with_target = [r for r in results if r[4]]
+    latencies = [r[6] for r in results]
+    summary = {
+        "cases": len(results),
+        "precision": tp / returned if returned else 1.0,
+        "recall": tp / expected if expected else 1.0,
+        "exact_match": sum(r[3] for r in results) / len(results) if results else 0.0,
+        "latency_p50_ms": _percentile(latencies, 50) * 1000,
+        "latency_p95_ms": _percentile(latencies, 95) * 1000,
+        "latency_mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+    }
+    for k in TOP_K:
+        hits = sum(1 for r in with_target if r[5] is not None and r[5] <= k)
+        summary[f"top{k}"] = hits / len(with_target) if with_target else 0.0
+    return summary
+
+
+# 并行运行基准：用例按 workers 个进程切分，结果顺序与用例顺序一致
+def run_benchmark(graph_path, cases, engine_name="index_any", workers=4):
+    workers = max(1, min(workers, len(cases)))
+    if workers == 1:
+        results = _evaluate_chunk(graph_path, engine_name, cases)
+    else:
+        size = (len(cases) + workers - 1) // workers
+        chunks = [cases[i:i + size] for i in range(0, len(cases), size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(_evaluate_chunk, [graph_path] * len(chunks), [engine_name] * len(chunks), chunks)
+            results = [r for part in parts for r in part]
+    summary = summarize(results)
+    summary["engine"] = engine_name
+    summary["version"] = load_index(graph_path).version
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="诊断准确率回归基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="由图谱生成测试集")
+    gen.add_argument("--graph", default="sleep_konwledge_graph.json")
+    gen.add_argument("--cases", type=int, default=1000)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--out", default="golden.jsonl")
+    run = sub.add_parser("run", help="评估诊断引擎")
+    run.add_argument("--graph", default="sleep_konwledge_graph.json")
+    run.add_argument("--golden", default="golden.jsonl")
+    run.add_argument("--engine", action="append", help="可重复指定多个引擎，默认 index_any")
+    run.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        cases = generate_cases(load_index(args.graph).disorders, args.cases, seed=args.seed)
+        save_cases(cases, args.out)
+        print(f"已生成 {len(cases)} 个用例：{args.out}")
+        return
+
+    cases = load_cases(args.golden)
+    print(f"{'引擎':<14}{'用例':>7}{'精确率':>9}{'召回率':>9}{'一致':>9}{'top1':>8}{'top3':>8}{'top5':>8}"
+          f"{'p50(ms)':>10}{'p95(ms)':>10}")
+    for engine_name in args.engine or ["index_any"]:
+        s = run_benchmark(args.graph, cases, engine_name, args.workers)
+        print(f"{engine_name:<14}{s['cases']:>7}{s['precision']:>10.4f}{s['recall']:>10.4f}{s['exact_match']:>10.4f}"
+              f"{s['top1']:>8.4f}{s['top3']:>8.4f}{s['top5']:>8.4f}{s['latency_p50_ms']:>10.4f}{s['latency_p95_ms']:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# @File   : cache_backend.py
+# 诊断结果和 Neo4j 子图的两级缓存：第一级是进程内 LRU，第二级是多个副本共享的 Redis（可选）。
+# 键由命名空间、图谱版本和规范化后的症状集合（或查询）组成，同一组症状在整个集群中只需计算一次。
+# 设置环境变量 SLEEP_REDIS_URL（例如 redis://localhost:6379/0）并安装 redis 包后启用共享层；
+# 未设置时只使用进程内缓存。MemoryStore 实现了与 Redis 相同的 get/set 接口，可在测试中代替 Redis。
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+REDIS_URL = os.environ.get("SLEEP_REDIS_URL", "")
+DEFAULT_TTL = int(os.environ.get("SLEEP_CACHE_TTL", "3600"))  # 秒，0 表示不过期
+KEY_PREFIX = "sleep"
+
+
+# 症状集合的规范形式：去重、排序，保证同一组症状无论顺序如何都命中同一个缓存
+def canonical_symptoms(symptoms):
+    return tuple(sorted({str(s) for s in symptoms}))
+
+
+class MemoryStore:
+    """Redis 接口的本地替身：只实现缓存用到的 get/set/delete，值为字节，支持 ex 过期秒数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}  # 键 -> (过期时间或 None, 值)
+
+    def get(self, name):
+        with self._lock:
+            item = self._data.get(name)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires <= time.time():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (time.time() + ex if ex else None, value)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+
+# 共享层：配置了 SLEEP_REDIS_URL 时连接 Redis，未配置或没有安装 redis 包时返回 None
+def shared_store():
+    if not REDIS_URL:
+        return None
+    try:
+        import redis
+    except ImportError:
+        return None
+    return redis.Redis.from_url(REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+
+def _json_dumps(value):
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _json_loads(raw):
+    return json.loads(raw)
+
+
+class TieredCache:
+    """
+    两级缓存。键可以是任意可 repr 的元组（应包含图谱版本），共享层使用其 sha1 作为 Redis 键。
+    dumps/loads 决定值在共享层中的编码方式，默认 JSON；值本身已是字节时传入 bytes。
+    共享层出错（网络超时等）时只计数并退回到进程内缓存，不影响页面。
+    """
+
+    def __init__(self, namespace, maxsize=1024, ttl=DEFAULT_TTL, shared=None, dumps=_json_dumps, loads=_json_loads):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.dumps = dumps
+        self.loads = loads
+        self._lock = threading.Lock()
+        self._local = OrderedDict()  # 键 -> (过期时间或 None, 值)
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _shared_key(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return f"{KEY_PREFIX}:{self.namespace}:{digest}"
+
+    def _get_local(self, key):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires <= time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return item
+
+    def _put_local(self, key, value, ttl):
+        with self._lock:
+            self._local[key] = (time.time() + ttl if ttl else None, value)
+            self._local.move_to_end(key)
+            if len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def get(self, key):
+        item = self._get_local(key)
+        if item is not None:
+            self.local_hits += 1
+            return item[1]
+        if self.shared is not None:
+            try:
+                raw = self.shared.get(self._shared_key(key))
+            except Exception:  # 共享层不可用时按未命中处理
+                raw = None
+                self.errors += 1
+            if raw is not None:
+                value = self.loads(raw)
+                self._put_local(key, value, self.ttl)
+                self.shared_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._put_local(key, value, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(self._shared_key(key), self.dumps(value), ex=ttl or None)
+            except Exception:
+                self.errors += 1
+
+    # 先查缓存，未命中时调用 compute() 计算并写入两级缓存
+    def get_or_compute(self, key, compute, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value, ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "shared": self.shared is not None,
+            "size": len(self._local),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_shared = shared_store()
+
+# 页面共用的缓存：诊断结果按图谱版本和症状集合缓存；Neo4j 子图按查询语句缓存，数据库可能被修改，过期时间较短
+diagnosis_cache = TieredCache("diagnosis", maxsize=4096, shared=_shared)
+subgraph_cache = TieredCache("subgraph", maxsize=512, ttl=int(os.environ.get("SLEEP_SUBGRAPH_TTL", "600")),
+                             shared=_shared)
+
+
+# 带缓存的诊断：index 为 GraphIndex，结果格式与 GraphIndex.diagnose 相同
+def cached_diagnosis(index, symptoms, mode="any", min_match=None):
+    symptoms = canonical_symptoms(symptoms)
+    key = (index.version, mode, min_match, symptoms)
+    return diagnosis_cache.get_or_compute(key, lambda: index.diagnose(symptoms, mode=mode, min_match=min_match))
+
+
+# 带缓存的子图查询：run_query(query, params) 返回 (nodes, edges)；键由规范化的查询语句和参数组成
+def cached_subgraph(query, run_query, params=None):
+    params = params or {}
+    key = (" ".join(query.split()), json.dumps(params, ensure_ascii=False, sort_keys=True))
+    return subgraph_cache.get_or_compute(key, lambda: run_query(query, params))
@@ -0,0 +1,71 @@
+# @File   : charts.py
+# 页面图表统一在这里生成：同样的输入只渲染一次，结果缓存为 PNG 字节，页面用 st.image 展示。
+# 不经过 pyplot 的全局图形管理器，直接创建 Figure 并在渲染后释放，长时间运行内存不会增长。
+import io
+import threading
+from functools import lru_cache
+
+CHART_CACHE_SIZE = 256  # 最多缓存的图表数量
+
+# 中文字体按顺序回退：Windows 常见的微软雅黑、黑体，找不到再用 matplotlib 自带字体
+FONTS = ['Microsoft YaHei', 'SimHei', 'DejaVu Sans']
+
+_font_lock = threading.Lock()
+_fonts_ready = False
+
+
+# 设置中文字体，只在第一次生成图表时执行一次
+def setup_fonts():
+    global _fonts_ready
+    if _fonts_ready:
+        return
+    with _font_lock:
+        if not _fonts_ready:
+            from matplotlib import rcParams
+            rcParams['font.sans-serif'] = FONTS  # 正常显示为中文标签
+            rcParams['axes.unicode_minus'] = False  # 防止负号显示为方块
+            _fonts_ready = True
+
+
+# 把 Figure 渲染成 PNG 字节，渲染后立即清空，确保图形对象被释放
+def _render(fig):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    try:
+        FigureCanvasAgg(fig)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight")
+        return buffer.getvalue()
+    finally:
+        fig.clear()
+
+
+def _new_figure():
+    setup_fonts()
+    from matplotlib.figure import Figure
+    fig = Figure()
+    return fig, fig.subplots()
+
+
+# 条形图，参数都是可哈希的元组/字符串，作为缓存键
+@lru_cache(maxsize=CHART_CACHE_SIZE)
+def bar_chart(labels, values, colors=None, title="", ylabel=""):
+    fig, ax = _new_figure()
+    ax.bar(list(labels), list(values), color=list(colors) if colors else None)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    return _render(fig)
+
+
+# 饼图
+@lru_cache(maxsize=CHART_CACHE_SIZE)
+def pie_chart(sizes, labels, colors=None, title="", startangle=90):
+    fig, ax = _new_figure()
+    ax.pie(
+        list(sizes),
+        labels=list(labels),
+        autopct="%1.1f%%",
+        colors=list(colors) if colors else None,
+        startangle=startangle,
+    )
+    ax.set_title(title)
+    return _render(fig)
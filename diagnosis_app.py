@@ -2,35 +2,26 @@
 # @File   : diagnosis_app.py
 # @Time   : 2024/11/21 14:11
 import streamlit as st
-import json
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-
-rcParams['font.sans-serif'] = ['Microsoft YaHei']  # 设置为微软雅黑或其他支持中文的字体x
-rcParams['axes.unicode_minus'] = False  # 防止负号显示为方块
+from cache_backend import cached_diagnosis
+from charts import bar_chart, pie_chart
+from graph_index import get_index
+from graph_reload import get_reloader
+from question_view import smart_question_module
+from result_view import show_diagnoses
+from session_store import GUIDE_KEY, load_symptoms, save_symptoms
 
 
 # 加载知识图谱函数
+# 图谱和索引在进程内只加载一次；文件更新后由后台线程建好新版本的索引再切换，
+# 每次重跑开始时取一次当前版本，整个重跑都使用这个版本
 def load_knowledge_graph(file_path):
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
+    return get_reloader(file_path).current.disorders
 
-# 根据症状获取诊断
-def get_diagnosis(symptoms, knowledge_graph):
-    possible_diagnoses = []
 
-    # 遍历每个睡眠障碍（每个元素是一个字典）
-    for disorder in knowledge_graph:
-        # 判断症状是否匹配
-        if all(symptom in disorder["symptom"] for symptom in symptoms):
-            possible_diagnoses.append({
-                "疾病": disorder["name"],  # 获取疾病名称
-                "诊断标准": disorder["diag_criteria"],  # 获取诊断标准
-                "治疗建议": disorder["cure_way"],  # 获取治疗建议
-            })
-
-    return possible_diagnoses
+# 根据症状获取诊断（严格模式：疾病需包含全部所选症状），用症状位集合按位与完成；
+# 指定 min_match 时改为“至少匹配 min_match 个症状”
+def get_diagnosis(symptoms, knowledge_graph, min_match=None):
+    return cached_diagnosis(get_index(knowledge_graph), symptoms, mode="all", min_match=min_match)
 
 
 # 主函数
@@ -58,7 +49,7 @@ def main():
         st.title("逐步引导模式")
 
         # 第一步：选择症状
-        step = st.radio("请选择步骤：", ["选择症状", "确认症状", "查看结果"])
+        step = st.radio("请选择步骤：", ["选择症状", "确认症状", "查看结果", "智能问诊"])
         if step == "选择症状":
             st.subheader("第1步：选择您的症状")
             all_symptoms = set()
@@ -66,14 +57,14 @@ def main():
                 all_symptoms.update(disorder["symptom"])
             selected_symptoms = st.multiselect("选择症状：", list(all_symptoms))
             if st.button("保存症状"):
-                st.session_state["selected_symptoms"] = selected_symptoms
+                save_symptoms(st.session_state, get_index(knowledge_graph), selected_symptoms, key=GUIDE_KEY)
                 st.success("症状已保存，请前往下一步。")
 
         # 第二步：确认症状
         elif step == "确认症状":
             st.subheader("第2步：确认选择的症状")
-            if "selected_symptoms" in st.session_state:
-                st.write("您选择的症状：", st.session_state["selected_symptoms"])
+            if GUIDE_KEY in st.session_state:
+                st.write("您选择的症状：", load_symptoms(st.session_state, get_index(knowledge_graph), key=GUIDE_KEY))
                 if st.button("确认并继续"):
                     st.session_state["confirmed"] = True
                     st.success("症状确认成功！请前往下一步。")
@@ -84,16 +75,19 @@ def main():
         elif step == "查看结果":
             st.subheader("第3步：诊断结果")
             if "confirmed" in st.session_state and st.session_state["confirmed"]:
-                diagnoses = get_diagnosis(st.session_state["selected_symptoms"], knowledge_graph)
+                diagnoses = get_diagnosis(load_symptoms(st.session_state, get_index(knowledge_graph), key=GUIDE_KEY),
+                                          knowledge_graph)
                 if diagnoses:
-                    for diag in diagnoses:
-                        st.markdown(f"### {diag['疾病']}")
-                        st.markdown(f"**诊断标准：** {diag['诊断标准']}")
-                        st.markdown(f"**治疗建议：** {diag['治疗建议']}")
+                    show_diagnoses(diagnoses, knowledge_graph, key="guide")
                 else:
                     st.warning("未找到符合条件的疾病。")
             else:
                 st.warning("请先完成症状确认。")
+
+        # 智能问诊：逐个回答系统挑选的症状问题
+        elif step == "智能问诊":
+            st.subheader("智能问诊：请回答以下问题")
+            smart_question_module(knowledge_graph)
     elif choice == "症状选择":
         st.header("症状选择")
         st.markdown("请根据您的情况选择症状：")
@@ -110,42 +104,37 @@ def main():
         selected_symptoms = st.multiselect("选择症状", list(all_symptoms))
 
         if st.button("保存症状"):
-            st.session_state["symptoms"] = selected_symptoms
+            save_symptoms(st.session_state, get_index(knowledge_graph), selected_symptoms)
             st.success("症状已保存！")
     elif choice == "诊断结果":
         st.header("诊断结果")
-        if "symptoms" in st.session_state and st.session_state["symptoms"]:
-            selected_symptoms = st.session_state["symptoms"]
-            diagnoses = get_diagnosis(selected_symptoms, knowledge_graph)
+        # 会话中只保存症状编号，读取时还原为症状字符串
+        selected_symptoms = load_symptoms(st.session_state, get_index(knowledge_graph))
+        if selected_symptoms:
+            # 默认要求匹配全部症状，选了多个症状时可以放宽为至少匹配其中几个；
+            # 滑块停在全部症状时仍按“全部匹配”查询（位集合按位与），耗时不随症状数平方增长
+            min_match = None
+            if len(selected_symptoms) > 1:
+                min_match = st.slider("至少匹配的症状数：", 1, len(selected_symptoms), len(selected_symptoms))
+                if min_match == len(selected_symptoms):
+                    min_match = None
+            diagnoses = get_diagnosis(selected_symptoms, knowledge_graph, min_match=min_match)
 
             if diagnoses:
                 st.write("以下是根据您选择的症状生成的诊断结果：")
-                for diag in diagnoses:
-                    st.markdown(f"### {diag['疾病']}")
-                    st.markdown(f"**诊断标准：** {diag['诊断标准']}")
-                    st.markdown(f"**治疗建议：** {diag['治疗建议']}")
+                show_diagnoses(diagnoses, knowledge_graph, key="results")
 
-                # 数据可视化
+                # 数据可视化（图表按输入缓存为图片，相同输入不重复绘制）
                 st.write("#### 症状选择数量条形图")
-                fig, ax = plt.subplots()
-                ax.bar(["选择的症状"], [len(selected_symptoms)], color="skyblue")
-                ax.set_ylabel("数量")
-                ax.set_title("选择的症状数量")
-                st.pyplot(fig)
+                st.image(bar_chart(("选择的症状",), (len(selected_symptoms),), ("skyblue",),
+                                   title="选择的症状数量", ylabel="数量"), use_column_width=True)
 
                 # 症状选择占比饼图
                 st.write("#### 症状选择占比饼图")
-                total_symptoms = len({symptom for disorder in knowledge_graph for symptom in disorder["symptom"]})
-                fig, ax = plt.subplots()
-                ax.pie(
-                    [len(selected_symptoms), total_symptoms - len(selected_symptoms)],
-                    labels=["选择的症状", "未选择的症状"],
-                    autopct="%1.1f%%",
-                    colors=["lightcoral", "lightgrey"],
-                    startangle=90,
-                )
-                ax.set_title("症状选择占比")
-                st.pyplot(fig)
+                total_symptoms = len(get_index(knowledge_graph).symptoms)
+                st.image(pie_chart((len(selected_symptoms), total_symptoms - len(selected_symptoms)),
+                                   ("选择的症状", "未选择的症状"), ("lightcoral", "lightgrey"),
+                                   title="症状选择占比"), use_column_width=True)
             else:
                 st.warning("根据选择的症状，未能匹配到已知的疾病。")
         else:
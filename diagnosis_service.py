@@ -0,0 +1,303 @@
+# @File   : diagnosis_service.py
+# 脱离 Streamlit 的诊断 HTTP 服务（ASGI），与页面共用 graph_index 中的内存索引。
+# 运行方式：uvicorn diagnosis_service:app --host 0.0.0.0 --port 8000 --workers 4
+# 图谱文件默认为 sleep_konwledge_graph.json，可用环境变量 SLEEP_GRAPH_PATH 指定；文件更新后自动热加载，不需要重启。
+#
+# 接口：
+#   GET  /health                      服务状态与图谱版本
+#   POST /diagnose                    {"symptoms": [...], "mode": "any" | "all", "min_match": k（可选）,
+#                                      "category": [...]（可选，只在这些疾病类别的分区中诊断）}
+#   POST /diagnose/batch              {"requests": [{"symptoms": [...], "mode": "any"}, ...]}
+#   GET  /categories                  疾病类别及各类别的疾病数
+#   GET  /symptoms?q=关键字&limit=50   症状搜索
+#   POST /symptoms/match              {"phrases": [...], "k": 5} 近似匹配：每个短语最接近的 k 个标准症状
+#   GET  /disorders/{_id}             疾病详情，pages 为预渲染的详情页地址
+#   GET  /static/disorders/{哈希}.html  prerender.py 预渲染的疾病详情页（内容哈希命名，可长期缓存）
+#   GET  /related/{_id}?hops=2        相关疾病网络中 k 跳内的其他疾病
+#   GET  /lookup/{类别}?q=名称          反向索引：类别为 drug、check 或 cause
+import asyncio
+import json
+import os
+from urllib.parse import parse_qs, unquote
+
+from cache_backend import TieredCache, canonical_symptoms, shared_store
+from graph_index import diagnosis_record
+from graph_partition import get_router
+from graph_reload import current_index, get_reloader
+from prerender import PAGE_DIR, STATIC_DIR, page_path
+from related_graph import get_related_graph
+
+GRAPH_PATH = os.environ.get("SLEEP_GRAPH_PATH", "sleep_konwledge_graph.json")
+CACHE_SIZE = int(os.environ.get("SLEEP_CACHE_SIZE", "4096"))
+MAX_BATCH = 256  # 单次批量请求最多包含的诊断数
+
+
+# 响应缓存：缓存编码好的 JSON 字节，进程内按最近使用淘汰，配置了 SLEEP_REDIS_URL 时多个 worker/副本共享；
+# 键里带图谱版本，图谱更新后旧结果自然失效
+cache = TieredCache("service", maxsize=CACHE_SIZE, shared=shared_store(), dumps=bytes, loads=bytes)
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _diagnose_payload(index, symptoms, mode, min_match, categories=()):
+    if categories:
+        results = get_router(index.disorders).diagnose(symptoms, mode=mode, min_match=min_match, categories=categories)
+    else:
+        results = index.diagnose(symptoms, mode=mode, min_match=min_match)
+    payload = {"version": index.version, "mode": mode, "min_match": min_match, "symptoms": list(symptoms),
+               "count": len(results), "results": results}
+    if categories:
+        payload["category"] = list(categories)
+    return payload
+
+
+# 带缓存的诊断：返回编码后的 JSON 字节
+async def cached_diagnose(index, symptoms, mode, min_match=None, categories=()):
+    symptoms = canonical_symptoms(symptoms)
+    categories = tuple(sorted(set(categories)))
+    key = (index.version, "diagnose", mode, min_match, symptoms, categories)
+    body = cache.get(key)
+    if body is None:
+        body = _dumps(_diagnose_payload(index, symptoms, mode, min_match, categories))
+        cache.put(key, body)
+    return body
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _parse_request(payload):
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "请求体必须是 JSON 对象")
+    symptoms = payload.get("symptoms")
+    if not isinstance(symptoms, list):
+        raise HTTPError(400, "symptoms 必须是症状列表")
+    mode = payload.get("mode", "any")
+    if mode not in ("any", "all"):
+        raise HTTPError(400, "mode 只能是 any 或 all")
+    min_match = payload.get("min_match")
+    if min_match is not None and (not isinstance(min_match, int) or isinstance(min_match, bool)):
+        raise HTTPError(400, "min_match 必须是整数")
+    categories = payload.get("category") or []
+    if not isinstance(categories, list) or not all(isinstance(c, str) for c in categories):
+        raise HTTPError(400, "category 必须是类别列表")
+    return symptoms, mode, min_match, categories
+
+
+async def handle_health(index, query, payload):
+    reload = get_reloader(GRAPH_PATH).status()
+    return _dumps({"status": "ok", "version": index.version, "disorders": len(index),
+                   "symptoms": len(index.symptoms), "cache": cache.stats(),
+                   "reload": {"last_error": reload["last_error"], "history": reload["history"][-5:]}})
+
+
+async def handle_categories(index, query, payload):
+    return _dumps({"version": index.version, "categories": get_router(index.disorders).category_counts()})
+
+
+async def handle_diagnose(index, query, payload):
+    return await cached_diagnose(index, *_parse_request(payload))
+
+
+# 批量诊断：一次请求里带多组症状，逐个走缓存后拼成一个响应，减少往返次数
+async def handle_batch(index, query, payload):
+    requests = payload.get("requests") if isinstance(payload, dict) else None
+    if not isinstance(requests, list):
+        raise HTTPError(400, "requests 必须是列表")
+    if len(requests) > MAX_BATCH:
+        raise HTTPError(413, f"单次最多 {MAX_BATCH} 组症状")
+    parsed = [_parse_request(item) for item in requests]
+    bodies = await asyncio.gather(*(cached_diagnose(index, *item) for item in parsed))
+    # 每个结果已经是编码好的 JSON，直接拼接，不再重新序列化
+    return b'{"version": ' + _dumps(index.version) + b', "results": [' + b", ".join(bodies) + b"]}"
+
+
+async def handle_symptoms(index, query, payload):
+    keyword = query.get("q", [""])[0]
+    try:
+        limit = max(1, min(int(query.get("limit", ["50"])[0]), 1000))
+    except ValueError:
+        raise HTTPError(400, "limit 必须是整数")
+    key = (index.version, "symptoms", keyword, limit)
+    body = cache.get(key)
+    if body is None:
+        results = index.search_symptoms(keyword, limit=limit)
+        body = _dumps({"version": index.version, "count": len(results), "results": results})
+        cache.put(key, body)
+    return body
+
+
+# 症状近似匹配：一批短语一次打分
+async def handle_match(index, query, payload):
+    phrases = payload.get("phrases") if isinstance(payload, dict) else None
+    if not isinstance(phrases, list) or not all(isinstance(p, str) for p in phrases):
+        raise HTTPError(400, "phrases 必须是字符串列表")
+    if len(phrases) > MAX_BATCH:
+        raise HTTPError(413, f"单次最多 {MAX_BATCH} 个短语")
+    k = payload.get("k", 5)
+    if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+        raise HTTPError(400, "k 必须是正整数")
+    from fuzzy_match import get_matcher  # 按需导入：numpy 只在第一次近似匹配时加载
+    results = get_matcher(index.disorders).match(phrases, k=k) if phrases else []
+    return _dumps({"version": index.version, "results": [
+        {"phrase": phrase, "matches": [{"symptom": s, "score": score} for s, score in matches]}
+        for phrase, matches in zip(phrases, results)
+    ]})
+
+
+# 疾病详情：缓存的只有疾病记录部分；预渲染页面地址每次按当前清单查找，之后才运行 prerender 也能立即返回
+async def handle_disorder(index, disorder_id):
+    try:
+        disorder_id = int(disorder_id)
+    except ValueError:
+        raise HTTPError(400, "疾病 _id 必须是整数")
+    key = (index.version, "disorder", disorder_id)
+    results = cache.get(key)
+    if results is None:
+        disorders = index.get_disorders(disorder_id)
+        if not disorders:
+            raise HTTPError(404, "未找到该疾病")
+        results = _dumps(disorders)
+        cache.put(key, results)
+    pages = [page_path(index.disorders, row, PAGE_DIR) for row in index.rows_by_id[disorder_id]]
+    pages = ["/static/" + os.path.relpath(p, STATIC_DIR).replace(os.sep, "/") for p in pages if p]
+    return (b'{"version": ' + _dumps(index.version) + b', "results": ' + results
+            + b', "pages": ' + _dumps(pages) + b"}")
+
+
+STATIC_TYPES = {".html": b"text/html; charset=utf-8", ".json": b"application/json; charset=utf-8"}
+
+
+# 预渲染的静态文件：只允许读取 STATIC_DIR 下的文件；文件名带内容哈希的页面内容不会变化，允许长期缓存
+def read_static(relative_path):
+    root = os.path.abspath(STATIC_DIR)
+    path = os.path.abspath(os.path.join(root, relative_path))
+    content_type = STATIC_TYPES.get(os.path.splitext(path)[1])
+    if not path.startswith(root + os.sep) or content_type is None or not os.path.isfile(path):
+        raise HTTPError(404, "文件不存在")
+    with open(path, "rb") as f:
+        body = f.read()
+    cache_control = b"public, max-age=31536000, immutable" if path.endswith(".html") else b"no-cache"
+    return body, [(b"content-type", content_type), (b"cache-control", cache_control)]
+
+
+# 相关疾病：k 跳内可达的其他图谱疾病及距离
+async def handle_related(index, disorder_id, query):
+    try:
+        disorder_id = int(disorder_id)
+        hops = max(1, int(query.get("hops", ["2"])[0]))
+    except ValueError:
+        raise HTTPError(400, "疾病 _id 和 hops 必须是整数")
+    key = (index.version, "related", disorder_id, hops)
+    body = cache.get(key)
+    if body is None:
+        rows = index.rows_by_id.get(disorder_id)
+        if not rows:
+            raise HTTPError(404, "未找到该疾病")
+        related = get_related_graph(index.disorders)
+        results = [
+            {"name": related.labels[row], "related": [
+                {"id": index.disorders[other]["_id"], "name": related.labels[other], "hops": dist}
+                for other, dist in related.related_disorders(row, hops=hops)
+            ]}
+            for row in rows
+        ]
+        body = _dumps({"version": index.version, "hops": hops, "results": results})
+        cache.put(key, body)
+    return body
+
+
+# 反向索引：药物/检查/病因 -> 疾病
+async def handle_lookup(index, kind, query):
+    if kind not in index.reverse_ids:
+        raise HTTPError(404, "类别只能是 drug、check 或 cause")
+    term = query.get("q", [""])[0]
+    key = (index.version, "lookup", kind, term)
+    body = cache.get(key)
+    if body is None:
+        results = [diagnosis_record(index.disorders[row]) for row in index.lookup(kind, term)]
+        body = _dumps({"version": index.version, "kind": kind, "term": term, "count": len(results),
+                       "results": results})
+        cache.put(key, body)
+    return body
+
+
+ROUTES = {
+    ("GET", "/health"): handle_health,
+    ("POST", "/diagnose"): handle_diagnose,
+    ("POST", "/diagnose/batch"): handle_batch,
+    ("GET", "/categories"): handle_categories,
+    ("GET", "/symptoms"): handle_symptoms,
+    ("POST", "/symptoms/match"): handle_match,
+}
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send(send, status, body, headers=None):
+    headers = headers or [(b"content-type", b"application/json; charset=utf-8")]
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": headers + [(b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# ASGI 入口
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                get_reloader(GRAPH_PATH)  # 启动时预先加载图谱并开始检查文件更新
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"].rstrip("/") or "/"
+    try:
+        index = current_index(GRAPH_PATH)  # 一个请求只使用这一个版本
+        payload = None
+        if method == "POST":
+            raw = await _read_body(receive)
+            try:
+                payload = json.loads(raw or b"{}")
+            except ValueError:
+                raise HTTPError(400, "请求体不是合法的 JSON")
+        query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+
+        if method == "GET" and path.startswith("/static/"):
+            body, headers = read_static(unquote(path[len("/static/"):]))
+            await _send(send, 200, body, headers)
+            return
+        if method == "GET" and path.startswith("/disorders/"):
+            body = await handle_disorder(index, unquote(path[len("/disorders/"):]))
+        elif method == "GET" and path.startswith("/related/"):
+            body = await handle_related(index, unquote(path[len("/related/"):]), query)
+        elif method == "GET" and path.startswith("/lookup/"):
+            body = await handle_lookup(index, unquote(path[len("/lookup/"):]), query)
+        else:
+            handler = ROUTES.get((method, path))
+            if handler is None:
+                raise HTTPError(404, "接口不存在")
+            body = await handler(index, query, payload)
+        await _send(send, 200, body)
+    except HTTPError as e:
+        await _send(send, e.status, _dumps({"error": e.message}))
@@ -0,0 +1,171 @@
+# @File   : fulltext_search.py
+# 全文检索：对疾病描述、病因、治疗方式、健康教育和诊断建议建立倒排索引，按 BM25 排序。
+# 中文按相邻两个字（二元组）切分，英文和数字按整词切分；索引每个图谱版本只构建一次并保存到磁盘，
+# 进程重启后直接读取，不再重新切词。
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from graph_index import get_index
+
+# 参与检索的字段及页面上显示的名称
+SEARCH_FIELDS = {
+    "name": "疾病名称",
+    "desc": "疾病描述",
+    "cause": "病因",
+    "cure_way": "治疗方式",
+    "health_education": "健康教育",
+    "diag_suggestion": "诊断建议",
+}
+INDEX_DIR = os.environ.get("SLEEP_INDEX_DIR", ".cache")
+K1 = 1.5
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+# 切词：英文数字整词，中文连续片段切成二元组（单字片段保留单字）
+def tokenize(text):
+    tokens = []
+    for piece in _TOKEN.findall(str(text).lower()):
+        if piece[0] < "一":
+            tokens.append(piece)
+        elif len(piece) == 1:
+            tokens.append(piece)
+        else:
+            tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return tokens
+
+
+# 疾病某个字段的文本片段列表（列表字段每条一段）
+def field_segments(disorder, field):
+    value = disorder.get(field) or []
+    if isinstance(value, str):
+        value = [value]
+    return [str(item).replace("\n", "") for item in value if str(item).strip()]
+
+
+class FulltextIndex:
+    def __init__(self, index, data=None):
+        self.index = index
+        self.version = index.version
+        if data is None:
+            data = self._build(index.disorders)
+        self.postings = data["postings"]  # 词 -> [[疾病行号, 词频], ...]
+        self.doc_lengths = data["doc_lengths"]
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    @staticmethod
+    def _build(disorders):
+        postings = {}
+        doc_lengths = []
+        for row, disorder in enumerate(disorders):
+            tokens = []
+            for field in SEARCH_FIELDS:
+                for segment in field_segments(disorder, field):
+                    tokens.extend(tokenize(segment))
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append([row, tf])
+        return {"postings": postings, "doc_lengths": doc_lengths}
+
+    def to_dict(self):
+        return {"version": self.version, "postings": self.postings, "doc_lengths": self.doc_lengths}
+
+    # BM25 打分，返回 [(疾病行号, 分数), ...]，分数从高到低
+    def search(self, query, limit=20):
+        n = len(self.doc_lengths)
+        scores = {}
+        for term in set(tokenize(query)):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            idf = math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            for row, tf in entries:
+                norm = K1 * (1 - B + B * self.doc_lengths[row] / self.avg_length)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    # 为某个疾病生成摘要：取命中词最多的文本片段，截取命中位置附近的文字并加粗命中部分
+    def snippet(self, row, query, width=60):
+        terms = set(tokenize(query))
+        if not terms:
+            return "", ""
+        disorder = self.index.disorders[row]
+        best = (0, "", "")
+        for field, label in SEARCH_FIELDS.items():
+            for segment in field_segments(disorder, field):
+                hit = len(terms.intersection(tokenize(segment)))
+                if hit > best[0]:
+                    best = (hit, label, segment)
+        _, label, segment = best
+        if not segment:
+            return "", ""
+
+        # 先用查询中的完整关键词定位，找不到再用二元组
+        pattern = re.compile("|".join(re.escape(t) for t in sorted(
+            set(query.split()) | terms, key=len, reverse=True) if t), re.IGNORECASE)
+        match = pattern.search(segment)
+        start = max(0, match.start() - width // 3) if match else 0
+        text = segment[start:start + width]
+        text = pattern.sub(lambda m: f"**{m.group(0)}**", text).replace("****", "")
+        return label, ("…" if start > 0 else "") + text + ("…" if start + width < len(segment) else "")
+
+
+_lock = threading.Lock()
+_cache = {}  # 图谱版本 -> FulltextIndex
+
+
+def _index_path(version):
+    return os.path.join(INDEX_DIR, f"fulltext_{version}.json")
+
+
+# 获取图谱对应的全文索引：先查内存，再查磁盘，都没有才重新构建并保存
+def get_fulltext_index(knowledge_graph):
+    index = get_index(knowledge_graph)
+    fulltext = _cache.get(index.version)
+    if fulltext is not None:
+        return fulltext
+
+    path = _index_path(index.version)
+    data = None
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != index.version:
+                data = None
+        except (OSError, ValueError):
+            data = None
+    fulltext = FulltextIndex(index, data)
+    if data is None:
+        try:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(fulltext.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, path)  # 先写临时文件再替换，避免其他进程读到写了一半的索引
+        except OSError:
+            pass  # 目录不可写时只用内存中的索引
+
+    with _lock:
+        if len(_cache) > 4:
+            _cache.clear()
+        _cache[index.version] = fulltext
+    return fulltext
+
+
+# 检索入口：返回 [{"id", "疾病", "分数", "字段", "摘要"}, ...]
+def search_disorders(query, knowledge_graph, limit=20):
+    fulltext = get_fulltext_index(knowledge_graph)
+    results = []
+    for row, score in fulltext.search(query, limit=limit):
+        label, text = fulltext.snippet(row, query)
+        disorder = knowledge_graph[row]
+        results.append({"id": disorder["_id"], "疾病": disorder["name"], "分数": round(score, 3),
+                        "字段": label, "摘要": text})
+    return results
@@ -0,0 +1,134 @@
+# @File   : fuzzy_match.py
+# 症状的近似匹配：每个症状表示为字符 n-gram（1~3 个字）的 TF-IDF 向量，按行压缩（CSR）存成稀疏矩阵，
+# 再转置成“n-gram -> 症状”的倒排表作为最近邻索引。输入短语同样向量化后，只需累加它所含 n-gram 的倒排项
+# 就得到与所有症状的余弦相似度，错字、“患有”之类的前缀、词序颠倒的说法都能找到最接近的标准症状。
+# 完全离线，只依赖 numpy；一批短语一次 bincount 完成打分，结果保持稀疏，每个短语只在命中的症状中取前 k 个。
+import math
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from graph_index import get_index
+
+NGRAM_SIZES = (1, 2, 3)
+PREFIXES = ("患有", "出现", "经常", "总是", "有点", "有")  # 描述症状时常见的前缀，不参与匹配
+MATCH_THRESHOLD = 0.45  # 低于该相似度的结果不作为候选症状
+
+_SPACE = re.compile(r"[\s，,。.；;、！!？?]+")
+
+
+# 短语归一化：去掉空白和标点、英文转小写、去掉常见前缀
+def normalize_phrase(phrase):
+    phrase = _SPACE.sub("", str(phrase)).lower()
+    for prefix in PREFIXES:
+        if phrase.startswith(prefix) and len(phrase) > len(prefix) + 1:
+            return phrase[len(prefix):]
+    return phrase
+
+
+def char_ngrams(phrase):
+    return [phrase[i:i + n] for n in NGRAM_SIZES for i in range(len(phrase) - n + 1)]
+
+
+class FuzzyMatcher:
+    """
+    CSR 稀疏矩阵：第 i 个症状的非零项为 indices[indptr[i]:indptr[i + 1]]（n-gram 编号）和对应的 data（权重），
+    每行已做 L2 归一化。倒排表 gram_ptr / gram_rows / gram_weights 是同一矩阵按列压缩（CSC）的形式。
+    """
+
+    def __init__(self, index):
+        self.version = index.version
+        self.symptoms = index.symptoms
+        counts = [Counter(char_ngrams(normalize_phrase(s))) for s in self.symptoms]
+
+        # n-gram 词表和 IDF
+        df = Counter(gram for row in counts for gram in row)
+        self.grams = {gram: i for i, gram in enumerate(sorted(df))}
+        n = len(self.symptoms)
+        self.idf = np.array([math.log((1 + n) / (1 + df[gram])) + 1 for gram in sorted(df)])
+
+        # 构建 CSR：每行 TF（1 + log 词频）乘 IDF 后归一化
+        indptr, indices, data = [0], [], []
+        for row in counts:
+            cols = [self.grams[gram] for gram in row]
+            weights = np.array([1 + math.log(c) for c in row.values()]) * self.idf[cols] if cols else np.array([])
+            norm = np.linalg.norm(weights) or 1.0
+            indices.extend(cols)
+            data.extend(weights / norm)
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.data = np.array(data, dtype=np.float64)
+
+        # 转置为 CSC：按 n-gram 编号排序后得到每个 n-gram 的症状行号和权重
+        rows = np.repeat(np.arange(n), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        self.gram_rows = rows[order]
+        self.gram_weights = self.data[order]
+        self.gram_ptr = np.concatenate(([0], np.cumsum(np.bincount(self.indices, minlength=len(self.grams)))))
+
+    # 把短语转换为查询向量：[(n-gram 编号, 权重), ...]，词表外的 n-gram 忽略
+    def _vectorize(self, phrase):
+        counts = Counter(gram for gram in char_ngrams(normalize_phrase(phrase)) if gram in self.grams)
+        if not counts:
+            return [], np.array([])
+        cols = [self.grams[gram] for gram in counts]
+        weights = np.array([1 + math.log(c) for c in counts.values()]) * self.idf[cols]
+        return cols, weights / np.linalg.norm(weights)
+
+    # 一批短语与全部症状的余弦相似度，按行压缩的稀疏形式 (ptr, rows, scores)：
+    # 第 q 个短语与症状 rows[ptr[q]:ptr[q + 1]] 的相似度为 scores[ptr[q]:ptr[q + 1]]，其余症状为 0。
+    # 只保留共享 n-gram 的症状，不展开成短语数 × 症状数的矩阵，大批量和大词表时内存只随命中数增长
+    def similarity(self, phrases):
+        n = len(self.symptoms)
+        query_rows, targets, products = [], [], []
+        for q, phrase in enumerate(phrases):
+            for col, weight in zip(*self._vectorize(phrase)):
+                start, end = self.gram_ptr[col], self.gram_ptr[col + 1]
+                query_rows.append(np.full(end - start, q, dtype=np.int64))
+                targets.append(self.gram_rows[start:end])
+                products.append(self.gram_weights[start:end] * weight)
+        if not products:
+            return np.zeros(len(phrases) + 1, dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+        flat = np.concatenate(query_rows) * n + np.concatenate(targets)
+        keys, inverse = np.unique(flat, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(products), minlength=len(keys))
+        ptr = np.searchsorted(keys, np.arange(len(phrases) + 1) * n)
+        return ptr, keys % n, scores
+
+    # 每个短语最接近的 k 个症状：[[(症状, 相似度), ...], ...]，只保留不低于 threshold 的结果
+    def match(self, phrases, k=5, threshold=0.0):
+        ptr, rows, scores = self.similarity(phrases)
+        results = []
+        for q in range(len(phrases)):
+            row_ids, row_scores = rows[ptr[q]:ptr[q + 1]], scores[ptr[q]:ptr[q + 1]]
+            top = np.lexsort((row_ids, -row_scores))[:k]  # 相似度从高到低，相同时按症状编号
+            results.append([(self.symptoms[row_ids[i]], round(float(row_scores[i]), 4))
+                            for i in top if row_scores[i] > 0 and row_scores[i] >= threshold])
+        return results
+
+_lock = threading.Lock()
+_cache = {}  # 图谱版本 -> FuzzyMatcher
+
+
+def get_matcher(knowledge_graph):
+    index = get_index(knowledge_graph)
+    matcher = _cache.get(index.version)
+    if matcher is None:
+        matcher = FuzzyMatcher(index)
+        with _lock:
+            if len(_cache) > 4:
+                _cache.clear()
+            _cache[index.version] = matcher
+    return matcher
+
+
+# 从描述文字中找出可能指的症状：按标点切成分句，跳过已包含 known 中症状的分句，其余分句取最接近的症状
+def suggest_symptoms(text, knowledge_graph, known=(), threshold=MATCH_THRESHOLD):
+    clauses = [c for c in _SPACE.split(str(text)) if c and not any(s in c for s in known)]
+    if not clauses:
+        return []
+    matches = get_matcher(knowledge_graph).match(clauses, k=1, threshold=threshold)
+    return list(dict.fromkeys(best[0][0] for best in matches if best and best[0][0] not in known))
@@ -0,0 +1,88 @@
+# @File   : graph_analytics.py
+# 测试模块用的图谱分析：预先构建 疾病×症状 关联矩阵，覆盖率、症状区分度、疾病混淆度都用矩阵运算一次算完。
+# 每个图谱版本只构建一次。
+import threading
+
+import numpy as np
+
+from graph_index import get_index
+
+
+class GraphAnalytics:
+    def __init__(self, index):
+        self.index = index
+        self.version = index.version
+        n_disorders, n_symptoms = len(index.disorders), len(index.symptoms)
+
+        # 关联矩阵：matrix[疾病行号, 症状编号] = 1 表示该疾病含有该症状
+        self.matrix = np.zeros((n_disorders, n_symptoms), dtype=np.uint8)
+        for sid, rows in enumerate(index.postings):
+            self.matrix[rows, sid] = 1
+
+        # 每个症状命中的疾病数、每个疾病含有的症状数
+        self.symptom_hits = self.matrix.sum(axis=0, dtype=np.int64)
+        self.disorder_sizes = self.matrix.sum(axis=1, dtype=np.int64)
+
+        # 症状区分度：按“有/没有该症状”把全部疾病分成两组的二元熵（比特），越接近 1 区分能力越强
+        p = self.symptom_hits / n_disorders if n_disorders else np.zeros(n_symptoms)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            entropy = -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+        self.symptom_entropy = np.nan_to_num(entropy)
+
+        # 疾病两两之间共有的症状数，以及症状集合的 Jaccard 相似度（混淆度）
+        m = self.matrix.astype(np.int32)
+        self.shared = m @ m.T
+        union = self.disorder_sizes[:, None] + self.disorder_sizes[None, :] - self.shared
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.confusability = np.where(union > 0, self.shared / union, 0.0)
+
+    # 一组症状的诊断覆盖情况：至少含其中一个症状的疾病数和覆盖率
+    def coverage(self, symptoms):
+        sids = self.index.encode_symptoms(symptoms)
+        n_disorders = len(self.index.disorders)
+        if not sids or not n_disorders:
+            return 0, 0.0
+        matched = int(self.matrix[:, sids].any(axis=1).sum())
+        return matched, matched / n_disorders * 100
+
+    # 症状区分度表，默认按熵从高到低排序
+    def symptom_table(self, limit=None):
+        order = np.lexsort((self.symptom_hits, -self.symptom_entropy))
+        if limit is not None:
+            order = order[:limit]
+        return [
+            {"症状": self.index.symptoms[sid], "命中疾病数": int(self.symptom_hits[sid]),
+             "区分度(熵)": round(float(self.symptom_entropy[sid]), 3)}
+            for sid in order
+        ]
+
+    # 最容易混淆的疾病对（症状集合 Jaccard 相似度最高），只看上三角避免重复
+    def confusable_pairs(self, limit=10, min_similarity=0.0):
+        rows, cols = np.triu_indices(len(self.index.disorders), k=1)
+        scores = self.confusability[rows, cols]
+        keep = scores > min_similarity
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")[:limit]
+        disorders = self.index.disorders
+        return [
+            {"疾病A": disorders[rows[i]]["name"], "疾病B": disorders[cols[i]]["name"],
+             "共有症状数": int(self.shared[rows[i], cols[i]]), "混淆度": round(float(scores[i]), 3)}
+            for i in order
+        ]
+
+
+_lock = threading.Lock()
+_cache = {}  # 图谱版本 -> GraphAnalytics
+
+
+# 获取图谱对应的分析对象，同一版本只构建一次
+def get_analytics(knowledge_graph):
+    index = get_index(knowledge_graph)
+    analytics = _cache.get(index.version)
+    if analytics is None:
+        analytics = GraphAnalytics(index)
+        with _lock:
+            if len(_cache) > 4:
+                _cache.clear()
+            _cache[index.version] = analytics
+    return analytics
@@ -0,0 +1,352 @@
+# @File   : graph_index.py
+# 知识图谱的内存索引：图谱只加载、解析一次，诊断、症状搜索和疾病详情都走预先建好的索引，
+# 不依赖 streamlit，Streamlit 页面和 HTTP 服务共用同一份数据。
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# 反向索引：类别 -> 参与索引的字段
+REVERSE_FIELDS = {
+    "drug": ("recommand_drug", "drug_detail"),
+    "check": ("check",),
+    "cause": ("cause",),
+}
+MAX_TERM_LENGTH = 20  # 超过这个长度的条目一般是描述性句子，不作为索引词
+
+_PAREN = re.compile(r"[（(][^）)]*[）)]")
+
+
+# 计算图谱版本号（内容哈希），所有缓存都以它为键的一部分
+def graph_version(knowledge_graph):
+    raw = json.dumps(knowledge_graph, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+
+# 名称归一化：去掉括号中的缩写和空白，“莫达非尼（Modafinil）”和“莫达非尼”视为同一个词
+def normalize_name(name):
+    return re.sub(r"\s+", "", _PAREN.sub("", name))
+
+
+# 按顶层的顿号、逗号切分，括号内的顿号不切，“抗抑郁药（如咪达唑仑、米氮平）”保持完整
+def _split_top_level(text):
+    items, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch in "（(":
+            depth += 1
+        elif ch in "）)":
+            depth = max(0, depth - 1)
+        elif ch in "、，," and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return [item.strip().removeprefix("如").removesuffix("等").strip() for item in items if item.strip()]
+
+
+# 从药物、检查、病因条目中提取索引词。
+# “类别：A、B、C” 形式且冒号后都是短词时取 A、B、C；冒号后是说明文字时取冒号前的名称；
+# 没有冒号时按顿号切分，条目过长（描述性句子）则不建索引
+def extract_terms(text):
+    text = str(text).replace("\n", "").strip().rstrip("。.")
+    head, sep, tail = text.partition("：")
+    if sep:
+        items = _split_top_level(tail)
+        if items and "。" not in tail and "；" not in tail and all(len(item) <= MAX_TERM_LENGTH for item in items):
+            return items
+        return [head.strip()] if len(head.strip()) <= MAX_TERM_LENGTH else []
+    return [item for item in _split_top_level(text) if len(item) <= MAX_TERM_LENGTH]
+
+
+# 诊断结果的统一格式，与各页面中 get_diagnosis 返回的字典保持一致
+def diagnosis_record(disorder):
+    return {
+        "id": disorder["_id"],  # 获取疾病ID
+        "疾病": disorder["name"],  # 获取疾病名称
+        "疾病描述": disorder["desc"],  # 获取疾病描述
+        "诊断标准": disorder["diag_criteria"],  # 获取诊断标准
+        "治疗建议": disorder["cure_way"],  # 获取治疗建议
+    }
+
+
+# 一个疾病参与索引的内容：去重后的症状，以及每个反向索引类别的 [(归一化名称, 索引词), ...]（按条目顺序）。
+# 只取决于疾病记录本身，多版本存储按记录缓存，未改动的疾病在新版本中不再重新解析
+def index_entries(disorder, term_extractor=extract_terms):
+    reverse = {}
+    for kind, fields in REVERSE_FIELDS.items():
+        pairs = []
+        for field in fields:
+            for text in disorder.get(field) or []:
+                for term in term_extractor(text):
+                    key = normalize_name(term)
+                    if key:
+                        pairs.append((key, term))
+        reverse[kind] = pairs
+    return set(disorder["symptom"]), reverse
+
+
+# 两个版本逐行的这些字段是否都是同一个对象（多版本存储中内容相同的字段值是同一个对象）
+def _same_fields(rows, base_rows, fields):
+    return len(rows) == len(base_rows) and all(
+        row.get(field) is base_row.get(field) for row, base_row in zip(rows, base_rows) for field in fields)
+
+
+class GraphIndex:
+    """
+    一个图谱版本的只读索引。
+    疾病在内部用行号（0..n-1）表示，症状用 symptoms 列表中的下标表示；
+    注意 _id 在图谱中并不唯一（例如多个疾病的 _id 都是 22），所以不能直接拿 _id 当内部编号。
+    term_extractor 用于从药物/检查/病因条目中提取索引词，多个版本共用条目时可以传入带缓存的版本；
+    entries 为预先算好的逐行 index_entries 结果。base 为同一图谱的上一个版本：行数相同且各行的症状（或某类反向索引的字段）
+    都是同一个对象时，直接沿用它的症状词表、倒排表和位集合（或该类反向索引），只改了描述等字段的新版本不必重建。
+    """
+
+    def __init__(self, knowledge_graph, version=None, term_extractor=extract_terms, entries=None, base=None):
+        self.disorders = knowledge_graph
+        self.version = version or graph_version(knowledge_graph)
+        if entries is None:
+            entries = [index_entries(disorder, term_extractor) for disorder in knowledge_graph]
+
+        if base is not None and _same_fields(knowledge_graph, base.disorders, ("symptom",)):
+            self.symptoms, self.symptom_ids = base.symptoms, base.symptom_ids
+            self.row_symptoms, self.postings = base.row_symptoms, base.postings
+            self.all_bits, self.symptom_bits = base.all_bits, base.symptom_bits
+        else:
+            # 症状词表：症状 -> 症状编号
+            self.symptoms = sorted({s for symptoms, _ in entries for s in symptoms})
+            self.symptom_ids = {s: i for i, s in enumerate(self.symptoms)}
+
+            # 每个疾病含有的症状编号，以及倒排表：症状编号 -> 含该症状的疾病行号（升序）
+            self.row_symptoms = [sorted(self.symptom_ids[s] for s in symptoms) for symptoms, _ in entries]
+            self.postings = [[] for _ in self.symptoms]
+            for row, sids in enumerate(self.row_symptoms):
+                for sid in sids:
+                    self.postings[sid].append(row)
+
+            # 位集合：每个症状对应一个整数，第 row 位为 1 表示该疾病含有这个症状
+            self.all_bits = (1 << len(knowledge_graph)) - 1
+            self.symptom_bits = [self.bits_from_rows(rows) for rows in self.postings]
+
+        # _id -> 行号列表
+        self.rows_by_id = {}
+        for row, disorder in enumerate(knowledge_graph):
+            self.rows_by_id.setdefault(disorder["_id"], []).append(row)
+
+        # 反向索引（药物/检查/病因 -> 疾病），与症状一样用编号 + 位集合表示：
+        # reverse_terms[类别] 为索引词列表，reverse_ids[类别] 为 归一化名称 -> 编号，reverse_bits[类别] 为位集合
+        self.reverse_terms, self.reverse_ids, self.reverse_bits = {}, {}, {}
+        for kind, fields in REVERSE_FIELDS.items():
+            if base is not None and _same_fields(knowledge_graph, base.disorders, fields):
+                self.reverse_terms[kind] = base.reverse_terms[kind]
+                self.reverse_ids[kind] = base.reverse_ids[kind]
+                self.reverse_bits[kind] = base.reverse_bits[kind]
+                continue
+            terms, ids, rows_list = [], {}, []
+            for row, (_, reverse) in enumerate(entries):
+                for key, term in reverse[kind]:
+                    tid = ids.get(key)
+                    if tid is None:
+                        tid = ids[key] = len(terms)
+                        terms.append(term)
+                        rows_list.append(set())
+                    rows_list[tid].add(row)
+            self.reverse_terms[kind] = terms
+            self.reverse_ids[kind] = ids
+            self.reverse_bits[kind] = [self.bits_from_rows(rows) for rows in rows_list]
+
+    def __len__(self):
+        return len(self.disorders)
+
+    # 把症状字符串转成症状编号，不认识的症状直接忽略
+    def encode_symptoms(self, symptoms):
+        return [self.symptom_ids[s] for s in symptoms if s in self.symptom_ids]
+
+    # 疾病行号列表转换为位集合
+    def bits_from_rows(self, rows):
+        buffer = bytearray((len(self.disorders) + 7) // 8)
+        for row in rows:
+            buffer[row >> 3] |= 1 << (row & 7)
+        return int.from_bytes(buffer, "little")
+
+    # 位集合转换为疾病行号列表（升序）
+    @staticmethod
+    def rows_from_bits(bits):
+        return [row for row, bit in enumerate(reversed(bin(bits)[2:])) if bit == "1"]
+
+    # 至少匹配一个症状的疾病位集合：各症状位集合按位或
+    def bits_any(self, symptoms):
+        bits = 0
+        for sid in self.encode_symptoms(symptoms):
+            bits |= self.symptom_bits[sid]
+        return bits
+
+    # 匹配全部症状的疾病位集合：各症状位集合按位与，出现不认识的症状时没有疾病能全部匹配
+    def bits_all(self, symptoms):
+        symptoms = set(symptoms)
+        sids = set(self.encode_symptoms(symptoms))
+        if len(sids) < len(symptoms):
+            return 0
+        bits = self.all_bits
+        # 先与命中疾病最少的症状，结果为空时提前结束
+        for sid in sorted(sids, key=lambda i: len(self.postings[i])):
+            bits &= self.symptom_bits[sid]
+            if not bits:
+                break
+        return bits
+
+    # 至少匹配 k 个症状的疾病位集合。
+    # at_least[j] 表示“已处理的症状中至少含 j 个”的疾病，每处理一个症状从高到低更新一次，
+    # 总共 k × 症状数 次按位运算，与疾病数量无关。
+    def bits_at_least(self, symptoms, k):
+        sids = set(self.encode_symptoms(symptoms))
+        if k <= 0:
+            return self.all_bits
+        if k > len(sids):
+            return 0
+        at_least = [self.all_bits] + [0] * k
+        for sid in sids:
+            bits = self.symptom_bits[sid]
+            for j in range(k, 0, -1):
+                at_least[j] |= at_least[j - 1] & bits
+        return at_least[k]
+
+    # 至少匹配一个症状的疾病行号（按行号排序，与原来逐个遍历的顺序一致）
+    def match_any(self, symptoms):
+        return self.rows_from_bits(self.bits_any(symptoms))
+
+    # 匹配全部症状的疾病行号
+    def match_all(self, symptoms):
+        return self.rows_from_bits(self.bits_all(symptoms))
+
+    # 至少匹配 k 个症状的疾病行号
+    def match_at_least(self, symptoms, k):
+        return self.rows_from_bits(self.bits_at_least(symptoms, k))
+
+    # 根据症状获取诊断，mode 为 "any"（至少匹配一个）或 "all"（全部匹配）；
+    # 指定 min_match 时改为“至少匹配 min_match 个症状”
+    def diagnose(self, symptoms, mode="any", min_match=None):
+        if min_match is not None:
+            rows = self.match_at_least(symptoms, min_match)
+        elif mode == "all":
+            rows = self.match_all(symptoms)
+        else:
+            rows = self.match_any(symptoms)
+        return [diagnosis_record(self.disorders[row]) for row in rows]
+
+    # 按关键字搜索症状（子串匹配），返回症状及其关联的疾病数量
+    def search_symptoms(self, keyword="", limit=50):
+        keyword = keyword.strip()
+        result = []
+        for sid, symptom in enumerate(self.symptoms):
+            if keyword in symptom:
+                result.append({"symptom": symptom, "disorder_count": len(self.postings[sid])})
+                if len(result) >= limit:
+                    break
+        return result
+
+    # 反向查询：某个药物/检查/病因对应的疾病行号，名称按归一化后精确匹配
+    def lookup(self, kind, term):
+        tid = self.reverse_ids[kind].get(normalize_name(term))
+        return [] if tid is None else self.rows_from_bits(self.reverse_bits[kind][tid])
+
+    # 浏览反向索引：按关键字（子串）筛选索引词，返回索引词及关联的疾病数量，关联疾病多的排在前面
+    def browse_terms(self, kind, keyword="", limit=200):
+        keyword = normalize_name(keyword)
+        result = [
+            {"term": term, "disorder_count": self.reverse_bits[kind][tid].bit_count()}
+            for tid, term in enumerate(self.reverse_terms[kind])
+            if keyword in normalize_name(term)
+        ]
+        result.sort(key=lambda item: -item["disorder_count"])
+        return result[:limit]
+
+    # 按 _id 获取疾病详情（_id 可能重复，所以返回列表）
+    def get_disorders(self, disorder_id):
+        return [self.disorders[row] for row in self.rows_by_id.get(disorder_id, [])]
+
+
+_index_lock = threading.Lock()
+_file_cache = {}  # 文件绝对路径 -> (mtime_ns, size, GraphIndex)
+_object_cache = {}  # id(knowledge_graph) -> GraphIndex
+# 图谱版本 -> 症状词表。索引释放后仍保留最近几个版本的词表（只是症状字符串列表），
+# 图谱热更新后，会话中按旧版本保存的症状编号可以通过症状字符串换算到新版本
+_vocabularies = OrderedDict()
+MAX_VOCABULARIES = 16
+
+
+def _remember_vocabulary(index):
+    _vocabularies[index.version] = index.symptoms
+    _vocabularies.move_to_end(index.version)
+    while len(_vocabularies) > MAX_VOCABULARIES:
+        _vocabularies.popitem(last=False)
+
+
+# 某个图谱版本的症状词表（症状编号 -> 症状），不认识的版本返回 None
+def symptom_vocabulary(version):
+    return _vocabularies.get(version)
+
+
+# 把按旧版本症状编号保存的症状换算为当前索引的症状编号（升序元组），旧版本中有、新版本中已删除的症状被丢弃；
+# 旧版本的词表已不在内存中时返回 None
+def remap_symptom_ids(sids, old_version, index):
+    if old_version == index.version:
+        return tuple(sids)
+    vocabulary = symptom_vocabulary(old_version)
+    if vocabulary is None:
+        return None
+    return tuple(sorted(set(index.encode_symptoms(vocabulary[sid] for sid in sids))))
+
+
+# 加载图谱文件并建立索引；文件没有变化时直接返回同一个索引对象
+def load_index(file_path):
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    with _index_lock:
+        cached = _file_cache.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+    with open(path, "r", encoding="utf-8") as f:
+        knowledge_graph = json.load(f)
+    index = GraphIndex(knowledge_graph)
+    with _index_lock:
+        _file_cache[path] = (stat.st_mtime_ns, stat.st_size, index)
+        _object_cache[id(knowledge_graph)] = index
+        _remember_vocabulary(index)
+    return index
+
+
+# 登记一个在别处（例如热更新线程）建好的索引：之后 get_index 和 load_index 直接返回它
+def register_index(index, file_path=None, stat=None):
+    with _index_lock:
+        _object_cache[id(index.disorders)] = index
+        _remember_vocabulary(index)
+        if file_path is not None and stat is not None:
+            _file_cache[os.path.abspath(file_path)] = (stat.st_mtime_ns, stat.st_size, index)
+
+
+# 释放不再使用的索引，之后只要没有其他引用，旧版本的图谱和索引就会被回收
+def release_index(index):
+    with _index_lock:
+        if _object_cache.get(id(index.disorders)) is index:
+            del _object_cache[id(index.disorders)]
+        for path in [p for p, cached in _file_cache.items() if cached[2] is index]:
+            del _file_cache[path]
+
+
+# 获取某个已加载图谱对象对应的索引；对象不是通过 load_index 加载的就现建一个并缓存
+def get_index(knowledge_graph):
+    index = _object_cache.get(id(knowledge_graph))
+    # 索引持有图谱对象的引用，所以 id 不会被别的对象复用；这里再核对一次以防万一
+    if index is not None and index.disorders is knowledge_graph:
+        return index
+    index = GraphIndex(knowledge_graph)
+    with _index_lock:
+        # 只保留少量临时建立的索引，避免无限增长
+        if len(_object_cache) > 16:
+            _object_cache.clear()
+            for _, _, cached in _file_cache.values():
+                _object_cache[id(cached.disorders)] = cached
+        _object_cache[id(knowledge_graph)] = index
+        _remember_vocabulary(index)
+    return index
@@ -0,0 +1,260 @@
+# @File   : graph_partition.py
+# 按疾病类别（category）分区的图谱索引：每个类别一个分区，分区内单独建立症状索引（GraphIndex），
+# 路由器根据指定的类别或症状预筛选，只查询相关的分区，不再扫描全部疾病。
+# 多个类别的疾病同时属于这些分区；没有类别的疾病归入“未分类”分区，所以不限定类别时结果与整图索引完全相同。
+#
+# 分区可以拆成独立文件，每个工作进程只加载分配给它的分区，超大图谱不需要每个进程都持有全部数据：
+#   python graph_partition.py split sleep_konwledge_graph.json --out .cache/partitions
+#   python graph_partition.py query .cache/partitions 打鼾 日间嗜睡 --workers 2
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from graph_index import GraphIndex, diagnosis_record, get_index, load_index
+
+UNCATEGORIZED = "未分类"
+MANIFEST = "manifest.json"
+PARTITION_DIR = os.environ.get("SLEEP_PARTITION_DIR", os.path.join(".cache", "partitions"))
+
+
+# 疾病所属的类别（去重、保持原顺序），没有类别时为“未分类”
+def disorder_categories(disorder):
+    categories = [str(c).strip() for c in disorder.get("category") or [] if str(c).strip()]
+    return list(dict.fromkeys(categories)) or [UNCATEGORIZED]
+
+
+# 分区清单：类别 -> {"rows": 在整个图谱中的行号, "symptoms": 分区内出现的症状}，类别按名称排序
+def build_manifest(knowledge_graph, version=None):
+    partitions = {}
+    for row, disorder in enumerate(knowledge_graph):
+        for category in disorder_categories(disorder):
+            part = partitions.setdefault(category, {"rows": [], "symptoms": set()})
+            part["rows"].append(row)
+            part["symptoms"].update(disorder["symptom"])
+    return {
+        "version": version or get_index(knowledge_graph).version,
+        "disorders": len(knowledge_graph),
+        "partitions": {category: {"rows": part["rows"], "symptoms": sorted(part["symptoms"])}
+                       for category, part in sorted(partitions.items())},
+    }
+
+
+class Partition:
+    """一个类别的疾病及其索引；rows[i] 为分区内第 i 个疾病在整个图谱中的行号"""
+
+    def __init__(self, category, disorders, rows):
+        self.category = category
+        self.rows = list(rows)
+        self.index = GraphIndex(disorders)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # 分区内的诊断：{整个图谱中的行号: 疾病}
+    def match(self, symptoms, mode="any", min_match=None):
+        if min_match is not None:
+            local = self.index.match_at_least(symptoms, min_match)
+        elif mode == "all":
+            local = self.index.match_all(symptoms)
+        else:
+            local = self.index.match_any(symptoms)
+        return {self.rows[row]: self.index.disorders[row] for row in local}
+
+
+class PartitionRouter:
+    """
+    按清单路由查询。分区在第一次用到时才由 loader(category) 加载并建索引；
+    only 不为空时只服务这些类别（工作进程只持有自己的分区），其余分区不会被加载。
+    """
+
+    def __init__(self, manifest, loader, only=None):
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.loader = loader
+        self.categories = [c for c in manifest["partitions"] if only is None or c in only]
+        # 症状 -> 含有该症状的类别，用于没有指定类别时的预筛选
+        self.symptom_categories = {}
+        for category in self.categories:
+            for symptom in manifest["partitions"][category]["symptoms"]:
+                self.symptom_categories.setdefault(symptom, []).append(category)
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    # 各类别及其疾病数量
+    def category_counts(self):
+        return {c: len(self.manifest["partitions"][c]["rows"]) for c in self.categories}
+
+    def partition(self, category):
+        part = self._partitions.get(category)
+        if part is None:
+            part = Partition(category, self.loader(category), self.manifest["partitions"][category]["rows"])
+            with self._lock:
+                part = self._partitions.setdefault(category, part)
+        return part
+
+    def loaded(self):
+        return sorted(self._partitions)
+
+    # 需要查询的分区：先按指定的类别筛选，再按症状预筛选——分区内含有的所选症状数
+    # 至少为 1（"any"）、min_match 或全部症状（"all"），否则这个分区不可能有结果
+    def route(self, symptoms, categories=None, mode="any", min_match=None):
+        candidates = [c for c in self.categories if not categories or c in set(categories)]
+        symptoms = set(symptoms)
+        counts = {}
+        for symptom in symptoms:
+            for category in self.symptom_categories.get(symptom, ()):
+                counts[category] = counts.get(category, 0) + 1
+        if min_match is not None:
+            need = min_match
+        else:
+            need = len(symptoms) if mode == "all" else 1
+        return [c for c in candidates if counts.get(c, 0) >= need]
+
+    # 在路由到的分区中诊断，合并去重后按整个图谱中的行号排列（与整图索引的顺序一致）：{行号: 疾病}
+    def match(self, symptoms, mode="any", min_match=None, categories=None):
+        found = {}
+        for category in self.route(symptoms, categories, mode, min_match):
+            found.update(self.partition(category).match(symptoms, mode, min_match))
+        return dict(sorted(found.items()))
+
+    def match_rows(self, symptoms, mode="any", min_match=None, categories=None):
+        return list(self.match(symptoms, mode, min_match, categories))
+
+    # 与 GraphIndex.diagnose 相同格式的诊断结果
+    def diagnose(self, symptoms, mode="any", min_match=None, categories=None):
+        return [diagnosis_record(d) for d in self.match(symptoms, mode, min_match, categories).values()]
+
+
+_lock = threading.Lock()
+_cache = {}  # 图谱版本 -> 内存中的 PartitionRouter
+
+
+# 已加载图谱的分区路由：分区直接引用图谱中的疾病对象，不再复制数据
+def get_router(knowledge_graph):
+    index = get_index(knowledge_graph)
+    router = _cache.get(index.version)
+    if router is None:
+        manifest = build_manifest(knowledge_graph, index.version)
+        router = PartitionRouter(manifest, lambda c: [knowledge_graph[row] for row in manifest["partitions"][c]["rows"]])
+        with _lock:
+            if len(_cache) > 4:
+                _cache.clear()
+            _cache[index.version] = router
+    return router
+
+
+# 把图谱按类别拆成独立的分区文件，并写入清单
+def split_graph(graph_path, out_dir=PARTITION_DIR):
+    index = load_index(graph_path)
+    manifest = build_manifest(index.disorders, index.version)
+    os.makedirs(out_dir, exist_ok=True)
+    for number, part in enumerate(manifest["partitions"].values()):
+        part["file"] = f"partition_{number:04d}.json"  # 类别名可能含有不能用作文件名的字符，文件名只用编号
+        with open(os.path.join(out_dir, part["file"]), "w", encoding="utf-8") as f:
+            json.dump([index.disorders[row] for row in part["rows"]], f, ensure_ascii=False)
+    tmp_path = os.path.join(out_dir, f"{MANIFEST}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST))  # 分区文件都写完后再替换清单
+    return manifest
+
+
+# 从分区目录创建路由器，only 指定本进程负责的类别；分区文件在第一次查询时才读取
+def open_partitions(partition_dir=PARTITION_DIR, only=None):
+    with open(os.path.join(partition_dir, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    def loader(category):
+        with open(os.path.join(partition_dir, manifest["partitions"][category]["file"]), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    return PartitionRouter(manifest, loader, only)
+
+
+# 按疾病数把类别分给 workers 个进程，尽量均衡（从大到小依次放到当前最少的一组）
+def assign_partitions(manifest, workers):
+    groups = [[] for _ in range(max(1, workers))]
+    sizes = [0] * len(groups)
+    for category, part in sorted(manifest["partitions"].items(), key=lambda item: -len(item[1]["rows"])):
+        i = sizes.index(min(sizes))
+        groups[i].append(category)
+        sizes[i] += len(part["rows"])
+    return [group for group in groups if group]
+
+
+_worker_router = None  # 工作进程中的路由器，只持有分配给该进程的分区
+
+
+def _init_worker(partition_dir, categories):
+    global _worker_router
+    _worker_router = open_partitions(partition_dir, only=set(categories))
+    for category in _worker_router.categories:
+        _worker_router.partition(category)
+
+
+def _worker_diagnose(symptoms, mode, min_match, categories):
+    return [(row, diagnosis_record(d)) for row, d in _worker_router.match(symptoms, mode, min_match, categories).items()]
+
+
+class PartitionPool:
+    """
+    多进程分区服务：每个进程只加载一组分区。查询时只发给负责被路由到的分区的进程，
+    各进程的结果按行号合并去重。
+    """
+
+    def __init__(self, partition_dir=PARTITION_DIR, workers=2):
+        self.router = open_partitions(partition_dir)  # 只读清单用于路由，不加载分区
+        self.groups = assign_partitions(self.router.manifest, workers)
+        self.pools = [ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(partition_dir, group))
+                      for group in self.groups]
+
+    def diagnose(self, symptoms, mode="any", min_match=None, categories=None):
+        targets = set(self.router.route(symptoms, categories, mode, min_match))
+        futures = [pool.submit(_worker_diagnose, list(symptoms), mode, min_match,
+                               [c for c in group if c in targets])
+                   for pool, group in zip(self.pools, self.groups) if targets.intersection(group)]
+        merged = {}
+        for future in futures:
+            merged.update(future.result())
+        return [merged[row] for row in sorted(merged)]
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按疾病类别分区的图谱索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    split = sub.add_parser("split", help="把图谱拆成分区文件")
+    split.add_argument("graph", nargs="?", default="sleep_konwledge_graph.json")
+    split.add_argument("--out", default=PARTITION_DIR)
+    query = sub.add_parser("query", help="用多个进程查询分区")
+    query.add_argument("partition_dir", nargs="?", default=PARTITION_DIR)
+    query.add_argument("symptoms", nargs="+")
+    query.add_argument("--category", action="append", help="限定疾病类别，可重复指定")
+    query.add_argument("--mode", choices=("any", "all"), default="any")
+    query.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    if args.command == "split":
+        manifest = split_graph(args.graph, args.out)
+        for category, part in manifest["partitions"].items():
+            print(f"{category}：{len(part['rows'])} 个疾病，{len(part['symptoms'])} 个症状")
+        return
+
+    pool = PartitionPool(args.partition_dir, args.workers)
+    try:
+        for group in pool.groups:
+            print("进程分区：", "、".join(group))
+        print("路由到：", "、".join(pool.router.route(args.symptoms, args.category, args.mode)) or "无")
+        for record in pool.diagnose(args.symptoms, args.mode, categories=args.category):
+            print(record["id"], record["疾病"])
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# @File   : graph_reload.py
+# 知识图谱热更新：后台线程定期检查图谱文件，发现新版本后在后台读取、校验并预先建好所有派生索引，
+# 然后一次赋值切换当前版本。正在运行的页面重跑继续使用它拿到的旧图谱对象，之后的重跑拿到新版本；
+# 旧版本的索引过一段宽限时间再从各模块缓存中移除，没有其他引用后即被回收。不需要重启 Streamlit。
+# 文件写到一半时大小或修改时间还在变化，连续两次检查都没有变化才读取；解析或校验失败时继续使用当前版本。
+# 用户的数据跟着切换：会话中保存的症状和问诊回答在下次读取时按症状字符串换算到新版本，
+# 朴素贝叶斯模型的反馈计数在切换前按疾病名称迁移到新版本（MIGRATIONS）。
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+
+from graph_index import GraphIndex, register_index, release_index
+
+RELOAD_INTERVAL = float(os.environ.get("SLEEP_RELOAD_INTERVAL", "2"))  # 检查间隔秒数，0 表示不启动后台检查
+RELEASE_GRACE = float(os.environ.get("SLEEP_RELOAD_GRACE", "30"))  # 旧版本切换后保留的秒数，留给进行中的重跑
+REQUIRED_FIELDS = ("_id", "name", "desc", "symptom", "diag_criteria", "cure_way")  # 诊断结果用到的字段
+
+# 切换前在后台预先构建的派生索引：模块名:函数名，函数参数为图谱对象
+DERIVED_BUILDERS = (
+    "fulltext_search:get_fulltext_index",
+    "related_graph:get_related_graph",
+    "symptom_extractor:get_extractor",
+    "fuzzy_match:get_matcher",
+    "graph_partition:get_router",
+)
+# 切换前把旧版本的状态带到新版本：模块名:函数名，函数参数为 (旧图谱对象, 新图谱对象)
+MIGRATIONS = (
+    "naive_bayes:migrate_model",  # 用户反馈训练出的排序计数
+)
+# 以图谱版本为键的模块缓存：(模块名, 缓存变量名)，旧版本切换出去后从中移除
+VERSION_CACHES = (
+    ("fulltext_search", "_cache"),
+    ("related_graph", "_cache"),
+    ("symptom_extractor", "_cache"),
+    ("fuzzy_match", "_cache"),
+    ("graph_partition", "_cache"),
+    ("naive_bayes", "_cache"),
+    ("graph_analytics", "_cache"),
+    ("question_engine", "_incidence"),
+    ("prerender", "_manifests"),
+    ("prerender", "_pages"),
+)
+
+
+# 校验图谱结构：非空的疾病列表，每个疾病都有诊断结果需要的字段，症状为列表
+def validate_graph(knowledge_graph):
+    if not isinstance(knowledge_graph, list) or not knowledge_graph:
+        raise ValueError("图谱必须是非空的疾病列表")
+    for row, disorder in enumerate(knowledge_graph):
+        if not isinstance(disorder, dict):
+            raise ValueError(f"第 {row} 个疾病不是 JSON 对象")
+        missing = [field for field in REQUIRED_FIELDS if field not in disorder]
+        if missing:
+            raise ValueError(f"第 {row} 个疾病缺少字段：{'、'.join(missing)}")
+        if not isinstance(disorder["symptom"], list):
+            raise ValueError(f"第 {row} 个疾病的 symptom 不是列表")
+
+
+# 校验索引：每个疾病都能通过自己的全部症状被诊断出来
+def validate_index(index):
+    for row, disorder in enumerate(index.disorders):
+        if disorder["symptom"] and row not in index.match_all(disorder["symptom"]):
+            raise ValueError(f"索引校验失败：无法通过症状找到疾病 {disorder['name']}")
+
+
+# 依次执行 MIGRATIONS 中的迁移函数
+def run_migrations(old_graph, knowledge_graph, migrations=MIGRATIONS):
+    for migration in migrations:
+        module, _, func = migration.partition(":")
+        getattr(importlib.import_module(module), func)(old_graph, knowledge_graph)
+
+
+class GraphReloader:
+    """
+    一个图谱文件的当前版本。current 在切换时整体替换为新的 GraphIndex，读取它不需要加锁；
+    页面每次重跑开始时取一次 current，整个重跑过程都使用这一个版本。
+    """
+
+    def __init__(self, path, interval=RELOAD_INTERVAL, builders=DERIVED_BUILDERS, grace=RELEASE_GRACE,
+                 migrations=MIGRATIONS):
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self.builders = builders
+        self.migrations = migrations
+        self.grace = grace
+        self.current = None
+        self.history = deque(maxlen=20)  # 每次切换的记录
+        self.last_error = None
+        self._stat = None  # 当前版本对应的文件状态 (mtime_ns, size)
+        self._pending = None  # 上次检查到的新文件状态，再次检查没有变化才读取
+        self._retiring = []  # [(释放时间, 旧索引)]
+        self._retired = []  # 已释放旧索引的弱引用，用于确认它们已被回收
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return stat, (stat.st_mtime_ns, stat.st_size)
+
+    # 读取并校验图谱，建立索引；build_derived 为 True 时同时构建各派生索引，并把当前版本的状态迁移到新版本
+    def _build(self, build_derived):
+        with open(self.path, "r", encoding="utf-8") as f:
+            knowledge_graph = json.load(f)
+        validate_graph(knowledge_graph)
+        index = GraphIndex(knowledge_graph)
+        validate_index(index)
+        if build_derived:
+            register_index(index)  # 派生索引通过 get_index 取到这个索引，不再重复构建
+            try:
+                for builder in self.builders:
+                    module, _, func = builder.partition(":")
+                    getattr(importlib.import_module(module), func)(knowledge_graph)
+                if self.current is not None and index.version != self.current.version:
+                    run_migrations(self.current.disorders, knowledge_graph, self.migrations)
+            except Exception:
+                release_index(index)
+                raise
+        return index
+
+    # 首次加载：只建立基础索引，派生索引仍在第一次使用时构建，不拖慢冷启动
+    def load(self):
+        stat, key = self._file_stat()
+        index = self._build(build_derived=False)
+        self._swap(index, stat, key, build_seconds=0.0)
+        return index
+
+    # 检查文件是否有新版本，有则在当前线程中构建并切换；返回是否发生了切换
+    def check(self):
+        stat, key = self._file_stat()
+        if key == self._stat:
+            self._pending = None
+            return False
+        if key != self._pending:
+            self._pending = key  # 文件可能还在写入，下次检查没有变化再读取
+            return False
+        start = time.perf_counter()
+        try:
+            index = self._build(build_derived=True)
+        except Exception as e:  # 文件不完整、校验失败或派生索引构建失败都不切换
+            self.last_error = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {e}"
+            self._stat = key  # 这个文件状态已经处理过，等文件再次变化
+            return False
+        self.last_error = None
+        if self.current is not None and index.version == self.current.version:
+            self._stat = key  # 只是文件时间变了，内容相同
+            release_index(index)
+            return False
+        self._swap(index, stat, key, build_seconds=time.perf_counter() - start)
+        return True
+
+    # 原子切换：一次赋值替换当前版本，旧版本在宽限时间后释放
+    def _swap(self, index, stat, key, build_seconds):
+        start = time.perf_counter()
+        with self._lock:
+            old, self.current = self.current, index
+            self._stat, self._pending = key, None
+            if old is not None:
+                self._retiring.append((time.monotonic() + self.grace, old))
+        swap_seconds = time.perf_counter() - start
+        register_index(index, self.path, stat)
+        self.history.append({
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "version": index.version,
+            "previous": old.version if old is not None else None,
+            "disorders": len(index),
+            "build_ms": round(build_seconds * 1000, 1),
+            "swap_ms": round(swap_seconds * 1000, 4),
+        })
+
+    # 释放宽限时间已过的旧版本：从图谱索引缓存和各模块的版本缓存中移除
+    def release_retired(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            due = [old for deadline, old in self._retiring if force or deadline <= now]
+            self._retiring = [(deadline, old) for deadline, old in self._retiring if not (force or deadline <= now)]
+        for old in due:
+            if self.current is not None and old.version == self.current.version:
+                continue
+            release_index(old)
+            for module_name, attr in VERSION_CACHES:
+                module = sys.modules.get(module_name)
+                cache = getattr(module, attr, None) if module else None
+                if cache is not None:
+                    cache.pop(old.version, None)
+            self._retired.append(weakref.ref(old))
+        return len(due)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+                self.release_retired()
+            except Exception as e:  # 后台线程不能退出，记录错误后继续检查
+                self.last_error = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {e}"
+
+    # 启动后台检查线程（每个 GraphReloader 只启动一次）
+    def start(self):
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(target=self._watch, name="graph-reload", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        self._retired = [ref for ref in self._retired if ref() is not None]
+        return {
+            "path": self.path,
+            "file": os.path.basename(self.path),
+            "version": self.current.version if self.current is not None else None,
+            "watching": self._thread is not None and self._thread.is_alive(),
+            "retiring": len(self._retiring),
+            "retired_alive": len(self._retired),  # 已释放但仍被引用（例如进行中的重跑）的旧版本数
+            "last_error": self.last_error,
+            "history": list(self.history),
+        }
+
+
+_reloaders_lock = threading.Lock()
+_reloaders = {}  # 文件绝对路径 -> GraphReloader
+
+
+# 获取图谱文件的热更新器：第一次调用时同步加载图谱并启动后台检查
+def get_reloader(file_path, interval=RELOAD_INTERVAL):
+    path = os.path.abspath(file_path)
+    reloader = _reloaders.get(path)
+    if reloader is None:
+        with _reloaders_lock:
+            reloader = _reloaders.get(path)
+            if reloader is None:
+                reloader = GraphReloader(path, interval)
+                reloader.load()
+                reloader.start()
+                _reloaders[path] = reloader
+    return reloader
+
+
+# 当前版本的图谱索引
+def current_index(file_path):
+    return get_reloader(file_path).current
+
+
+# 本进程中所有图谱文件的热更新状态
+def reload_statuses():
+    return [reloader.status() for reloader in list(_reloaders.values())]
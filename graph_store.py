@@ -0,0 +1,267 @@
+# @File   : graph_store.py
+# 多版本图谱存储：同时提供多个图谱版本（例如 sleep_konwledge_graph.json 和 JSON_new.json 做 A/B 测试），
+# 各版本共用一张字符串驻留表，内容相同的字段值（症状列表、诊断标准、治疗建议等）和完全相同的疾病记录只保存一份。
+# 建立各版本的索引时，药物/检查/病因条目的索引词按驻留后的条目缓存，每个疾病参与索引的内容（去重后的症状、
+# 归一化后的反向索引词）按记录缓存，只有新版本中改动过的条目和疾病才重新解析。
+# 同一标签的图谱更新时以上一个版本为基础：行数不变且各行症状字段都是同一个对象时，直接沿用上一个版本的症状词表、
+# 倒排表和位集合，药物/检查/病因各类反向索引同理，只改了描述、诊断标准等字段的更新不重建这些结构。
+# 每个会话第一次访问时按会话 ID 固定分配到一个版本，之后一直使用这个版本，不会在两个版本之间来回切换。
+#
+# 限制：倒排表和位集合以行号为单位，增删疾病会让后面的行号错位，这时（以及不同标签的两个图谱之间）只复用逐个疾病的缓存，
+# 倒排表和位集合按缓存重新组装。派生索引（全文检索、相关疾病、症状抽取、模糊匹配、分区路由）仍按版本各自建立。
+# 每个版本额外占用的内存用 memory_report 测量：python graph_store.py A=sleep_konwledge_graph.json B=JSON_new.json
+#
+# 配置：SLEEP_AB_GRAPHS="A=sleep_konwledge_graph.json,B=JSON_new.json"（不配置时页面只使用各自的默认图谱）
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import threading
+import tracemalloc
+
+from graph_index import GraphIndex, extract_terms, graph_version, index_entries, register_index, release_index
+from graph_reload import DERIVED_BUILDERS, run_migrations
+
+PIN_KEY = "graph_label"  # 会话状态中固定的版本标签
+
+
+# 解析 A/B 配置：标签 -> 图谱文件，按标签排序
+def ab_graphs(config=None):
+    config = os.environ.get("SLEEP_AB_GRAPHS", "") if config is None else config
+    graphs = {}
+    for item in config.split(","):
+        label, sep, path = item.partition("=")
+        if sep and label.strip() and path.strip():
+            graphs[label.strip()] = path.strip()
+    return dict(sorted(graphs.items()))
+
+
+class GraphStore:
+    """
+    strings   字符串驻留表：同一个字符串在所有版本中只有一个对象
+    values    内容键 -> 共享的字段值（只读使用）；键由驻留后的元素组成，不再保存一份文本
+    records   规范化 JSON 的摘要 -> 共享的疾病记录
+    versions  标签 -> (文件状态, GraphIndex)
+    builds    标签 -> 最近一次加入该版本时的新记录数、新解析的条目数和沿用上一个版本的索引部分
+    _terms    驻留后的条目 -> 提取出的索引词，各版本共用
+    _entries  记录摘要 -> 该疾病的 index_entries，各版本共用
+    """
+
+    def __init__(self):
+        self.strings = {}
+        self.values = {}
+        self.records = {}
+        self.versions = {}
+        self.builds = {}
+        self._terms = {}
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def _intern(self, value):
+        if isinstance(value, str):
+            return self.strings.setdefault(value, value)
+        if isinstance(value, list):
+            value = [self._intern(item) for item in value]
+            key = ("list",) + tuple(_value_key(item) for item in value)
+        elif isinstance(value, dict):
+            value = {self._intern(k): self._intern(v) for k, v in value.items()}
+            key = ("dict",) + tuple(sorted((k, _value_key(v)) for k, v in value.items()))
+        else:
+            return value
+        return self.values.setdefault(key, value)
+
+    # 把一个疾病记录并入存储：完全相同的记录直接复用，否则各字段值分别复用；返回 (记录, 摘要, 是否为新记录)
+    def _add_record(self, disorder):
+        key = hashlib.sha1(json.dumps(disorder, ensure_ascii=False, sort_keys=True).encode("utf-8")).digest()
+        record = self.records.get(key)
+        if record is not None:
+            return record, key, False
+        record = {self._intern(field): self._intern(value) for field, value in disorder.items()}
+        self.records[key] = record
+        return record, key, True
+
+    # 带缓存的索引词提取：条目已驻留，相同条目在任何版本中都只解析一次
+    def _extract_terms(self, text):
+        terms = self._terms.get(text)
+        if terms is None:
+            terms = self._terms[text] = extract_terms(text)
+        return terms
+
+    # 带缓存的逐个疾病索引内容：相同记录在任何版本中都只计算一次
+    def _record_entries(self, key, record):
+        entries = self._entries.get(key)
+        if entries is None:
+            entries = self._entries[key] = index_entries(record, self._extract_terms)
+        return entries
+
+    # 加入或替换一个版本，返回它的索引
+    def add_version(self, label, knowledge_graph, stat=None):
+        with self._lock:
+            disorders, entries, new_records = [], [], 0
+            terms_before = len(self._terms)
+            for disorder in knowledge_graph:
+                record, key, is_new = self._add_record(disorder)
+                disorders.append(record)
+                entries.append(self._record_entries(key, record))
+                new_records += is_new
+            old = self.versions.get(label)
+            base = old[1] if old is not None else None
+            index = GraphIndex(disorders, graph_version(knowledge_graph), entries=entries, base=base)
+            self.builds[label] = {"new_records": new_records, "new_terms": len(self._terms) - terms_before,
+                                  "reused": _reused_parts(index, base)}
+            register_index(index)
+            if old is not None and old[1].version != index.version:
+                run_migrations(old[1].disorders, disorders)  # 同一标签的图谱更新时带过反馈计数
+            self.versions[label] = (stat, index)
+            if old is not None:
+                release_index(old[1])
+                self._prune()
+        return index
+
+    # 按文件加载版本；文件没有变化时直接返回已有的索引
+    def load(self, label, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self.versions.get(label)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with self._lock:
+            cached = self.versions.get(label)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            with open(path, "r", encoding="utf-8") as f:
+                knowledge_graph = json.load(f)
+            return self.add_version(label, knowledge_graph, key)
+
+    def get(self, label):
+        return self.versions[label][1]
+
+    # 替换版本后重建共享表，只保留仍被某个版本使用的记录、字段值、字符串和索引词
+    def _prune(self):
+        live = {id(record) for _, index in self.versions.values() for record in index.disorders}
+        self.records = {k: r for k, r in self.records.items() if id(r) in live}
+        used_values, used_strings = set(), set()
+
+        def visit(value):
+            if isinstance(value, str):
+                used_strings.add(value)
+            elif isinstance(value, list):
+                used_values.add(id(value))
+                for item in value:
+                    visit(item)
+            elif isinstance(value, dict):
+                used_values.add(id(value))
+                for key, item in value.items():
+                    used_strings.add(key)
+                    visit(item)
+
+        for record in self.records.values():
+            for field, value in record.items():
+                used_strings.add(field)
+                visit(value)
+        self.values = {k: v for k, v in self.values.items() if id(v) in used_values}
+        self.strings = {s: s for s in self.strings if s in used_strings}
+        self._terms = {t: terms for t, terms in self._terms.items() if t in used_strings}
+        self._entries = {k: entries for k, entries in self._entries.items() if k in self.records}
+
+    # 存储统计：各版本的疾病数和新增记录数，共享表大小，以及去重节省的字符串数
+    def stats(self):
+        with self._lock:
+            total_strings = 0
+            for _, index in self.versions.values():
+                for record in index.disorders:
+                    for value in record.values():
+                        total_strings += _count_strings(value)
+            return {
+                "versions": {label: {"version": index.version, "disorders": len(index), **self.builds[label]}
+                             for label, (_, index) in self.versions.items()},
+                "records": len(self.records),
+                "shared_values": len(self.values),
+                "strings": len(self.strings),
+                "string_references": total_strings,
+            }
+
+
+# 新索引沿用了上一个版本的哪些部分："symptom" 表示症状词表、倒排表和位集合，其余为反向索引的类别
+def _reused_parts(index, base):
+    if base is None:
+        return []
+    parts = ["symptom"] if index.postings is base.postings else []
+    return parts + [kind for kind, bits in index.reverse_bits.items() if bits is base.reverse_bits[kind]]
+
+
+# 已驻留字段值的内容键：字符串和数字直接作为键，容器用对象编号（相同内容的容器已经是同一个对象）
+def _value_key(value):
+    return ("obj", id(value)) if isinstance(value, (list, dict)) else value
+
+
+def _count_strings(value):
+    if isinstance(value, str):
+        return 1
+    if isinstance(value, list):
+        return sum(_count_strings(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_count_strings(item) for item in value.values())
+    return 0
+
+
+store = GraphStore()
+
+
+# 会话固定的版本：第一次访问时按会话 ID 的哈希分配（同一个会话 ID 总是分到同一版本），记在会话状态里
+def pin_version(state, session_id, graphs=None):
+    graphs = ab_graphs() if graphs is None else graphs
+    label = state.get(PIN_KEY)
+    if label not in graphs:
+        labels = list(graphs)
+        digest = hashlib.sha1(str(session_id).encode("utf-8")).digest()
+        label = labels[int.from_bytes(digest[:4], "little") % len(labels)]
+        state[PIN_KEY] = label
+    return label
+
+
+# 当前会话使用的图谱：返回 (版本标签, 图谱对象)
+def pinned_graph(state, session_id, graphs=None):
+    graphs = ab_graphs() if graphs is None else graphs
+    label = pin_version(state, session_id, graphs)
+    return label, store.load(label, graphs[label]).disorders
+
+
+# 测量各版本占用的内存：依次加入每个版本，记录共享存储和 GraphIndex 新增的内存，再逐个构建派生索引并记录各自的内存。
+# 用独立的 GraphStore，不影响页面使用的 store；模块先全部导入，导入本身占用的内存不计入。返回 {标签: {部分: 字节数}}
+def memory_report(graphs, builders=DERIVED_BUILDERS):
+    modules = [(importlib.import_module(module), func) for module, _, func in (b.partition(":") for b in builders)]
+    local = GraphStore()
+    report = {}
+    tracemalloc.start()
+    try:
+        for label, path in graphs.items():
+            before = tracemalloc.get_traced_memory()[0]
+            index = local.load(label, path)
+            sizes = {"store+index": tracemalloc.get_traced_memory()[0] - before}
+            for module, func in modules:
+                before = tracemalloc.get_traced_memory()[0]
+                getattr(module, func)(index.disorders)
+                sizes[f"{module.__name__}.{func}"] = tracemalloc.get_traced_memory()[0] - before
+            report[label] = sizes
+    finally:
+        tracemalloc.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量多版本图谱各版本占用的内存")
+    parser.add_argument("graphs", nargs="*", help="标签=图谱文件，默认读取 SLEEP_AB_GRAPHS")
+    args = parser.parse_args()
+    graphs = ab_graphs(",".join(args.graphs)) if args.graphs else ab_graphs()
+    if not graphs:
+        parser.error("请指定 标签=图谱文件，或设置 SLEEP_AB_GRAPHS")
+    for label, sizes in memory_report(graphs).items():
+        print(f"版本 {label}（{graphs[label]}）：合计 {sum(sizes.values()) / 1024:.0f} KB")
+        for part, size in sizes.items():
+            print(f"  {part}：{size / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# @File   : graph_view.py
+# 诊断结果页的知识图谱部分：Neo4j 关联子图（查询、缓存和 vis-network 可视化）以及本地构建的相关疾病网络面板，
+# 各页面脚本共用同一份实现。Neo4j 的连接参数由页面脚本通过 configure_neo4j 指定。
+import json
+
+import streamlit as st
+
+from cache_backend import cached_subgraph
+from related_graph import get_related_graph
+from result_view import partial_rerun
+
+_config = None  # (uri, username, password)，为 None 时读取 st.secrets["neo4j"]
+_driver = None
+
+
+# 指定 Neo4j 连接参数，不传参数时读取 .streamlit/secrets.toml 中的 [neo4j] uri、username、password。
+# 页面脚本每次重跑都会调用；参数不变时保留已有的驱动，改变时关闭旧驱动，下次查询重新连接
+def configure_neo4j(uri=None, username=None, password=None):
+    global _config, _driver
+    config = (uri, username, password) if uri else None
+    if config != _config:
+        if _driver is not None:
+            _driver.close()
+        _config, _driver = config, None
+
+
+# Neo4j 驱动在第一次查询图谱时才创建：打开首页、安全模块等不需要图谱的页面时不加载 neo4j，也不连接数据库
+def get_driver():
+    global _driver
+    if _driver is None:
+        from neo4j import GraphDatabase
+        if _config is None:
+            neo4j_secrets = st.secrets["neo4j"]
+            uri, username, password = neo4j_secrets["uri"], neo4j_secrets["username"], neo4j_secrets["password"]
+        else:
+            uri, username, password = _config
+        _driver = GraphDatabase.driver(uri, auth=(username, password))
+    return _driver
+
+
+GRAPH_QUERY = """
+MATCH (n)-[r]->(m)
+WHERE n.name IN $names
+RETURN elementId(n) AS source, n.name AS source_name, elementId(m) AS target, m.name AS target_name, type(r) AS type
+LIMIT $limit
+"""
+GRAPH_LIMIT = 500  # 子图最多返回的关系数，疾病很多时不会一次拉取过多数据
+GRAPH_FETCH_SIZE = 200  # 每批从服务器拉取的记录数
+
+
+# 从 Neo4j 获取知识图谱数据；同一查询和参数的结果在进程内和共享缓存中保留一段时间，多个副本不再重复查询
+def fetch_graph_data(query, **params):
+    return cached_subgraph(query, _run_graph_query, params)
+
+
+# 查询只返回页面需要的字段（元素 ID、名称、关系类型），不传输节点的其他属性；
+# 结果按批流式读取，节点用以 ID 为键的字典去重
+def _run_graph_query(query, params):
+    with get_driver().session(fetch_size=GRAPH_FETCH_SIZE) as session:
+        nodes = {}
+        edges = []
+        for source, source_name, target, target_name, rel_type in session.run(query, params):
+            nodes[source] = source_name
+            nodes[target] = target_name
+            edges.append((source, target, rel_type))
+        return list(nodes.items()), edges
+
+
+# 诊断结果中各疾病在 Neo4j 中的关联子图（诊断结果页和缓存预热共用），疾病名排序后作为参数，顺序不影响缓存命中
+def diagnosis_graph_data(diagnoses):
+    return fetch_graph_data(GRAPH_QUERY, names=sorted({diag['疾病'] for diag in diagnoses}), limit=GRAPH_LIMIT)
+
+
+# 构建 HTML 可视化
+def create_vis_html(nodes, edges):
+    graph_data = {
+        "nodes": [{"id": node[0], "label": node[1]} for node in nodes],
+        "edges": [{"from": edge[0], "to": edge[1], "label": edge[2]} for edge in edges],
+    }
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+      <script src="https://unpkg.com/vis-network/standalone/umd/vis-network.min.js"></script>
+    </head>
+    <body>
+    <div id="network" style="width: 100%; height: 600px;"></div>
+    <script>
+      var nodes = new vis.DataSet({json.dumps(graph_data['nodes'])});
+      var edges = new vis.DataSet({json.dumps(graph_data['edges'])});
+      var container = document.getElementById('network');
+      var data = {{ nodes: nodes, edges: edges }};
+      var options = {{
+        nodes: {{
+          shape: 'dot',
+          size: 15,
+          font: {{ size: 14, color: '#000' }},
+          borderWidth: 2
+        }},
+        edges: {{
+          width: 2,
+          font: {{ size: 12, align: 'middle' }},
+          arrows: {{ to: {{ enabled: true, scaleFactor: 0.5 }} }},
+          color: {{ color: '#848484', highlight: '#848484', hover: '#848484' }},
+          smooth: {{ type: 'dynamic' }}
+        }},
+        physics: {{
+          stabilization: false,
+          barnesHut: {{
+            gravitationalConstant: -8000,
+            centralGravity: 0.3,
+            springLength: 95,
+            springConstant: 0.04
+          }}
+        }}
+      }};
+      var network = new vis.Network(container, data, options);
+    </script>
+    </body>
+    </html>
+    """
+
+
+# 相关疾病网络面板：根据 related_diseases 在本地构建，多跳邻域和最短路径都有缓存。
+# 跳数和起点/终点的选择只重跑这个面板，不重新诊断，也不重建上面的 Neo4j 关联图
+@partial_rerun
+def related_graph_panel(knowledge_graph, rows):
+    st.subheader("相关疾病与共病路径")
+    related = get_related_graph(knowledge_graph)
+    hops = st.slider("关联跳数：", 1, 3, 1)
+    nodes, edges = related.subgraph(rows, hops=hops)
+    st.components.v1.html(create_vis_html(nodes, edges), height=600)
+
+    comorbid = {}
+    for row in rows:
+        for other, dist in related.related_disorders(row, hops=hops):
+            if other not in rows:
+                comorbid[other] = min(dist, comorbid.get(other, dist))
+    if comorbid:
+        st.markdown("**可能相关的其他疾病：** " + "、".join(
+            f"{related.labels[row]}（{dist} 跳）" for row, dist in sorted(comorbid.items(), key=lambda x: x[1])
+        ))
+
+    # 两个疾病之间的最短关联路径
+    col1, col2 = st.columns(2)
+    source = col1.selectbox("起点疾病：", rows, format_func=lambda row: related.labels[row])
+    target = col2.selectbox("终点疾病：", range(len(knowledge_graph)), format_func=lambda row: related.labels[row])
+    path = related.shortest_path(source, target)
+    if len(path) > 1:
+        st.markdown("**关联路径：** " + " → ".join(related.labels[node] for node in path))
+    elif source != target:
+        st.info("两个疾病之间在 4 跳内没有关联路径。")
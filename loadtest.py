@@ -0,0 +1,218 @@
+# @File   : loadtest.py
+# 并发压测：用 Streamlit 的无界面测试接口（streamlit.testing.v1.AppTest，需要 streamlit>=1.34，旧版本中 st.rerun 会使测试卡住）驱动页面脚本，
+# 不需要浏览器。每个模拟会话依次走 安全模块登录 -> 症状选择（随机挑选症状）-> 诊断结果 -> 反馈，
+# Neo4j 用本地图谱生成的假数据代替。统计每次页面重跑的 p50/p95/p99 延迟、吞吐量和内存增长。
+# 运行方式：python loadtest.py ai_diagnose.py --sessions 50 --concurrency 8
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+from graph_index import load_index
+
+USERNAME = "shuimianjibing"
+PASSWORD = "123456"
+# 各页面脚本使用的图谱文件
+GRAPH_FILES = {"ai_diagnose.py": "sleep_konwledge_graph.json", "diagnosis_apps.py": "JSON_new.json"}
+
+
+class _StubSession:
+    def __init__(self, index):
+        self.index = index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    # 只支持页面里的子图查询（参数 names、limit）：返回这些疾病到其症状的边，字段与 GRAPH_QUERY 的投影一致
+    def run(self, query, parameters=None, **kwargs):
+        parameters = dict(parameters or {}, **kwargs)
+        names = set(parameters.get("names", ()))
+        records = []
+        for row, disorder in enumerate(self.index.disorders):
+            if disorder["name"] not in names:
+                continue
+            for sid in self.index.row_symptoms[row]:
+                records.append((f"d{row}", disorder["name"], f"s{sid}", self.index.symptoms[sid], "症状"))
+        return records[:parameters.get("limit", len(records))]
+
+
+class _StubDriver:
+    def __init__(self, index):
+        self.index = index
+
+    def session(self, **kwargs):
+        return _StubSession(self.index)
+
+    def close(self):
+        pass
+
+
+# 用假的 neo4j 模块替换真实驱动，页面第一次查询图谱时拿到的就是本地假数据
+def install_neo4j_stub(graph_path):
+    index = load_index(graph_path)
+    module = types.ModuleType("neo4j")
+    module.GraphDatabase = types.SimpleNamespace(driver=lambda *args, **kwargs: _StubDriver(index))
+    sys.modules["neo4j"] = module
+    return index
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class LoadTest:
+    """
+    单个压测进程：依次运行分配给它的模拟会话。AppTest 的脚本运行上下文不是线程安全的，
+    同一进程中的多个 AppTest 不能同时运行，所以并发会话由多个进程承担，每个进程内部顺序执行。
+    """
+
+    def __init__(self, script, max_symptoms=4, seed=0, timeout=60):
+        self.script = script
+        self.max_symptoms = max_symptoms
+        self.seed = seed
+        self.timeout = timeout
+        self.latencies = []  # 每次重跑的耗时（秒）
+        self.errors = []
+
+    def _timed(self, element_or_app):
+        start = time.perf_counter()
+        at = element_or_app.run(timeout=self.timeout)
+        self.latencies.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        return at
+
+    # 在侧边栏导航中切换页面（ai_diagnose.py 是单选框，diagnosis_apps.py 是下拉框）
+    def _navigate(self, at, page):
+        for widget in list(at.sidebar.radio) + list(at.sidebar.selectbox):
+            if page in widget.options:
+                return self._timed(widget.set_value(page))
+        raise RuntimeError(f"找不到页面 {page}")
+
+    @staticmethod
+    def _button(at, label):
+        for button in at.button:
+            if button.label == label:
+                return button
+        raise RuntimeError(f"找不到按钮 {label}")
+
+    # 一个模拟会话：登录 -> 症状选择 -> 诊断结果 -> 反馈
+    def run_session(self, number):
+        from streamlit.testing.v1 import AppTest
+
+        rng = random.Random(self.seed * 100003 + number)
+        at = AppTest.from_file(self.script, default_timeout=self.timeout)
+        if self.script.endswith("diagnosis_apps.py"):
+            at.secrets["neo4j"] = {"uri": "neo4j://stub", "username": "neo4j", "password": "stub"}
+        at = self._timed(at)
+
+        at = self._navigate(at, "安全模块")
+        at.text_input[0].input(USERNAME)
+        at.text_input[1].input(PASSWORD)
+        at = self._timed(self._button(at, "登录").click())
+
+        at = self._navigate(at, "症状选择")
+        options = at.multiselect[0].options
+        picks = rng.sample(options, rng.randint(1, min(self.max_symptoms, len(options))))
+        at.multiselect[0].set_value(picks)
+        at = self._timed(self._button(at, "保存症状").click())
+
+        at = self._navigate(at, "诊断结果")
+        at = self._navigate(at, "反馈")
+        if at.radio and "满意" in at.radio[0].options:
+            at.radio[0].set_value(rng.choice(["满意", "不满意"]))  # 表单内的控件不触发重跑，提交时一起生效
+            at = self._timed(self._button(at, "提交反馈").click())
+        else:
+            at.text_area[0].input("压测反馈")
+            at = self._timed(self._button(at, "提交反馈").click())
+
+    def _safe_session(self, number):
+        try:
+            self.run_session(number)
+        except Exception as e:  # 记录失败原因，继续其他会话
+            self.errors.append(f"会话 {number}: {e}")
+
+    def run(self, numbers):
+        # 先跑一个会话完成图谱加载、索引构建和模块导入，再开始计时和统计内存
+        self._safe_session(-1)
+        self.latencies.clear()
+        self.errors.clear()
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for number in numbers:
+            self._safe_session(number)
+        elapsed = time.perf_counter() - start
+        memory_after, memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "latencies": self.latencies,
+            "errors": self.errors,
+            "seconds": elapsed,
+            "memory_growth": memory_after - memory_before,
+            "memory_peak": memory_peak - memory_before,
+        }
+
+
+# 压测进程入口：安装 Neo4j 替身后运行分配到的会话
+def _worker(script, numbers, max_symptoms, seed, timeout):
+    install_neo4j_stub(GRAPH_FILES.get(script, "sleep_konwledge_graph.json"))
+    return LoadTest(script, max_symptoms, seed, timeout).run(numbers)
+
+
+# 运行压测：sessions 个会话分给 concurrency 个进程同时执行，汇总延迟、吞吐量和内存
+def run_load(script, sessions=20, concurrency=4, max_symptoms=4, seed=0, timeout=60):
+    concurrency = max(1, min(concurrency, sessions))
+    chunks = [list(range(i, sessions, concurrency)) for i in range(concurrency)]
+    with ProcessPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(_worker, [script] * concurrency, chunks, [max_symptoms] * concurrency,
+                                [seed] * concurrency, [timeout] * concurrency))
+
+    latencies = [value for result in results for value in result["latencies"]]
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "reruns": len(latencies),
+        "errors": [error for result in results for error in result["errors"]],
+        "seconds": max(result["seconds"] for result in results),
+        # 各进程同时运行，总吞吐量为各进程吞吐量之和
+        "throughput": sum(len(r["latencies"]) / r["seconds"] for r in results if r["seconds"]),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "memory_growth_mb": max(result["memory_growth"] for result in results) / 2 ** 20,
+        "memory_peak_mb": max(result["memory_peak"] for result in results) / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit 页面并发压测")
+    parser.add_argument("script", nargs="?", default="ai_diagnose.py", help="页面脚本")
+    parser.add_argument("--sessions", type=int, default=20, help="模拟会话数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时运行的会话数（压测进程数）")
+    parser.add_argument("--max-symptoms", type=int, default=4, help="每个会话最多选择的症状数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--timeout", type=int, default=60, help="单次重跑的超时秒数")
+    args = parser.parse_args()
+
+    result = run_load(args.script, args.sessions, args.concurrency, args.max_symptoms, args.seed, args.timeout)
+    print(f"页面脚本：{args.script}，会话 {result['sessions']} 个，并发 {result['concurrency']}")
+    print(f"页面重跑 {result['reruns']} 次，用时 {result['seconds']:.2f} 秒，吞吐量 {result['throughput']:.1f} 次/秒")
+    print(f"重跑延迟 p50 {result['p50'] * 1000:.1f} ms，p95 {result['p95'] * 1000:.1f} ms，p99 {result['p99'] * 1000:.1f} ms")
+    print(f"单个压测进程内存增长最多 {result['memory_growth_mb']:.2f} MB，峰值 {result['memory_peak_mb']:.2f} MB")
+    for error in result["errors"][:10]:
+        print("失败：", error)
+    sys.exit(1 if result["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# @File   : naive_bayes.py
+# 朴素贝叶斯诊断排序：疾病先验和“疾病 -> 症状”似然都保存为稠密 NumPy 数组，由图谱初始化，
+# 再根据用户的“满意/不满意”反馈增量更新。对一组症状打分只需取出对应症状的对数似然行求和，
+# 一次向量运算就得到全部疾病的对数后验。模型按图谱版本保存到磁盘，进程重启后反馈不会丢失；
+# 多个进程共用同一个文件：保存时在锁文件保护下重新读取磁盘上的计数，只加上本进程自上次保存以来的增量，
+# 其他进程的反馈不会被覆盖，本进程同时拿到它们的反馈；
+# 图谱热更新时，旧版本模型中反馈带来的计数按疾病名称和症状字符串带到新版本（migrate_model）。
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from graph_index import get_index
+
+MODEL_DIR = os.environ.get("SLEEP_INDEX_DIR", ".cache")
+PRIOR_COUNT = 2.0  # 图谱中的每条 疾病-症状 关系相当于观察到的次数
+ALPHA = 0.1  # 平滑系数，图谱中没有的 疾病-症状 组合也保留很小的概率
+COUNT_KEYS = ("prior_counts", "trials", "symptom_counts")
+LOCK_TIMEOUT = 5.0  # 等待其他进程保存完成的最长秒数
+STALE_LOCK_SECONDS = 60  # 锁文件超过这个时间仍在，说明持有它的进程已经退出（一次保存只需几毫秒）
+
+
+class NaiveBayesModel:
+    """
+    prior_counts[d]       疾病 d 被确认（满意反馈）的次数，决定先验 P(d)
+    trials[d]             疾病 d 参与反馈的次数（满意和不满意都计入），是似然的分母
+    symptom_counts[s, d]  疾病 d 被确认时出现症状 s 的次数
+    P(s | d) = (symptom_counts[s, d] + ALPHA) / (trials[d] + 2 * ALPHA)
+    """
+
+    def __init__(self, index, data=None):
+        self.index = index
+        self.version = index.version
+        self._lock = threading.Lock()
+        if data is None:
+            data = initial_counts(index)
+        self.prior_counts = np.asarray(data["prior_counts"], dtype=np.float64)
+        self.trials = np.asarray(data["trials"], dtype=np.float64)
+        self.symptom_counts = np.asarray(data["symptom_counts"], dtype=np.float64)
+        self._saved = {key: getattr(self, key).copy() for key in COUNT_KEYS}  # 上次读取或保存时的计数
+        self._refresh()
+
+    # 重新计算对数先验和对数似然；rows 不为空时只更新这些疾病所在的列
+    def _refresh(self, rows=None):
+        self.log_prior = np.log(self.prior_counts / self.prior_counts.sum())
+        if rows is None:
+            self.log_likelihood = np.log((self.symptom_counts + ALPHA) / (self.trials + 2 * ALPHA))
+        else:
+            self.log_likelihood[:, rows] = np.log(
+                (self.symptom_counts[:, rows] + ALPHA) / (self.trials[rows] + 2 * ALPHA))
+
+    # 所有疾病的对数后验（未归一化）：log P(d) + sum(log P(s | d))
+    def log_scores(self, sids):
+        return self.log_prior + self.log_likelihood[sids].sum(axis=0)
+
+    # 归一化后的后验概率；rows 不为空时只在这些疾病之间归一化
+    def posterior(self, sids, rows=None):
+        scores = self.log_scores(sids)
+        if rows is not None:
+            scores = scores[rows]
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+
+    # 按后验概率从高到低排列疾病：[(疾病行号, 概率), ...]
+    def rank(self, symptoms, rows=None):
+        sids = self.index.encode_symptoms(symptoms)
+        rows = np.arange(len(self.index.disorders)) if rows is None else np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return []
+        probs = self.posterior(sids, rows)
+        order = np.argsort(-probs, kind="stable")
+        return [(int(rows[i]), float(probs[i])) for i in order]
+
+    # 根据一次反馈更新计数：每个候选疾病按其后验概率分得权重。
+    # 满意：这些疾病的先验、出现次数和对应症状计数增加；
+    # 不满意：只增加出现次数，使这些症状在这些疾病下的似然降低，先验不变
+    def update(self, symptoms, rows, satisfied, weight=1.0):
+        sids = self.index.encode_symptoms(symptoms)
+        rows = np.asarray(sorted(set(rows)), dtype=np.int64)
+        if len(rows) == 0 or not sids:
+            return
+        with self._lock:
+            share = weight * self.posterior(sids, rows)
+            self.trials[rows] += share
+            if satisfied:
+                self.prior_counts[rows] += share
+                self.symptom_counts[np.ix_(sids, rows)] += share
+            self._refresh(rows)
+
+    # 保存：在锁文件保护下重新读取磁盘上的计数，加上本进程自上次保存以来的增量后写回，
+    # 并把内存中的计数换成合并后的结果。拿不到锁时抛出 OSError，增量保留到下次保存
+    def save(self, path=None):
+        path = path or _model_path(self.version)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock, _file_lock(path):
+            saved = _read_counts(path, self.version) or self._saved
+            merged = {key: saved[key] + (getattr(self, key) - self._saved[key]) for key in COUNT_KEYS}
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, version=np.array(self.version), **merged)
+            os.replace(tmp_path, path)  # 先写临时文件再替换，避免其他进程读到写了一半的模型
+            for key in COUNT_KEYS:
+                setattr(self, key, merged[key])
+            self._saved = {key: value.copy() for key, value in merged.items()}
+            self._refresh()
+
+
+# 跨进程锁：用 O_EXCL 创建锁文件，被占用时等待；持有者异常退出留下的过期锁文件直接删除
+@contextmanager
+def _file_lock(path):
+    lock_path = f"{path}.lock"
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"等待模型文件锁超时：{lock_path}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+# 读取磁盘上保存的计数，文件不存在、损坏或版本不符时返回 None
+def _read_counts(path, version):
+    try:
+        with np.load(path) as saved:
+            if str(saved["version"]) == version:
+                return {key: saved[key] for key in COUNT_KEYS}
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+# 只由图谱初始化、没有任何反馈时的计数
+def initial_counts(index):
+    n, m = len(index.disorders), len(index.symptoms)
+    data = {"prior_counts": np.full(n, PRIOR_COUNT), "trials": np.full(n, PRIOR_COUNT),
+            "symptom_counts": np.zeros((m, n))}
+    for row, sids in enumerate(index.row_symptoms):
+        data["symptom_counts"][sids, row] = PRIOR_COUNT
+    return data
+
+
+# 把旧版本模型中由反馈增加的计数（减去旧图谱本身的初始计数）加到新版本的初始计数上。
+# 疾病按名称、症状按字符串对应；新版本中新增的疾病和症状从图谱初始值开始，已删除的丢弃
+def carry_over(old, index):
+    data = initial_counts(index)
+    base = initial_counts(old.index)
+    old_rows = {}
+    for row, disorder in enumerate(old.index.disorders):
+        old_rows.setdefault(disorder["name"], row)
+    pairs = [(row, old_rows[d["name"]]) for row, d in enumerate(index.disorders) if d["name"] in old_rows]
+    if not pairs:
+        return data
+    rows, prev_rows = (np.array(side, dtype=np.int64) for side in zip(*pairs))
+    data["prior_counts"][rows] += old.prior_counts[prev_rows] - base["prior_counts"][prev_rows]
+    data["trials"][rows] += old.trials[prev_rows] - base["trials"][prev_rows]
+    symptom_pairs = [(sid, old.index.symptom_ids[s]) for sid, s in enumerate(index.symptoms) if s in old.index.symptom_ids]
+    if symptom_pairs:
+        sids, prev_sids = (np.array(side, dtype=np.int64) for side in zip(*symptom_pairs))
+        delta = old.symptom_counts - base["symptom_counts"]
+        data["symptom_counts"][np.ix_(sids, rows)] += delta[np.ix_(prev_sids, prev_rows)]
+    return data
+
+
+def _model_path(version):
+    return os.path.join(MODEL_DIR, f"naive_bayes_{version}.npz")
+
+
+_cache_lock = threading.Lock()
+_cache = {}  # 图谱版本 -> NaiveBayesModel
+
+
+# 获取图谱对应的模型：先查内存，再读磁盘上保存的反馈计数，都没有时由图谱初始化
+def get_model(knowledge_graph):
+    index = get_index(knowledge_graph)
+    model = _cache.get(index.version)
+    if model is not None:
+        return model
+
+    model = NaiveBayesModel(index, _read_counts(_model_path(index.version), index.version))
+    with _cache_lock:
+        model = _cache.setdefault(index.version, model)
+    return model
+
+
+# 图谱更新时在切换前调用：新版本还没有保存的模型而旧版本有（内存中或磁盘上）时，
+# 把旧版本的反馈计数带到新版本并保存，返回新模型；不需要迁移时返回 None
+def migrate_model(old_graph, knowledge_graph):
+    index, old_index = get_index(knowledge_graph), get_index(old_graph)
+    if index.version == old_index.version or index.version in _cache or os.path.exists(_model_path(index.version)):
+        return None
+    if old_index.version not in _cache and not os.path.exists(_model_path(old_index.version)):
+        return None  # 旧版本没有任何反馈，新版本第一次使用时由图谱初始化
+    model = NaiveBayesModel(index, carry_over(get_model(old_graph), index))
+    try:
+        model.save()
+    except OSError:
+        pass  # 目录不可写时只保留内存中的模型
+    with _cache_lock:
+        return _cache.setdefault(index.version, model)
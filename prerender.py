@@ -0,0 +1,270 @@
+# @File   : prerender.py
+# 疾病详情页预渲染：为图谱中的每个疾病生成一个静态 HTML 页面（疾病描述、诊断标准、治疗建议，
+# 以及嵌入的、已经算好布局的关联子图：症状、检查、推荐药物和相关疾病），多进程并行生成。
+# 文件名为页面内容的哈希，内容不变的页面不会重写，浏览器和代理可以长期缓存；
+# 每个图谱版本写一份清单（疾病行号 -> 文件名，以及生成它的图谱文件）。页面和 HTTP 服务直接读取这些文件，查看疾病详情时不再做任何计算。
+# 多个图谱（例如 A/B 测试的两个版本）共用同一个输出目录，清理旧页面时只删除没有任何清单引用的页面。
+# 运行方式：python prerender.py sleep_konwledge_graph.json --out static/disorders --workers 4
+import argparse
+import glob
+import hashlib
+import html
+import json
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from graph_index import extract_terms, get_index, load_index, normalize_name
+from related_graph import get_related_graph
+
+STATIC_DIR = os.environ.get("SLEEP_STATIC_DIR", "static")
+PAGE_DIR = os.path.join(STATIC_DIR, "disorders")
+MAX_NODES_PER_KIND = 30  # 子图中每类节点最多显示的个数
+# 子图中的节点类别：关系名称、图谱字段、节点颜色
+NODE_KINDS = (
+    ("症状", ("symptom",), "#97c2fc"),
+    ("检查", ("check",), "#ffb570"),
+    ("推荐药物", ("recommand_drug",), "#7be191"),
+)
+RELATED_COLOR = "#eb7df4"
+CENTER_COLOR = "#fb7e81"
+
+
+# 单个疾病的关联子图：节点 [(编号, 名称, 颜色)]，边 [(起点, 终点, 关系)]，第一个节点是疾病本身
+def disorder_subgraph(index, related, row):
+    disorder = index.disorders[row]
+    nodes = [("d", disorder["name"], CENTER_COLOR)]
+    edges = []
+    for kind, fields, color in NODE_KINDS:
+        seen = set()
+        for field in fields:
+            for text in disorder.get(field) or []:
+                for term in ([text] if field == "symptom" else extract_terms(text)):
+                    key = normalize_name(term)
+                    if key and key not in seen and len(seen) < MAX_NODES_PER_KIND:
+                        seen.add(key)
+                        node_id = f"{kind}{len(seen)}"
+                        nodes.append((node_id, term, color))
+                        edges.append(("d", node_id, kind))
+    for count, other in enumerate(related.adjacency[row][:MAX_NODES_PER_KIND], 1):
+        node_id = f"r{count}"
+        nodes.append((node_id, related.labels[other], RELATED_COLOR))
+        edges.append(("d", node_id, related.edge_labels.get((min(row, other), max(row, other)), "相关疾病")))
+    return nodes, edges
+
+
+# 预先计算布局：疾病在中心，其余节点按类别分扇区排在外圈，相邻节点内外交错，避免标签重叠
+def layout(nodes, edges):
+    kinds = {}
+    for source, target, label in edges:
+        kinds.setdefault(label, []).append(target)
+    positions = {"d": (0, 0)}
+    total = sum(len(targets) for targets in kinds.values()) or 1
+    angle = 0.0
+    for targets in kinds.values():
+        span = 2 * math.pi * len(targets) / total
+        for i, node_id in enumerate(targets):
+            theta = angle + span * (i + 0.5) / len(targets)
+            radius = 260 + 90 * (i % 2)
+            positions[node_id] = (round(radius * math.cos(theta)), round(radius * math.sin(theta)))
+        angle += span
+    return positions
+
+
+def _format_items(items):
+    if isinstance(items, str):
+        items = [items]
+    lines = [f"<li>{html.escape(str(item).replace(chr(10), ''))}</li>" for item in items if str(item).strip()]
+    return f"<ul>{''.join(lines)}</ul>" if lines else "<ul><li>暂无</li></ul>"
+
+
+# 生成单个疾病的静态页面；子图的节点坐标已经算好，浏览器端关闭物理模拟，打开即是最终布局
+def render_page(index, related, row):
+    disorder = index.disorders[row]
+    nodes, edges = disorder_subgraph(index, related, row)
+    positions = layout(nodes, edges)
+    graph_nodes = [{"id": node_id, "label": label, "color": color, "x": positions[node_id][0],
+                    "y": positions[node_id][1], "size": 25 if node_id == "d" else 12}
+                   for node_id, label, color in nodes]
+    graph_edges = [{"from": source, "to": target, "label": label} for source, target, label in edges]
+    name = html.escape(disorder["name"])
+    return f"""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+  <meta charset="utf-8">
+  <title>{name}</title>
+  <script src="https://unpkg.com/vis-network/standalone/umd/vis-network.min.js"></script>
+  <style>body {{ font-family: sans-serif; margin: 16px; }} #network {{ width: 100%; height: 600px; border: 1px solid #ddd; }}</style>
+</head>
+<body>
+<h2>{name}</h2>
+<p><b>疾病描述：</b>{html.escape(str(disorder.get("desc", "")))}</p>
+<p><b>诊断标准：</b></p>
+{_format_items(disorder.get("diag_criteria", []))}
+<p><b>治疗建议：</b></p>
+{_format_items(disorder.get("cure_way", []))}
+<h3>关联知识图谱</h3>
+<div id="network"></div>
+<script>
+  var data = {{ nodes: new vis.DataSet({json.dumps(graph_nodes, ensure_ascii=False)}),
+               edges: new vis.DataSet({json.dumps(graph_edges, ensure_ascii=False)}) }};
+  var options = {{
+    physics: false,
+    nodes: {{ shape: 'dot', font: {{ size: 14, color: '#000' }}, borderWidth: 2 }},
+    edges: {{ width: 1, font: {{ size: 11, align: 'middle' }}, arrows: {{ to: {{ enabled: true, scaleFactor: 0.5 }} }},
+             color: {{ color: '#848484' }}, smooth: false }}
+  }};
+  new vis.Network(document.getElementById('network'), data, options);
+</script>
+</body>
+</html>
+"""
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def _manifest_path(version, out_dir):
+    return os.path.join(out_dir, f"manifest_{version}.json")
+
+
+# 工作进程入口：加载图谱，渲染分配到的疾病并写入文件，同名文件已存在（内容相同）时跳过
+def _render_chunk(graph_path, rows, out_dir):
+    index = load_index(graph_path)
+    related = get_related_graph(index.disorders)
+    entries = []
+    for row in rows:
+        page = render_page(index, related, row)
+        digest = content_hash(page)
+        file_name = f"{digest}.html"
+        path = os.path.join(out_dir, file_name)
+        written = not os.path.exists(path)
+        if written:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(page)
+            os.replace(tmp_path, path)
+        disorder = index.disorders[row]
+        entries.append({"row": row, "id": disorder["_id"], "name": disorder["name"], "file": file_name,
+                        "written": written})
+    return entries
+
+
+# 清理输出目录：先删除过期的清单——生成它的图谱文件已不存在，或者该文件现在的版本与清单不同；
+# 再删除没有任何清单引用的页面。其他图谱的当前清单和页面不受影响。返回 (删除的页面数, 删除的清单数)
+def prune_pages(out_dir=PAGE_DIR):
+    keep, stale = set(), []
+    for path in glob.glob(os.path.join(out_dir, "manifest_*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        graph_path = manifest.get("graph")
+        if graph_path is not None:
+            try:
+                current = load_index(graph_path).version
+            except (OSError, ValueError):
+                current = None
+            if current != manifest["version"]:
+                stale.append(path)
+                continue
+        keep.update(manifest.get("pages", {}).values())
+    for path in stale:
+        os.remove(path)
+    removed = 0
+    for file_name in os.listdir(out_dir):
+        if file_name.endswith(".html") and file_name not in keep:
+            os.remove(os.path.join(out_dir, file_name))
+            removed += 1
+    return removed, len(stale)
+
+
+# 并行生成全部疾病的页面并写入清单；prune 为 True 时再清理过期的清单和不再被引用的页面
+def build_pages(graph_path, out_dir=PAGE_DIR, workers=4, prune=False):
+    index = load_index(graph_path)
+    os.makedirs(out_dir, exist_ok=True)
+    rows = list(range(len(index)))
+    workers = max(1, min(workers, len(rows)))
+    if workers == 1:
+        entries = _render_chunk(graph_path, rows, out_dir)
+    else:
+        chunks = [rows[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(_render_chunk, [graph_path] * workers, chunks, [out_dir] * workers)
+            entries = sorted((entry for part in parts for entry in part), key=lambda entry: entry["row"])
+
+    manifest = {"version": index.version, "graph": os.path.abspath(graph_path),
+                "pages": {str(e["row"]): e["file"] for e in entries}}
+    path = _manifest_path(index.version, out_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)  # 页面都写完后再替换清单
+
+    removed, removed_manifests = prune_pages(out_dir) if prune else (0, 0)
+    return {"version": index.version, "pages": len(entries), "written": sum(e["written"] for e in entries),
+            "removed": removed, "removed_manifests": removed_manifests}
+
+
+_lock = threading.Lock()
+# 两个缓存都以图谱版本为键，旧版本由 graph_reload 切换后移除
+_manifests = {}  # 图谱版本 -> {目录: 清单中的 pages}
+_pages = {}  # 图谱版本 -> {行号: 页面 HTML}
+
+
+# 某个图谱版本的预渲染清单：疾病行号（字符串）-> 文件名；还没有生成清单时为空（不缓存，生成后即可使用）
+def load_manifest(version, out_dir=PAGE_DIR):
+    pages = _manifests.get(version, {}).get(out_dir)
+    if pages is None:
+        try:
+            with open(_manifest_path(version, out_dir), "r", encoding="utf-8") as f:
+                pages = json.load(f).get("pages", {})
+        except (OSError, ValueError):
+            return {}
+        with _lock:
+            _manifests.setdefault(version, {})[out_dir] = pages
+    return pages
+
+
+# 疾病详情页的文件路径，没有预渲染时为 None
+def page_path(knowledge_graph, row, out_dir=PAGE_DIR):
+    file_name = load_manifest(get_index(knowledge_graph).version, out_dir).get(str(row))
+    path = os.path.join(out_dir, file_name) if file_name else None
+    return path if path and os.path.exists(path) else None
+
+
+# 疾病详情页 HTML：优先读取预渲染的文件，没有时现场渲染；结果按图谱版本缓存在内存中
+def page_html(knowledge_graph, row, out_dir=PAGE_DIR):
+    index = get_index(knowledge_graph)
+    page = _pages.get(index.version, {}).get(row)
+    if page is None:
+        path = page_path(knowledge_graph, row, out_dir)
+        if path is not None:
+            with open(path, "r", encoding="utf-8") as f:
+                page = f.read()
+        else:
+            page = render_page(index, get_related_graph(knowledge_graph), row)
+        with _lock:
+            if index.version not in _pages and len(_pages) > 4:
+                _pages.clear()
+            _pages.setdefault(index.version, {})[row] = page
+    return page
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预渲染疾病详情页")
+    parser.add_argument("graph", nargs="?", default="sleep_konwledge_graph.json")
+    parser.add_argument("--out", default=PAGE_DIR, help="输出目录")
+    parser.add_argument("--workers", type=int, default=4, help="渲染进程数")
+    parser.add_argument("--prune", action="store_true", help="删除过期的清单和不再被任何清单引用的旧页面")
+    args = parser.parse_args()
+    result = build_pages(args.graph, args.out, args.workers, args.prune)
+    print(f"图谱版本 {result['version']}：{result['pages']} 个页面，新写入 {result['written']} 个，"
+          f"删除旧页面 {result['removed']} 个、过期清单 {result['removed_manifests']} 个，输出目录 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# @File   : question_engine.py
+# 智能问诊：根据已确认/已排除的症状维护候选疾病集合（位集合），
+# 每一步选出最能把剩余候选疾病一分为二的症状来提问（信息增益最大），几轮即可收敛。
+# 问诊状态是一个普通字典，可直接放进 st.session_state；每次回答只做一次位与运算更新候选集合，
+# 不需要重新执行 get_diagnosis。
+from collections import OrderedDict
+
+import numpy as np
+
+from graph_index import symptom_vocabulary
+
+# 问题选择结果的缓存：（图谱版本, 候选集合, 已问症状）-> 下一个问题。
+# 回答路径相同的用户得到的状态完全一样，常见路径上的问题只需算一次。
+_QUESTION_CACHE_SIZE = 4096
+_question_cache = OrderedDict()
+_incidence = {}  # 图谱版本 -> (每条 疾病-症状 关联的疾病行号数组, 症状编号数组)
+
+
+# 疾病-症状关联展开成两个平行数组，统计候选疾病中各症状出现次数时用 bincount 一次完成
+def _incidence_arrays(index):
+    arrays = _incidence.get(index.version)
+    if arrays is None:
+        rows = np.repeat(np.arange(len(index.row_symptoms)), [len(sids) for sids in index.row_symptoms])
+        sids = np.fromiter((sid for row_sids in index.row_symptoms for sid in row_sids), dtype=np.int64,
+                           count=len(rows))
+        arrays = _incidence[index.version] = (rows, sids)
+    return arrays
+
+
+# 候选位集合转换为布尔数组
+def _candidate_mask(index, candidates):
+    n = len(index.disorders)
+    raw = np.frombuffer(candidates.to_bytes((n + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder="little", count=n).astype(bool)
+
+
+# 新建问诊状态，confirmed 为一开始就确认的症状
+def new_state(index, confirmed=()):
+    state = {"version": index.version, "candidates": index.all_bits, "asked": [], "confirmed": [], "denied": []}
+    for symptom in confirmed:
+        sid = index.symptom_ids.get(symptom)
+        if sid is not None:
+            answer(index, state, sid, True)
+    return state
+
+
+# 记录一次回答：has_symptom 为 True（有）、False（没有）或 None（不确定，只记为已问过）
+def answer(index, state, sid, has_symptom):
+    if sid in state["asked"]:
+        return state
+    state["asked"].append(sid)
+    if has_symptom is True:
+        state["confirmed"].append(sid)
+        state["candidates"] &= index.symptom_bits[sid]
+    elif has_symptom is False:
+        state["denied"].append(sid)
+        state["candidates"] &= ~index.symptom_bits[sid]
+    return state
+
+
+# 图谱热更新后把问诊状态换算到新版本：按症状字符串依次重放已有的回答，新版本中已删除的症状跳过；
+# 旧版本的词表已不在内存中时返回 None
+def migrate_state(index, state):
+    vocabulary = symptom_vocabulary(state["version"])
+    if vocabulary is None:
+        return None
+    migrated = new_state(index)
+    confirmed, denied = set(state["confirmed"]), set(state["denied"])
+    for sid in state["asked"]:
+        new_sid = index.symptom_ids.get(vocabulary[sid])
+        if new_sid is not None:
+            answer(index, migrated, new_sid, True if sid in confirmed else False if sid in denied else None)
+    return migrated
+
+
+# 计算下一个要问的症状编号；候选只剩一个或没有能区分候选的症状时返回 None。
+# 把 total 个候选分成 hit 和 total - hit 两组的信息增益（二元熵）随 min(hit, total - hit) 单调增加，
+# 所以直接取这个值最大的症状，相同时取编号小的，保证结果确定。
+def next_question(index, state):
+    candidates = state["candidates"]
+    total = candidates.bit_count()
+    if total <= 1:
+        return None
+
+    key = (index.version, candidates, tuple(sorted(state["asked"])))
+    if key in _question_cache:
+        _question_cache.move_to_end(key)
+        return _question_cache[key]
+
+    # 统计每个症状在剩余候选疾病中出现的次数
+    rows, sids = _incidence_arrays(index)
+    hits = np.bincount(sids[_candidate_mask(index, candidates)[rows]], minlength=len(index.symptoms))
+    score = np.minimum(hits, total - hits)
+    score[state["asked"]] = 0
+    best = int(np.argmax(score))  # 分数相同时 argmax 取编号最小的
+    best = best if score[best] > 0 else None
+
+    _question_cache[key] = best
+    if len(_question_cache) > _QUESTION_CACHE_SIZE:
+        _question_cache.popitem(last=False)
+    return best
+
+
+# 剩余候选疾病的行号
+def candidate_rows(index, state):
+    return index.rows_from_bits(state["candidates"])
@@ -0,0 +1,48 @@
+# @File   : question_view.py
+# 智能问诊页面：问题的选择和候选集合的更新在 question_engine.py 中，这里只负责展示和收集回答，
+# 各页面脚本共用同一份实现。问诊状态保存在 st.session_state["question_state"]。
+import streamlit as st
+
+from graph_index import get_index, diagnosis_record
+from result_view import show_diagnoses
+from session_store import GUIDE_KEY, load_symptoms
+
+
+# 智能问诊：每次只问一个最能区分剩余候选疾病的症状，回答后用位运算增量更新候选集合
+def smart_question_module(knowledge_graph):
+    # 按需导入：numpy 只在进入智能问诊时加载
+    from question_engine import new_state, answer, next_question, candidate_rows, migrate_state
+    index = get_index(knowledge_graph)
+    state = st.session_state.get("question_state")
+    if state is None or state["version"] != index.version:
+        # 图谱更新后保留已有的回答，换算到新版本
+        state = (migrate_state(index, state) if state is not None else None) or new_state(index)
+        st.session_state["question_state"] = state
+
+    col1, col2 = st.columns(2)
+    if col1.button("重新开始问诊"):
+        state = st.session_state["question_state"] = new_state(index)
+    guided = load_symptoms(st.session_state, index, key=GUIDE_KEY)  # 逐步引导模式中保存的症状
+    if guided and col2.button("从已选症状开始"):
+        state = st.session_state["question_state"] = new_state(index, guided)
+
+    rows = candidate_rows(index, state)
+    st.markdown(f"- **已回答问题数：** {len(state['asked'])}")
+    st.markdown(f"- **已确认症状：** {'、'.join(index.symptoms[sid] for sid in state['confirmed']) or '无'}")
+    st.markdown(f"- **剩余候选疾病数：** {len(rows)}")
+
+    sid = next_question(index, state)
+    if sid is not None:
+        st.subheader(f"您是否有“{index.symptoms[sid]}”的症状？")
+        col1, col2, col3 = st.columns(3)
+        # 用回调处理回答，页面重跑时直接显示下一个问题
+        col1.button("有", on_click=answer, args=(index, state, sid, True))
+        col2.button("没有", on_click=answer, args=(index, state, sid, False))
+        col3.button("不确定", on_click=answer, args=(index, state, sid, None))
+        with st.expander("当前候选疾病"):
+            st.markdown("\n".join(f"- {index.disorders[row]['name']}" for row in rows))
+    elif rows:
+        st.success("问诊完成，以下是可能的疾病：")
+        show_diagnoses([diagnosis_record(index.disorders[row]) for row in rows], knowledge_graph, key="question")
+    else:
+        st.warning("未找到符合条件的疾病。")
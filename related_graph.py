@@ -0,0 +1,143 @@
+# @File   : related_graph.py
+# 相关疾病网络：把每个疾病的 related_diseases 解析成“疾病 - 相关疾病”边，建成内存中的整数邻接表，
+# 多跳邻域和最短路径用 BFS 计算并按图谱版本缓存，查看共病关系时不需要再向 Neo4j 发可变长度查询。
+import re
+import threading
+from collections import deque
+
+from graph_index import get_index, normalize_name
+
+MAX_HOPS = 4  # 邻域和最短路径最多搜索的跳数
+
+
+# 解析一条 related_diseases 文本，返回 [(类别, 疾病名), ...]
+# 例如 "心血管疾病：卒中（中风）、心力衰竭" -> [("心血管疾病", "卒中（中风）"), ("心血管疾病", "心力衰竭")]
+def parse_related(text):
+    pairs = []
+    for clause in re.split(r"[；;]", text):
+        clause = clause.strip().rstrip("。")
+        if not clause:
+            continue
+        category = "相关疾病"
+        if "：" in clause:
+            category, clause = clause.split("：", 1)
+        for name in re.split(r"[、，,]", clause):
+            name = name.strip()
+            if name.startswith("如"):
+                name = name[1:]
+            if name:
+                pairs.append((category.strip(), name))
+    return pairs
+
+
+class RelatedGraph:
+    """
+    节点编号：0..n-1 是图谱中的疾病（与 GraphIndex 的行号一致），n 之后是只出现在 related_diseases 中的疾病。
+    邻接表按无向图存储：adjacency[node] 为相邻节点列表，edge_labels[(a, b)] 为边的类别（a < b）。
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.version = index.version
+        self.labels = [disorder["name"] for disorder in index.disorders]
+
+        node_ids = {}
+        for row, name in enumerate(self.labels):
+            node_ids.setdefault(normalize_name(name), row)
+
+        self.adjacency = [[] for _ in self.labels]
+        self.edge_labels = {}
+        for row, disorder in enumerate(index.disorders):
+            for text in disorder.get("related_diseases", []):
+                for category, name in parse_related(text):
+                    key = normalize_name(name)
+                    node = node_ids.get(key)
+                    if node is None:
+                        node = node_ids[key] = len(self.labels)
+                        self.labels.append(name)
+                        self.adjacency.append([])
+                    self._add_edge(row, node, category)
+        self._bfs_cache = {}
+        self._lock = threading.Lock()
+
+    def _add_edge(self, a, b, label):
+        if a == b:
+            return
+        key = (min(a, b), max(a, b))
+        if key in self.edge_labels:
+            return
+        self.edge_labels[key] = label
+        self.adjacency[a].append(b)
+        self.adjacency[b].append(a)
+
+    def is_disorder(self, node):
+        return node < len(self.index.disorders)
+
+    # 从某个节点出发的 BFS（最多 MAX_HOPS 跳），返回 {节点: (距离, 前驱节点)}，每个起点只算一次
+    def _bfs(self, source):
+        result = self._bfs_cache.get(source)
+        if result is not None:
+            return result
+        result = {source: (0, None)}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            dist = result[node][0]
+            if dist == MAX_HOPS:
+                continue
+            for neighbor in self.adjacency[node]:
+                if neighbor not in result:
+                    result[neighbor] = (dist + 1, node)
+                    queue.append(neighbor)
+        with self._lock:
+            self._bfs_cache[source] = result
+        return result
+
+    # k 跳邻域：[(节点, 距离), ...]，按距离排序，不含起点
+    def neighborhood(self, node, hops=2):
+        hops = min(hops, MAX_HOPS)
+        reached = self._bfs(node)
+        return sorted(((n, d) for n, (d, _) in reached.items() if 0 < d <= hops), key=lambda item: (item[1], item[0]))
+
+    # k 跳内可达的其他图谱疾病（共病候选）：[(疾病行号, 距离), ...]
+    def related_disorders(self, row, hops=2):
+        return [(n, d) for n, d in self.neighborhood(row, hops) if self.is_disorder(n)]
+
+    # 两个节点之间的最短路径（节点列表），超过 MAX_HOPS 或不连通时返回 []
+    def shortest_path(self, source, target):
+        reached = self._bfs(source)
+        if target not in reached:
+            return []
+        path = [target]
+        while path[-1] != source:
+            path.append(reached[path[-1]][1])
+        return path[::-1]
+
+    # 若干疾病的 k 跳子图，格式与 fetch_graph_data 返回的 (nodes, edges) 相同，可直接交给 create_vis_html
+    def subgraph(self, rows, hops=1):
+        keep = set(rows)
+        for row in rows:
+            keep.update(n for n, _ in self.neighborhood(row, hops))
+        nodes = [(node, self.labels[node]) for node in sorted(keep)]
+        edges = [
+            (a, b, self.edge_labels[(a, b)])
+            for a in sorted(keep) for b in self.adjacency[a] if a < b and b in keep
+        ]
+        return nodes, edges
+
+
+_cache_lock = threading.Lock()
+_cache = {}  # 图谱版本 -> RelatedGraph
+
+
+# 获取图谱对应的相关疾病网络，同一版本只构建一次
+def get_related_graph(knowledge_graph):
+    index = get_index(knowledge_graph)
+    graph = _cache.get(index.version)
+    if graph is None:
+        graph = RelatedGraph(index)
+        with _cache_lock:
+            if len(_cache) > 4:
+                _cache.clear()
+            _cache[index.version] = graph
+    return graph
@@ -0,0 +1,115 @@
+# @File   : result_view.py
+# 诊断结果的展示：每个疾病的 Markdown 片段按（图谱版本, _id, 疾病名）缓存，只生成一次；
+# 一页的结果拼成一个 st.markdown 一次性发送，结果较多时分页，减少发往浏览器的消息数。
+# 诊断结果之后的反馈表单也在这里，各页面脚本共用。
+import threading
+
+import streamlit as st
+
+from graph_index import get_index
+from session_store import load_symptoms, session_diagnosis_rows
+
+PAGE_SIZE = 10  # 每页显示的疾病数
+
+# 局部重跑：被装饰的函数里的控件交互只重跑这个函数，不重跑整个页面脚本（不重新加载图谱、诊断和生成其他面板）。
+# streamlit 1.37 起为 st.fragment，1.33~1.36 为 st.experimental_fragment，更早的版本退化为普通函数（整页重跑）
+partial_rerun = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+_lock = threading.Lock()
+_fragments = {}  # (图谱版本, _id, 疾病名) -> Markdown 片段
+MAX_FRAGMENTS = 4096  # A/B 测试和热更新时会同时有多个图谱版本的片段，超过这个数时整体清空
+
+
+# 把列表字段格式化成 Markdown 列表；原始数据中有 PDF 换行残留，去掉条目内的换行
+def _format_items(items):
+    if isinstance(items, str):
+        items = [items]
+    lines = [f"- {str(item).replace(chr(10), '')}" for item in items if str(item).strip()]
+    return "\n".join(lines) if lines else "- 暂无"
+
+
+# 生成单个疾病的 Markdown 片段（不含标题）
+def _build_fragment(diag):
+    parts = []
+    if "疾病描述" in diag:
+        parts.append(f"**疾病描述：** {diag['疾病描述']}")
+    parts.append(f"**诊断标准：**\n\n{_format_items(diag['诊断标准'])}")
+    parts.append(f"**治疗建议：**\n\n{_format_items(diag['治疗建议'])}")
+    return "\n\n".join(parts)
+
+
+# 获取单个疾病的 Markdown 片段（带缓存，不含标题）
+def disorder_fragment(diag, version):
+    key = (version, diag.get("id"), diag["疾病"])
+    fragment = _fragments.get(key)
+    if fragment is None:
+        fragment = _build_fragment(diag)
+        with _lock:
+            if len(_fragments) >= MAX_FRAGMENTS:
+                _fragments.clear()
+            _fragments[key] = fragment
+    return fragment
+
+
+# 疾病详情页：直接显示 prerender.py 预渲染的静态页面（描述、诊断标准、治疗建议和已排好布局的关联子图），
+# 没有预渲染时现场生成一次并缓存；选择其他疾病只重跑这个面板
+@partial_rerun
+def disorder_page_panel(knowledge_graph, rows, key):
+    from prerender import page_html  # 按需导入
+    if not rows:
+        return
+    row = st.selectbox("查看疾病详情页：", rows, format_func=lambda r: knowledge_graph[r]["name"], key=f"{key}_page_detail")
+    st.components.v1.html(page_html(knowledge_graph, row), height=1100, scrolling=True)
+
+
+# 展示诊断结果列表：分页，每页只发送一个 Markdown 块（expanders=True 时每个疾病一个折叠面板）
+# page_size 为 None 时不分页，用于按钮触发、翻页会导致结果消失的场景；翻页只重跑结果列表
+@partial_rerun
+def show_diagnoses(diagnoses, knowledge_graph, key, expanders=False, page_size=PAGE_SIZE):
+    version = get_index(knowledge_graph).version
+    page_size = page_size or max(len(diagnoses), 1)
+    pages = (len(diagnoses) + page_size - 1) // page_size
+    page = 1
+    if pages > 1:
+        page = st.selectbox(f"共 {len(diagnoses)} 个结果，选择页码：", range(1, pages + 1), key=f"{key}_page")
+    shown = diagnoses[(page - 1) * page_size: page * page_size]
+
+    if expanders:
+        for diag in shown:
+            with st.expander(diag["疾病"]):
+                st.markdown(disorder_fragment(diag, version))
+    else:
+        st.markdown("\n\n---\n\n".join(
+            f"### {diag['疾病']}\n\n{disorder_fragment(diag, version)}" for diag in shown
+        ))
+
+
+# 反馈表单：填写意见、选择满意度都不会触发重跑，点击提交后也只重跑这个表单。
+# 满意/不满意反馈用于更新朴素贝叶斯模型中各候选疾病的先验和症状似然，同一次诊断只计一次
+@partial_rerun
+def feedback_form(knowledge_graph):
+    with st.form("feedback_form"):
+        feedback = st.text_area("请留下您的宝贵意见：", "")
+        step = st.radio("您对本次诊断满意吗？", [" ", "不确定", "满意", "不满意"])
+        submitted = st.form_submit_button("提交反馈")
+    if not submitted:
+        return
+    if step not in ("满意", "不满意"):
+        st.success("感谢您的反馈！")
+        return
+
+    index = get_index(knowledge_graph)
+    selected_symptoms = load_symptoms(st.session_state, index)
+    feedback_key = (index.version, tuple(selected_symptoms))
+    if st.session_state.get("feedback_recorded") == feedback_key:
+        st.info("本次诊断的反馈已经提交过了。")
+        return
+    from naive_bayes import get_model
+    model = get_model(knowledge_graph)
+    model.update(selected_symptoms, session_diagnosis_rows(st.session_state, index), satisfied=step == "满意")
+    try:
+        model.save()
+    except OSError:
+        pass  # 目录不可写时只更新内存中的模型
+    st.session_state["feedback_recorded"] = feedback_key
+    st.success("感谢您的反馈！诊断结果的排序已据此更新。")
@@ -0,0 +1,44 @@
+# @File   : search_view.py
+# 检索页面：全文检索的打分和摘要在 fulltext_search.py 中，反向索引在 graph_index.py 中，
+# 这里只负责输入和展示，各页面脚本共用同一份实现。
+import streamlit as st
+
+from fulltext_search import search_disorders
+from graph_index import diagnosis_record, get_index
+from result_view import show_diagnoses
+
+
+# 全文检索模块：在疾病描述、病因、治疗方式等文本中检索，按相关度排序
+def fulltext_search_module(knowledge_graph):
+    st.header("全文检索")
+    st.markdown("在疾病描述、病因、治疗方式、健康教育和诊断建议中检索关键词。")
+    query = st.text_input("请输入关键词：", "")
+    if query.strip():
+        results = search_disorders(query, knowledge_graph)
+        if results:
+            st.write(f"共找到 {len(results)} 个相关疾病：")
+            st.markdown("\n\n".join(
+                f"**{item['疾病']}**（相关度 {item['分数']}）\n\n> {item['字段']}：{item['摘要']}" for item in results
+            ))
+        else:
+            st.warning("未找到包含该关键词的疾病。")
+
+
+# 反向索引模块：按推荐药物、检查项目或病因查找相关疾病
+def reverse_index_module(knowledge_graph):
+    st.header("反向索引")
+    st.markdown("按推荐药物、检查项目或病因查找相关的疾病。")
+    index = get_index(knowledge_graph)
+    kinds = {"推荐药物": "drug", "检查项目": "check", "病因": "cause"}
+    kind = kinds[st.radio("索引类别：", list(kinds), horizontal=True)]
+    keyword = st.text_input("筛选关键字：", "")
+
+    counts = {item["term"]: item["disorder_count"] for item in index.browse_terms(kind, keyword)}
+    if counts:
+        term = st.selectbox("选择条目：", list(counts), format_func=lambda t: f"{t}（{counts[t]} 个疾病）")
+        rows = index.lookup(kind, term)
+        st.write(f"与“{term}”相关的疾病：")
+        show_diagnoses([diagnosis_record(index.disorders[row]) for row in rows], knowledge_graph, key="reverse",
+                       expanders=True)
+    else:
+        st.warning("没有匹配的条目。")
@@ -0,0 +1,193 @@
+# @File   : session_store.py
+# 精简的会话状态：会话里只保存症状编号（对应共享症状词表）和诊断结果的疾病行号，不再保存症状字符串；
+# 图谱热更新后，按旧版本保存的症状编号在第一次读取时通过症状字符串换算到新版本，用户不需要重新选择；
+# 同时记录每个会话占用的字节数，并按空闲时间回收会话数据，控制每个在线用户的内存占用。
+import os
+import sys
+import threading
+import time
+import weakref
+
+from graph_index import diagnosis_record, remap_symptom_ids
+
+SYMPTOM_KEY = "symptom_ids"  # 已保存的症状编号（元组）
+GUIDE_KEY = "selected_symptom_ids"  # 逐步引导模式中保存的症状编号，智能问诊可以从这些症状开始
+VERSION_KEY = "graph_version"  # 各症状键的编号对应的图谱版本：{症状键: 图谱版本}
+RESULT_KEY = "diagnosis_ids"  # 缓存的诊断结果：((图谱版本, 症状编号, 模式), 疾病行号元组)
+
+# 空闲超过 IDLE_TRIM_SECONDS 的会话丢弃可重算的缓存；超过 IDLE_EXPIRE_SECONDS 的会话清空全部数据（需重新登录）
+IDLE_TRIM_SECONDS = int(os.environ.get("SLEEP_IDLE_TRIM_SECONDS", "900"))
+IDLE_EXPIRE_SECONDS = int(os.environ.get("SLEEP_IDLE_EXPIRE_SECONDS", "7200"))
+EVICT_INTERVAL_SECONDS = 60  # 两次空闲检查之间的最短间隔
+TRIMMABLE_KEYS = (RESULT_KEY,)  # 只放由已保存数据推导出、下次使用时可重算的键；用户的输入（如问诊中的回答）不能放在这里
+
+
+# 保存所选症状：只存症状编号和图谱版本，并使之前缓存的诊断结果失效；key 用于区分不同页面保存的症状
+def save_symptoms(state, index, symptoms, key=SYMPTOM_KEY):
+    state[key] = tuple(sorted(set(index.encode_symptoms(symptoms))))
+    _set_version(state, key, index.version)
+    if RESULT_KEY in state:
+        del state[RESULT_KEY]
+
+
+def _set_version(state, key, version):
+    versions = state.get(VERSION_KEY)
+    state[VERSION_KEY] = {**(versions if isinstance(versions, dict) else {}), key: version}
+
+
+# 读取已保存的症状编号。图谱版本已变化时按症状字符串换算到当前版本并写回会话；
+# 旧版本的词表已不在内存中（进程重启后）时无法换算，返回空
+def symptom_ids(state, index, key=SYMPTOM_KEY):
+    sids = state.get(key, ())
+    versions = state.get(VERSION_KEY)
+    version = versions.get(key) if isinstance(versions, dict) else None
+    if version == index.version or not sids:
+        return sids
+    sids = remap_symptom_ids(sids, version, index)
+    if sids is None:
+        return ()
+    state[key] = sids
+    _set_version(state, key, index.version)
+    return sids
+
+
+# 读取已保存的症状（还原为症状字符串）
+def load_symptoms(state, index, key=SYMPTOM_KEY):
+    return [index.symptoms[sid] for sid in symptom_ids(state, index, key)]
+
+
+# 当前会话的诊断结果（疾病行号），症状和图谱版本不变时直接使用会话中缓存的结果
+def session_diagnosis_rows(state, index, mode="any", key=SYMPTOM_KEY):
+    sids = symptom_ids(state, index, key)
+    cache_key = (index.version, sids, mode)
+    cached = state.get(RESULT_KEY)
+    if cached is not None and cached[0] == cache_key:
+        return list(cached[1])
+    if mode == "all":
+        bits = index.all_bits if sids else 0
+        for sid in sids:
+            bits &= index.symptom_bits[sid]
+    else:
+        bits = 0
+        for sid in sids:
+            bits |= index.symptom_bits[sid]
+    rows = index.rows_from_bits(bits)
+    state[RESULT_KEY] = (cache_key, tuple(rows))
+    return rows
+
+
+# 当前会话的诊断结果，格式与 get_diagnosis 相同
+def session_diagnoses(state, index, mode="any", key=SYMPTOM_KEY):
+    return [diagnosis_record(index.disorders[row]) for row in session_diagnosis_rows(state, index, mode, key)]
+
+
+# 估算对象占用的字节数（递归统计容器中的元素，同一对象只算一次）
+def deep_sizeof(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+# 会话状态的字节数
+def session_bytes(state):
+    return deep_sizeof(dict(state.items()) if hasattr(state, "items") else state)
+
+
+class SessionRegistry:
+    """记录各会话的最近访问时间和字节数，按空闲时间回收会话数据"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # 会话 ID -> {"state": 会话状态弱引用, "last_seen": 时间, "bytes": 字节数}
+        self._last_evict = 0.0
+        self.trimmed = 0
+        self.expired = 0
+
+    def touch(self, session_id, raw_state, nbytes, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._sessions[session_id] = {
+                "state": weakref.ref(raw_state) if raw_state is not None else None,
+                "last_seen": now,
+                "bytes": nbytes,
+                "trimmed": False,
+            }
+
+    # 回收空闲会话：返回本次处理的会话数。先在锁内取一份会话列表，处理每个会话时再在锁内重新读取它的
+    # 最近访问时间：取列表之后又被访问过（touch）的会话跳过，判断和清理都在锁内完成，不会清掉正在使用的会话
+    def evict_idle(self, now=None, force=False):
+        now = time.time() if now is None else now
+        with self._lock:
+            if not force and now - self._last_evict < EVICT_INTERVAL_SECONDS:
+                return 0
+            self._last_evict = now
+            candidates = list(self._sessions.items())
+
+        handled = 0
+        for session_id, snapshot in candidates:
+            with self._lock:
+                info = self._sessions.get(session_id)
+                if info is None or info["last_seen"] != snapshot["last_seen"]:
+                    continue
+                idle = now - info["last_seen"]
+                if idle < IDLE_TRIM_SECONDS or (info["trimmed"] and idle < IDLE_EXPIRE_SECONDS):
+                    continue
+                state = info["state"]() if info["state"] is not None else None
+                if state is None or idle >= IDLE_EXPIRE_SECONDS:
+                    # 会话已断开或空闲过久：清空全部数据并停止跟踪
+                    if state is not None:
+                        state.clear()
+                        self.expired += 1
+                    del self._sessions[session_id]
+                else:
+                    for key in TRIMMABLE_KEYS:
+                        if key in state:
+                            del state[key]
+                    info["bytes"] = session_bytes(getattr(state, "filtered_state", {}))
+                    info["trimmed"] = True
+                    self.trimmed += 1
+            handled += 1
+        return handled
+
+    def stats(self):
+        with self._lock:
+            sizes = [info["bytes"] for info in self._sessions.values()]
+        return {
+            "sessions": len(sizes),
+            "total_bytes": sum(sizes),
+            "max_bytes": max(sizes, default=0),
+            "trimmed": self.trimmed,
+            "expired": self.expired,
+        }
+
+
+registry = SessionRegistry()
+
+
+# 当前 Streamlit 会话的 ID，不在页面中运行时为 None
+def current_session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+# 每次页面运行时调用：记录当前会话的大小和访问时间，并顺带回收其他空闲会话
+def track_session(state):
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    nbytes = session_bytes(state)
+    if ctx is not None:
+        # st.session_state 只是代理，真正跨重跑存在的是 SessionState 对象
+        raw_state = getattr(ctx.session_state, "_state", None)
+        registry.touch(ctx.session_id, raw_state, nbytes)
+    registry.evict_idle()
+    return nbytes
@@ -0,0 +1,71 @@
+# @File   : startup_report.py
+# 冷启动报告：在全新的 Python 进程中分别测量各模块的导入耗时、图谱加载耗时，以及页面模块从导入到图谱就绪的总耗时，
+# 并与冷启动预算比较。新扩容的 worker 需要在预算内就绪，超出预算时以非零状态退出，可用于部署前检查。
+# 同时检查每个模块导入后是否已经加载了应当按需加载的依赖（numpy、matplotlib、neo4j），页面模块提前加载时同样视为不达标。
+# 运行方式：python startup_report.py [页面模块] [图谱文件]，默认 ai_diagnose 和 sleep_konwledge_graph.json
+import os
+import subprocess
+import sys
+
+# 依次测量的模块：第三方依赖在前，本项目模块在后
+MODULES = [
+    "streamlit", "numpy", "matplotlib", "neo4j",
+    "graph_index", "cache_backend", "session_store", "fulltext_search", "related_graph",
+    "result_view", "graph_analytics", "question_engine", "question_view", "charts",
+    "symptom_extractor", "fuzzy_match", "naive_bayes", "warmup", "graph_partition", "graph_reload",
+    "prerender", "usage_analytics", "graph_store", "graph_view", "search_view",
+]
+LAZY_MODULES = ("numpy", "matplotlib", "neo4j")  # 页面模块导入时不应加载的依赖
+COLD_START_BUDGET = float(os.environ.get("SLEEP_COLD_START_BUDGET", "3.0"))  # 秒
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 在子进程中执行的测量代码：导入模块（可选再加载图谱），输出两段耗时
+_PROBE = """
+import importlib, sys, time
+sys.path.insert(0, {here!r})
+start = time.perf_counter()
+importlib.import_module({module!r})
+imported = time.perf_counter()
+if {graph_path!r}:
+    from graph_index import load_index
+    load_index({graph_path!r})
+loaded = [name for name in {lazy!r} if name in sys.modules and name != {module!r}]
+print(imported - start, time.perf_counter() - imported, ",".join(loaded) or "-")
+"""
+
+
+# 在全新进程中导入模块，返回 (导入耗时, 图谱加载耗时, 已加载的按需依赖)，模块不存在时返回 None
+def measure(module, graph_path=""):
+    code = _PROBE.format(here=HERE, module=module, graph_path=graph_path, lazy=LAZY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    import_seconds, load_seconds, loaded = result.stdout.split()[-3:]
+    return float(import_seconds), float(load_seconds), [] if loaded == "-" else loaded.split(",")
+
+
+def report(app="ai_diagnose", graph_path="sleep_konwledge_graph.json", budget=COLD_START_BUDGET):
+    print(f"{'模块':<20}{'导入耗时(ms)':>14}  已加载的按需依赖")
+    for module in MODULES:
+        timing = measure(module)
+        text = f"{timing[0] * 1000:>14.1f}  {'、'.join(timing[2]) or '无'}" if timing else f"{'未安装':>14}"
+        print(f"{module:<20}{text}")
+
+    timing = measure(app, graph_path)
+    if timing is None:
+        print(f"无法导入页面模块 {app}")
+        return False
+    import_seconds, load_seconds, loaded = timing
+    total = import_seconds + load_seconds
+    print()
+    print(f"页面模块 {app} 导入：{import_seconds * 1000:.1f} ms")
+    print(f"图谱 {graph_path} 加载：{load_seconds * 1000:.1f} ms")
+    print(f"冷启动合计：{total * 1000:.1f} ms，预算 {budget * 1000:.0f} ms，{'达标' if total <= budget else '超出预算'}")
+    if loaded:
+        print(f"页面模块导入时已加载 {'、'.join(loaded)}，这些依赖应在第一次用到时才加载")
+    return total <= budget and not loaded
+
+
+if __name__ == "__main__":
+    ok = report(*sys.argv[1:3])
+    sys.exit(0 if ok else 1)
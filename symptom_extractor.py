@@ -0,0 +1,123 @@
+# @File   : symptom_extractor.py
+# 自由文本症状提取：把图谱中的全部症状和伴随疾病（accompany）编译成 Aho-Corasick 自动机，
+# 对一段描述文字只从头到尾扫描一遍，就能找出其中出现的所有已知词（包括互相包含、重叠的词）。
+# 自动机按图谱版本只构建一次；转移表是每个状态一个字典，失配时沿失败链回退。
+import re
+import threading
+from collections import deque
+
+from graph_index import get_index
+
+_SPACE = re.compile(r"\s+")
+
+
+# 文本归一化：去掉空白、英文转小写，词表和输入用同样的规则
+def normalize_text(text):
+    return _SPACE.sub("", str(text)).lower()
+
+
+class AhoCorasick:
+    """
+    多模式串匹配自动机。
+    goto[state] 为 字符 -> 下一状态；fail[state] 为失败链；
+    output[state] 为以该状态结尾的最长模式编号（没有为 -1），dict_link[state] 指向失败链上下一个有输出的状态。
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.goto = [{}]
+        self.output = [-1]
+        self.lengths = [len(p) for p in self.patterns]
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = self.goto[state][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.output.append(-1)
+                state = nxt
+            if pattern and self.output[state] == -1:
+                self.output[state] = pid
+
+        # 按层次（BFS）计算失败链和输出链
+        self.fail = [0] * len(self.goto)
+        self.dict_link = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                link = self.fail[nxt]
+                self.dict_link[nxt] = link if self.output[link] != -1 else self.dict_link[link]
+
+    # 扫描一遍文本，返回所有匹配 [(起始位置, 模式编号), ...]，按结束位置排列
+    def find_all(self, text):
+        goto, fail, output, dict_link, lengths = self.goto, self.fail, self.output, self.dict_link, self.lengths
+        matches = []
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = state if output[state] != -1 else dict_link[state]
+            while hit:
+                pid = output[hit]
+                matches.append((end - lengths[pid], pid))
+                hit = dict_link[hit]
+        return matches
+
+
+class SymptomExtractor:
+    """图谱中的症状和伴随疾病组成一个词表，匹配结果按类别区分"""
+
+    def __init__(self, index):
+        self.version = index.version
+        self.terms = {}  # 归一化后的词 -> (类别, 原始词)
+        for symptom in index.symptoms:
+            self.terms.setdefault(normalize_text(symptom), ("symptom", symptom))
+        for disorder in index.disorders:
+            for term in disorder.get("accompany") or []:
+                self.terms.setdefault(normalize_text(term), ("accompany", term))
+        self.terms.pop("", None)
+        self.keys = list(self.terms)
+        self.automaton = AhoCorasick(self.keys)
+
+    # 提取文本中的症状和伴随疾病，按在文本中首次出现的位置排列，去重
+    def extract(self, text):
+        found = {"symptom": [], "accompany": []}
+        seen = set()
+        for _, pid in sorted(self.automaton.find_all(normalize_text(text))):
+            if pid in seen:
+                continue
+            seen.add(pid)
+            kind, term = self.terms[self.keys[pid]]
+            found[kind].append(term)
+        return found
+
+
+_lock = threading.Lock()
+_cache = {}  # 图谱版本 -> SymptomExtractor
+
+
+def get_extractor(knowledge_graph):
+    index = get_index(knowledge_graph)
+    extractor = _cache.get(index.version)
+    if extractor is None:
+        extractor = SymptomExtractor(index)
+        with _lock:
+            if len(_cache) > 4:
+                _cache.clear()
+            _cache[index.version] = extractor
+    return extractor
+
+
+# 从描述文字中提取已知症状（可直接交给 get_diagnosis）和伴随疾病
+def extract_symptoms(text, knowledge_graph):
+    found = get_extractor(knowledge_graph).extract(text)
+    return found["symptom"], found["accompany"]
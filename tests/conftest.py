@@ -0,0 +1,6 @@
+# 测试直接导入仓库根目录下的模块
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
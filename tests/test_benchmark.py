@@ -0,0 +1,26 @@
+# 基准按疾病名称评分：返回同 _id 的另一个疾病不能算作正确
+from benchmark import evaluate_cases, generate_cases, index_any_engine, reference_engine, summarize
+
+from test_graph_index import load_graph
+
+
+def test_index_any_matches_reference():
+    knowledge_graph = load_graph("sleep_konwledge_graph.json")
+    cases = generate_cases(knowledge_graph, count=300)
+    for engine in (reference_engine, index_any_engine):
+        summary = summarize(evaluate_cases(cases, engine, knowledge_graph))
+        assert summary["exact_match"] == 1.0
+
+
+def test_duplicate_id_is_not_a_hit():
+    knowledge_graph = load_graph("sleep_konwledge_graph.json")
+    rows = [row for row, d in enumerate(knowledge_graph) if d["_id"] == 22]
+    assert len(rows) > 1
+    target, other = knowledge_graph[rows[0]], knowledge_graph[rows[1]]
+    case = {"symptoms": list(target["symptom"]), "expected": [target["name"]], "target": target["name"]}
+
+    def wrong_engine(symptoms, graph):
+        return [{"id": other["_id"], "疾病": other["name"]}]
+
+    summary = summarize(evaluate_cases([case], wrong_engine, knowledge_graph))
+    assert summary["top1"] == 0.0 and summary["precision"] == 0.0
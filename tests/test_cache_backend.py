@@ -0,0 +1,97 @@
+# TieredCache 用 MemoryStore 代替 Redis：进程内 LRU 淘汰、共享层回填、共享层出错时的退化，以及过期时间
+import types
+
+import pytest
+
+import cache_backend
+from cache_backend import MemoryStore, TieredCache, canonical_symptoms
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_backend, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+class BrokenStore:
+    """每次读写都失败的共享层（例如 Redis 超时）"""
+
+    def get(self, name):
+        raise ConnectionError("timeout")
+
+    def set(self, name, value, ex=None):
+        raise ConnectionError("timeout")
+
+
+def test_local_lru_evicts_least_recently_used():
+    cache = TieredCache("t", maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["size"] == 2
+
+
+def test_shared_layer_fills_other_processes():
+    store = MemoryStore()
+    first, second = TieredCache("t", shared=store), TieredCache("t", shared=store)
+    key = ("v1", canonical_symptoms(["打鼾", "失眠"]))
+    first.put(key, [{"疾病": "失眠症"}])
+    assert second.get(("v1", canonical_symptoms(["失眠", "打鼾"]))) == [{"疾病": "失眠症"}]
+    assert second.shared_hits == 1
+    assert second.get(key) == [{"疾病": "失眠症"}]  # 第二次从进程内缓存命中
+    assert second.local_hits == 1
+    assert TieredCache("other", shared=store).get(key) is None  # 不同命名空间互不影响
+
+
+def test_local_eviction_falls_back_to_shared():
+    store = MemoryStore()
+    cache = TieredCache("t", maxsize=1, shared=store, dumps=bytes, loads=bytes)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1" and cache.shared_hits == 1
+
+
+def test_broken_shared_layer_degrades_to_local():
+    cache = TieredCache("t", shared=BrokenStore())
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.errors == 2 and cache.misses == 1
+
+
+def test_get_or_compute_computes_once():
+    cache = TieredCache("t", shared=MemoryStore())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_compute("k", compute) == 1
+    assert cache.get_or_compute("k", compute) == 1
+    assert calls == [1]
+
+
+def test_entries_expire_in_both_layers(clock):
+    store = MemoryStore()
+    cache = TieredCache("t", ttl=60, shared=store)
+    cache.put("a", 1)
+    cache.put("b", 2, ttl=0)  # 0 表示不过期
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a") is None
+    assert TieredCache("t", shared=store).get("a") is None
+    assert cache.get("b") == 2
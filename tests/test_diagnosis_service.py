@@ -0,0 +1,102 @@
+# 诊断 HTTP 服务：用最小的 ASGI 调用驱动 app，检查诊断、批量、错误状态码、响应缓存和预渲染页面地址
+import asyncio
+import json
+import os
+
+import pytest
+
+import diagnosis_service
+from cache_backend import TieredCache
+from conftest import ROOT
+from graph_reload import current_index
+from prerender import build_pages
+
+GRAPH = os.path.join(ROOT, "sleep_konwledge_graph.json")
+
+
+# 发送一个请求，返回 (状态码, 响应体)；响应体是 JSON 时解析后返回
+def call(method, path, payload=None, query="", raw=None):
+    body = raw if raw is not None else (json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b"")
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query.encode("utf-8")}
+    asyncio.run(diagnosis_service.app(scope, receive, send))
+    status, content = messages[0]["status"], messages[1]["body"]
+    headers = dict(messages[0]["headers"])
+    if headers[b"content-type"].startswith(b"application/json"):
+        content = json.loads(content)
+    return status, content
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(diagnosis_service, "GRAPH_PATH", GRAPH)
+    monkeypatch.setattr(diagnosis_service, "cache", TieredCache("service", maxsize=64, dumps=bytes, loads=bytes))
+    monkeypatch.setattr(diagnosis_service, "STATIC_DIR", str(tmp_path / "static"))
+    monkeypatch.setattr(diagnosis_service, "PAGE_DIR", str(tmp_path / "static" / "disorders"))
+    return current_index(GRAPH)
+
+
+def test_diagnose_matches_index_and_is_cached(service):
+    symptoms = service.symptoms[:3]
+    for mode in ("any", "all"):
+        status, body = call("POST", "/diagnose", {"symptoms": symptoms, "mode": mode})
+        assert status == 200
+        assert body["version"] == service.version
+        assert body["results"] == service.diagnose(symptoms, mode=mode)
+    hits = diagnosis_service.cache.local_hits
+    status, again = call("POST", "/diagnose", {"symptoms": list(reversed(symptoms)), "mode": "any"})
+    assert status == 200 and diagnosis_service.cache.local_hits == hits + 1  # 症状顺序不同也命中缓存
+    assert again["results"] == service.diagnose(symptoms)
+
+
+def test_batch_matches_single_requests(service):
+    requests = [{"symptoms": service.symptoms[i:i + 2]} for i in range(0, 10, 2)]
+    requests.append({"symptoms": service.symptoms[:4], "min_match": 2})
+    status, body = call("POST", "/diagnose/batch", {"requests": requests})
+    assert status == 200 and len(body["results"]) == len(requests)
+    for request, result in zip(requests, body["results"]):
+        assert result == call("POST", "/diagnose", request)[1]
+
+
+@pytest.mark.parametrize("method, path, payload, raw, status", [
+    ("POST", "/diagnose", None, b"{not json", 400),
+    ("POST", "/diagnose", {"symptoms": "打鼾"}, None, 400),
+    ("POST", "/diagnose", {"symptoms": [], "mode": "some"}, None, 400),
+    ("POST", "/diagnose", {"symptoms": [], "min_match": True}, None, 400),
+    ("POST", "/diagnose/batch", {"requests": {}}, None, 400),
+    ("POST", "/diagnose/batch", {"requests": [{"symptoms": "x"}]}, None, 400),
+    ("POST", "/diagnose/batch", {"requests": [{"symptoms": []}] * (diagnosis_service.MAX_BATCH + 1)}, None, 413),
+    ("POST", "/symptoms/match", {"phrases": ["x"] * (diagnosis_service.MAX_BATCH + 1)}, None, 413),
+    ("GET", "/nothing", None, None, 404),
+    ("GET", "/disorders/abc", None, None, 400),
+    ("GET", "/disorders/987654321", None, None, 404),
+    ("GET", "/related/987654321", None, None, 404),
+    ("GET", "/lookup/food", None, None, 404),
+    ("GET", "/static/../diagnosis_service.py", None, None, 404),
+])
+def test_error_status(service, method, path, payload, raw, status):
+    code, body = call(method, path, payload, raw=raw)
+    assert code == status and "error" in body
+
+
+# 第一次请求时还没有预渲染页面；之后运行 prerender，同一个疾病的响应（记录已缓存）应立即带上页面地址
+def test_disorder_pages_follow_prerender(service):
+    disorder_id = service.disorders[0]["_id"]
+    status, body = call("GET", f"/disorders/{disorder_id}")
+    assert status == 200 and body["pages"] == []
+    assert body["results"] == service.get_disorders(disorder_id)
+
+    build_pages(GRAPH, diagnosis_service.PAGE_DIR, workers=1)
+    manifests = [f for f in os.listdir(diagnosis_service.PAGE_DIR) if f.endswith(".json")]
+    assert manifests == [f"manifest_{service.version}.json"]  # 只有按版本命名的清单
+    status, body = call("GET", f"/disorders/{disorder_id}")
+    assert status == 200 and len(body["pages"]) == len(service.rows_by_id[disorder_id])
+    status, page = call("GET", body["pages"][0])
+    assert status == 200 and service.disorders[0]["name"] in page.decode("utf-8")
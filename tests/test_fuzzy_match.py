@@ -0,0 +1,81 @@
+# 近似匹配的稀疏打分必须与稠密 TF-IDF 向量直接计算的余弦相似度一致，取前 k 个的结果也一致
+import math
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from fuzzy_match import FuzzyMatcher, char_ngrams, normalize_phrase
+from graph_index import GraphIndex
+
+from test_graph_index import GRAPHS, load_graph
+
+
+# 稠密向量：1 + log 词频乘 IDF，再做 L2 归一化；词表外的 n-gram 忽略
+def dense_vector(matcher, phrase):
+    vector = np.zeros(len(matcher.grams))
+    counts = Counter(gram for gram in char_ngrams(normalize_phrase(phrase)) if gram in matcher.grams)
+    for gram, count in counts.items():
+        vector[matcher.grams[gram]] = (1 + math.log(count)) * matcher.idf[matcher.grams[gram]]
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def to_dense(similarity, phrases, n):
+    ptr, rows, scores = similarity
+    dense = np.zeros((len(phrases), n))
+    for q in range(len(phrases)):
+        dense[q, rows[ptr[q]:ptr[q + 1]]] = scores[ptr[q]:ptr[q + 1]]
+    return dense
+
+
+# 由症状改写出的短语：加前缀、删字、换字、颠倒、截取，以及完全无关的文字
+def phrases(symptoms, count=200, seed=0):
+    rng = random.Random(seed)
+    result = ["", "xyz", "。，"]
+    for _ in range(count):
+        s = rng.choice(symptoms)
+        roll = rng.random()
+        if roll < 0.2:
+            s = "患有" + s
+        elif roll < 0.4 and len(s) > 1:
+            i = rng.randrange(len(s))
+            s = s[:i] + s[i + 1:]
+        elif roll < 0.6:
+            i = rng.randrange(len(s))
+            s = s[:i] + rng.choice("的了睡醒痛") + s[i + 1:]
+        elif roll < 0.8:
+            s = s[::-1]
+        else:
+            s = s[:rng.randint(1, len(s))]
+        result.append(s)
+    return result
+
+
+@pytest.fixture(scope="module", params=GRAPHS)
+def matcher(request):
+    return FuzzyMatcher(GraphIndex(load_graph(request.param)))
+
+
+def test_sparse_scores_match_dense_cosine(matcher):
+    queries = phrases(matcher.symptoms)
+    symptom_vectors = np.array([dense_vector(matcher, s) for s in matcher.symptoms])
+    query_vectors = np.array([dense_vector(matcher, q) for q in queries])
+    expected = query_vectors @ symptom_vectors.T
+    assert np.allclose(to_dense(matcher.similarity(queries), queries, len(matcher.symptoms)), expected)
+
+
+@pytest.mark.parametrize("k", [1, 5])
+def test_match_is_dense_top_k(matcher, k):
+    queries = phrases(matcher.symptoms, seed=1)
+    dense = to_dense(matcher.similarity(queries), queries, len(matcher.symptoms))
+    for row, result in zip(dense, matcher.match(queries, k=k)):
+        top = sorted((i for i in range(len(row)) if row[i] > 0), key=lambda i: (-row[i], i))[:k]
+        assert result == [(matcher.symptoms[i], round(float(row[i]), 4)) for i in top]
+
+
+def test_empty_batch(matcher):
+    ptr, rows, scores = matcher.similarity([])
+    assert list(ptr) == [0] and len(rows) == len(scores) == 0
+    assert matcher.match([]) == []
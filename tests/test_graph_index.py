@@ -0,0 +1,90 @@
+# GraphIndex 的诊断结果必须与原来逐个遍历疾病的写法完全一致（包括顺序）
+import json
+import os
+import random
+
+import pytest
+
+from graph_index import GraphIndex, diagnosis_record
+
+from conftest import ROOT
+
+GRAPHS = ("sleep_konwledge_graph.json", "JSON_new.json")
+
+
+def load_graph(name):
+    with open(os.path.join(ROOT, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# 原来 333.py / diagnosis_app.py 中 get_diagnosis 的遍历写法
+def baseline_any(symptoms, knowledge_graph):
+    return [d for d in knowledge_graph if any(s in d["symptom"] for s in symptoms)]
+
+
+def baseline_all(symptoms, knowledge_graph):
+    return [d for d in knowledge_graph if all(s in d["symptom"] for s in symptoms)]
+
+
+def baseline_at_least(symptoms, knowledge_graph, k):
+    symptoms = set(symptoms)
+    return [d for d in knowledge_graph if len(symptoms & set(d["symptom"])) >= k]
+
+
+# 固定种子的随机症状组合，另外加上每个疾病自己的全部症状和一个不存在的症状
+def symptom_sets(knowledge_graph, count=300, seed=0):
+    vocabulary = sorted({s for d in knowledge_graph for s in d["symptom"]})
+    rng = random.Random(seed)
+    sets = [[], ["不存在的症状"], [vocabulary[0], "不存在的症状"]]
+    sets += [list(d["symptom"]) for d in knowledge_graph]
+    sets += [rng.sample(vocabulary, rng.randint(1, 5)) for _ in range(count)]
+    return sets
+
+
+@pytest.fixture(scope="module", params=GRAPHS)
+def graph(request):
+    knowledge_graph = load_graph(request.param)
+    return knowledge_graph, GraphIndex(knowledge_graph)
+
+
+def test_match_any_matches_baseline(graph):
+    knowledge_graph, index = graph
+    for symptoms in symptom_sets(knowledge_graph):
+        assert [index.disorders[row] for row in index.match_any(symptoms)] == baseline_any(symptoms, knowledge_graph)
+
+
+def test_match_all_matches_baseline(graph):
+    knowledge_graph, index = graph
+    for symptoms in symptom_sets(knowledge_graph):
+        assert [index.disorders[row] for row in index.match_all(symptoms)] == baseline_all(symptoms, knowledge_graph)
+
+
+def test_match_at_least_matches_baseline(graph):
+    knowledge_graph, index = graph
+    for symptoms in symptom_sets(knowledge_graph, count=100):
+        for k in range(0, 4):
+            expected = baseline_at_least(symptoms, knowledge_graph, k)
+            assert [index.disorders[row] for row in index.match_at_least(symptoms, k)] == expected
+
+
+def test_diagnose_records(graph):
+    knowledge_graph, index = graph
+    for symptoms in symptom_sets(knowledge_graph, count=50):
+        assert index.diagnose(symptoms) == [diagnosis_record(d) for d in baseline_any(symptoms, knowledge_graph)]
+        assert index.diagnose(symptoms, "all") == [diagnosis_record(d) for d in baseline_all(symptoms, knowledge_graph)]
+
+
+# 要求至少匹配全部症状与“全部匹配”的结果相同，页面在滑块取最大值时据此改走 bits_all
+def test_min_match_all_equals_mode_all(graph):
+    knowledge_graph, index = graph
+    for symptoms in symptom_sets(knowledge_graph, count=100):
+        symptoms = list(dict.fromkeys(symptoms))
+        assert index.diagnose(symptoms, min_match=len(symptoms)) == index.diagnose(symptoms, mode="all")
+
+
+def test_duplicate_ids_keep_all_rows():
+    knowledge_graph = load_graph("sleep_konwledge_graph.json")
+    index = GraphIndex(knowledge_graph)
+    for disorder_id, rows in index.rows_by_id.items():
+        assert [d["_id"] for d in index.get_disorders(disorder_id)] == [disorder_id] * len(rows)
+    assert sum(len(rows) for rows in index.rows_by_id.values()) == len(knowledge_graph)
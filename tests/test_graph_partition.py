@@ -0,0 +1,73 @@
+# 分区路由的诊断结果必须与整图索引完全一致；限定类别时等于整图结果中属于这些类别的疾病
+import json
+import random
+
+import pytest
+
+from graph_index import GraphIndex
+from graph_partition import PartitionRouter, build_manifest, disorder_categories, open_partitions, split_graph
+
+from test_graph_index import GRAPHS, load_graph, symptom_sets
+
+MODES = (("any", None), ("all", None), ("any", 1), ("any", 2), ("any", 3))
+
+
+# 带类别的合成图谱：部分疾病属于多个类别，部分没有类别
+def synthetic_graph(disorders=600, vocabulary=150, seed=1):
+    rng = random.Random(seed)
+    symptoms = [f"症状{i}" for i in range(vocabulary)]
+    categories = [f"类别{i}" for i in range(12)]
+    graph = []
+    for row in range(disorders):
+        disorder = {"_id": row % 97, "name": f"疾病{row}", "desc": "", "diag_criteria": [], "cure_way": [],
+                    "symptom": rng.sample(symptoms, rng.randint(1, 8))}
+        if row % 5:
+            disorder["category"] = rng.sample(categories, rng.randint(1, 3))
+        graph.append(disorder)
+    return graph
+
+
+def make_router(knowledge_graph):
+    manifest = build_manifest(knowledge_graph, "test")
+    return PartitionRouter(manifest, lambda c: [knowledge_graph[row] for row in manifest["partitions"][c]["rows"]])
+
+
+def full_rows(index, symptoms, mode, min_match):
+    if min_match is not None:
+        return index.match_at_least(symptoms, min_match)
+    return index.match_all(symptoms) if mode == "all" else index.match_any(symptoms)
+
+
+@pytest.fixture(scope="module", params=GRAPHS + ("synthetic",))
+def graph(request):
+    knowledge_graph = synthetic_graph() if request.param == "synthetic" else load_graph(request.param)
+    return knowledge_graph, GraphIndex(knowledge_graph), make_router(knowledge_graph)
+
+
+def test_router_matches_full_index(graph):
+    knowledge_graph, index, router = graph
+    for symptoms in symptom_sets(knowledge_graph, count=150):
+        for mode, min_match in MODES:
+            assert router.match_rows(symptoms, mode, min_match) == full_rows(index, symptoms, mode, min_match)
+        assert router.diagnose(symptoms) == index.diagnose(symptoms)
+
+
+def test_router_category_filter(graph):
+    knowledge_graph, index, router = graph
+    for category in router.categories:
+        for symptoms in symptom_sets(knowledge_graph, count=30):
+            expected = [row for row in index.match_any(symptoms)
+                        if category in disorder_categories(knowledge_graph[row])]
+            assert router.match_rows(symptoms, categories=[category]) == expected
+
+
+def test_split_partitions_match_full_index(tmp_path):
+    knowledge_graph = synthetic_graph(disorders=200)
+    graph_path = tmp_path / "graph.json"
+    graph_path.write_text(json.dumps(knowledge_graph, ensure_ascii=False), encoding="utf-8")
+    split_graph(str(graph_path), str(tmp_path / "partitions"))
+    router = open_partitions(str(tmp_path / "partitions"))
+    index = GraphIndex(knowledge_graph)
+    for symptoms in symptom_sets(knowledge_graph, count=50):
+        assert router.match_rows(symptoms) == index.match_any(symptoms)
+        assert router.diagnose(symptoms, "all") == index.diagnose(symptoms, "all")
@@ -0,0 +1,97 @@
+# 热更新切换后，会话中保存的症状、问诊回答和朴素贝叶斯的反馈计数都要带到新版本
+import json
+import time
+
+import pytest
+
+import fulltext_search
+import graph_reload
+import naive_bayes
+import prerender
+from question_engine import answer, candidate_rows, migrate_state, new_state
+from session_store import load_symptoms, save_symptoms, session_diagnosis_rows
+
+from test_graph_index import load_graph
+
+
+@pytest.fixture
+def reloader(tmp_path, monkeypatch):
+    monkeypatch.setattr(naive_bayes, "MODEL_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(fulltext_search, "INDEX_DIR", str(tmp_path / "models"))
+    path = tmp_path / "graph.json"
+    path.write_text(json.dumps(load_graph("sleep_konwledge_graph.json"), ensure_ascii=False), encoding="utf-8")
+    reloader = graph_reload.GraphReloader(str(path), interval=0, grace=0)
+    reloader.load()
+    return reloader
+
+
+# 修改一个疾病描述，并给另一个疾病加一个排在最前面的新症状（已有症状的编号全部后移）
+def edit_graph(reloader):
+    with open(reloader.path, "r", encoding="utf-8") as f:
+        knowledge_graph = json.load(f)
+    knowledge_graph[0]["desc"] += "（修订）"
+    knowledge_graph[1]["symptom"].insert(0, "阿阿新症状")
+    with open(reloader.path, "w", encoding="utf-8") as f:
+        json.dump(knowledge_graph, f, ensure_ascii=False)
+    reloader.check()
+    time.sleep(0.01)
+    assert reloader.check()
+
+
+def names(index, rows):
+    return [index.disorders[row]["name"] for row in rows]
+
+
+def test_session_symptoms_survive_swap(reloader):
+    old = reloader.current
+    state = {}
+    save_symptoms(state, old, ["失眠", "打鼾"])
+    save_symptoms(state, old, ["失眠"], key="selected_symptom_ids")
+    rows = session_diagnosis_rows(state, old)
+    edit_graph(reloader)
+    new = reloader.current
+    assert new.version != old.version
+    assert load_symptoms(state, new) == ["失眠", "打鼾"]
+    assert load_symptoms(state, new, key="selected_symptom_ids") == ["失眠"]
+    assert names(new, session_diagnosis_rows(state, new)) == names(old, rows)
+
+
+def test_question_answers_survive_swap(reloader):
+    old = reloader.current
+    state = new_state(old)
+    answer(old, state, old.symptom_ids["失眠"], True)
+    answer(old, state, old.symptom_ids["打鼾"], False)
+    edit_graph(reloader)
+    new = reloader.current
+    migrated = migrate_state(new, state)
+    assert [new.symptoms[sid] for sid in migrated["confirmed"]] == ["失眠"]
+    assert [new.symptoms[sid] for sid in migrated["denied"]] == ["打鼾"]
+    assert names(new, candidate_rows(new, migrated)) == names(old, candidate_rows(old, state))
+
+
+def test_feedback_counts_carried_over(reloader):
+    old = reloader.current
+    symptoms = ["失眠", "打鼾"]
+    rows = old.match_any(symptoms)
+    model = naive_bayes.get_model(old.disorders)
+    for _ in range(20):
+        model.update(symptoms, rows, satisfied=True)
+    model.save()
+    before = [(old.disorders[row]["name"], round(p, 9)) for row, p in model.rank(symptoms, rows)]
+    edit_graph(reloader)
+    reloader.release_retired(force=True)
+    new = reloader.current
+    after = naive_bayes.get_model(new.disorders).rank(symptoms, new.match_any(symptoms))
+    assert [(new.disorders[row]["name"], round(p, 9)) for row, p in after] == before
+
+
+# 旧版本释放后，预渲染清单和详情页的内存缓存中不再保留它
+def test_prerender_caches_released(reloader, tmp_path):
+    old = reloader.current
+    prerender.build_pages(reloader.path, str(tmp_path / "pages"), workers=1)
+    prerender.load_manifest(old.version, str(tmp_path / "pages"))
+    prerender.page_html(old.disorders, 0, str(tmp_path / "pages"))
+    assert old.version in prerender._manifests and old.version in prerender._pages
+    edit_graph(reloader)
+    reloader.release_retired(force=True)
+    assert old.version not in prerender._manifests and old.version not in prerender._pages
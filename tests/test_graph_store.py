@@ -0,0 +1,85 @@
+# 多版本存储建立的索引必须与直接建立的 GraphIndex 完全一致；
+# 同一标签的更新沿用上一个版本中未改动的结构，未改动的疾病不重新解析
+import copy
+
+import pytest
+
+import graph_store
+from graph_index import REVERSE_FIELDS, GraphIndex
+from graph_store import GraphStore
+
+from test_graph_index import GRAPHS, load_graph, symptom_sets
+
+
+def assert_same_index(index, expected):
+    assert index.symptoms == expected.symptoms
+    assert index.row_symptoms == expected.row_symptoms
+    assert index.postings == expected.postings
+    assert index.symptom_bits == expected.symptom_bits
+    assert index.rows_by_id == expected.rows_by_id
+    assert index.reverse_terms == expected.reverse_terms
+    assert index.reverse_ids == expected.reverse_ids
+    assert index.reverse_bits == expected.reverse_bits
+    for symptoms in symptom_sets(expected.disorders, count=50):
+        assert index.match_any(symptoms) == expected.match_any(symptoms)
+        assert index.match_all(symptoms) == expected.match_all(symptoms)
+
+
+@pytest.fixture
+def graphs():
+    return {name: load_graph(name) for name in GRAPHS}
+
+
+def test_versions_match_plain_index(graphs):
+    store = GraphStore()
+    for label, knowledge_graph in graphs.items():
+        assert_same_index(store.add_version(label, knowledge_graph), GraphIndex(knowledge_graph))
+    assert all(build["reused"] == [] for build in store.builds.values())
+
+
+# 只改描述：症状和全部反向索引都沿用上一个版本的对象
+def test_description_edit_reuses_structures(graphs):
+    store = GraphStore()
+    knowledge_graph = graphs[GRAPHS[0]]
+    old = store.add_version("A", knowledge_graph)
+    edited = copy.deepcopy(knowledge_graph)
+    edited[0]["desc"] += "（修订）"
+    new = store.add_version("A", edited)
+    assert new.version != old.version
+    assert store.builds["A"] == {"new_records": 1, "new_terms": 0, "reused": ["symptom", *REVERSE_FIELDS]}
+    assert new.postings is old.postings and new.symptom_bits is old.symptom_bits
+    assert all(new.reverse_bits[kind] is old.reverse_bits[kind] for kind in REVERSE_FIELDS)
+    assert_same_index(new, GraphIndex(edited))
+
+
+# 改症状只重建症状部分；增删疾病使行号错位，全部按逐个疾病的缓存重新组装
+def test_changed_fields_are_rebuilt(graphs):
+    store = GraphStore()
+    knowledge_graph = graphs[GRAPHS[0]]
+    store.add_version("A", knowledge_graph)
+    edited = copy.deepcopy(knowledge_graph)
+    edited[1]["symptom"].insert(0, "阿阿新症状")
+    new = store.add_version("A", edited)
+    assert store.builds["A"]["reused"] == list(REVERSE_FIELDS)
+    assert_same_index(new, GraphIndex(edited))
+
+    shorter = edited[1:]
+    new = store.add_version("A", shorter)
+    assert store.builds["A"] == {"new_records": 0, "new_terms": 0, "reused": []}
+    assert_same_index(new, GraphIndex(shorter))
+
+
+def test_unchanged_records_are_not_reparsed(graphs, monkeypatch):
+    calls = []
+    index_entries = graph_store.index_entries
+    monkeypatch.setattr(graph_store, "index_entries", lambda record, extractor: calls.append(record) or
+                        index_entries(record, extractor))
+    store = GraphStore()
+    knowledge_graph = graphs[GRAPHS[0]]
+    store.add_version("A", knowledge_graph)
+    assert len(calls) == len(store.records)
+    calls.clear()
+    edited = copy.deepcopy(knowledge_graph)
+    edited[2]["symptom"].append("阿阿新症状")
+    store.add_version("B", edited)
+    assert [record["name"] for record in calls] == [edited[2]["name"]]
@@ -0,0 +1,91 @@
+# 朴素贝叶斯模型的保存和读取：反馈计数保存后原样读回，多个进程先后保存时各自的反馈都保留
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import naive_bayes
+from conftest import ROOT
+from graph_index import get_index
+from naive_bayes import COUNT_KEYS, NaiveBayesModel, get_model
+
+from test_graph_index import load_graph
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    monkeypatch.setattr(naive_bayes, "MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(naive_bayes, "_cache", {})
+    return load_graph("sleep_konwledge_graph.json")
+
+
+def counts(model):
+    return {key: getattr(model, key).copy() for key in COUNT_KEYS}
+
+
+def give_feedback(model, symptoms, satisfied):
+    model.update(symptoms, model.index.match_any(symptoms), satisfied)
+
+
+def test_update_save_load_round_trip(graph):
+    model = get_model(graph)
+    symptoms = model.index.symptoms[:3]
+    give_feedback(model, symptoms, True)
+    give_feedback(model, model.index.symptoms[5:7], False)
+    model.save()
+    expected, ranking = counts(model), model.rank(symptoms)
+
+    naive_bayes._cache.clear()
+    loaded = get_model(graph)
+    assert loaded is not model
+    for key in COUNT_KEYS:
+        np.testing.assert_array_equal(getattr(loaded, key), expected[key])
+    assert loaded.rank(symptoms) == ranking
+
+
+# 两个进程各自从同一份计数开始收到反馈，先后保存：磁盘上是两份增量之和，后保存的进程也拿到前者的反馈
+def test_saves_from_two_processes_are_merged(graph):
+    index = get_index(graph)
+    first, second = NaiveBayesModel(index), NaiveBayesModel(index)
+    initial = counts(first)
+    give_feedback(first, index.symptoms[:2], True)
+    give_feedback(second, index.symptoms[10:13], False)
+    after_first, after_second = counts(first), counts(second)
+    first.save()
+    second.save()
+
+    naive_bayes._cache.clear()
+    loaded = get_model(graph)
+    for key in COUNT_KEYS:
+        expected = after_first[key] + after_second[key] - initial[key]
+        np.testing.assert_allclose(getattr(loaded, key), expected)
+        np.testing.assert_allclose(getattr(second, key), expected)
+
+    first.save()  # 没有新反馈时再次保存不会重复计入
+    naive_bayes._cache.clear()
+    np.testing.assert_allclose(get_model(graph).trials, loaded.trials)
+
+
+# 真正的多个进程同时反馈并保存：每次反馈使 trials 的总和正好增加 1，最后一次都不能少
+def test_concurrent_processes_do_not_lose_feedback(graph):
+    code = """
+import sys
+sys.path.insert(0, {root!r})
+import json
+from naive_bayes import get_model
+with open({graph!r}, encoding="utf-8") as f:
+    model = get_model(json.load(f))
+for i in range(5):
+    symptoms = model.index.symptoms[int(sys.argv[1]) + i:int(sys.argv[1]) + i + 2]
+    model.update(symptoms, model.index.match_any(symptoms), satisfied=i % 2 == 0)
+    model.save()
+"""
+    code = code.format(root=ROOT, graph=os.path.join(ROOT, "sleep_konwledge_graph.json"))
+    env = {**os.environ, "SLEEP_INDEX_DIR": naive_bayes.MODEL_DIR}
+    processes = [subprocess.Popen([sys.executable, "-c", code, str(10 * n)], env=env) for n in range(4)]
+    assert all(process.wait() == 0 for process in processes)
+
+    initial = NaiveBayesModel(get_index(graph)).trials.sum()
+    assert get_model(graph).trials.sum() == pytest.approx(initial + 4 * 5)
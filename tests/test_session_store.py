@@ -0,0 +1,52 @@
+# 空闲会话回收：空闲的会话被裁剪或清空，取会话列表之后又被访问的会话保持不变
+import threading
+
+import session_store
+from session_store import RESULT_KEY, SYMPTOM_KEY, SessionRegistry
+
+
+class State(dict):
+    """可以被弱引用的会话状态"""
+
+
+def new_state():
+    return State({SYMPTOM_KEY: (1, 2), RESULT_KEY: ("key", (0,)), "question_state": {"asked": [3]}})
+
+
+def test_idle_sessions_are_trimmed_then_expired():
+    registry = SessionRegistry()
+    state = new_state()
+    registry.touch("s", state, 100, now=0)
+    assert registry.evict_idle(now=session_store.IDLE_TRIM_SECONDS, force=True) == 1
+    assert RESULT_KEY not in state and state[SYMPTOM_KEY] == (1, 2) and "question_state" in state
+    assert registry.evict_idle(now=session_store.IDLE_EXPIRE_SECONDS, force=True) == 1
+    assert not state and registry.stats()["sessions"] == 0
+
+
+class HookLock:
+    """第 n 次获取锁之前先执行 hook，模拟另一个线程在 evict_idle 取完会话列表后访问会话"""
+
+    def __init__(self, n, hook):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.n = n
+        self.hook = hook
+
+    def __enter__(self):
+        self.count += 1
+        if self.count == self.n:
+            self.hook()
+        self._lock.acquire()
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def test_session_touched_after_snapshot_is_kept():
+    registry = SessionRegistry()
+    state = new_state()
+    registry.touch("s", state, 100, now=0)
+    now = session_store.IDLE_EXPIRE_SECONDS
+    registry._lock = HookLock(2, lambda: registry.touch("s", state, 100, now=now))
+    assert registry.evict_idle(now=now, force=True) == 0
+    assert state == new_state() and registry.stats()["sessions"] == 1
@@ -0,0 +1,71 @@
+# Aho-Corasick 自动机的匹配结果必须与逐个词暴力查找完全一致（包括互相包含、重叠的词）
+import random
+
+import pytest
+
+from graph_index import GraphIndex
+from symptom_extractor import AhoCorasick, SymptomExtractor, normalize_text
+
+from test_graph_index import GRAPHS, load_graph
+
+
+# 暴力查找：每个模式在文本中的所有出现位置
+def brute_force(patterns, text):
+    matches = set()
+    for pid, pattern in enumerate(patterns):
+        start = text.find(pattern)
+        while start != -1:
+            matches.add((start, pid))
+            start = text.find(pattern, start + 1)
+    return matches
+
+
+# 暴力提取：按每个词首次出现的位置排列，同一位置按词表顺序
+def brute_force_extract(extractor, text):
+    text = normalize_text(text)
+    hits = sorted((text.find(key), pid) for pid, key in enumerate(extractor.keys) if key in text)
+    found = {"symptom": [], "accompany": []}
+    for _, pid in hits:
+        kind, term = extractor.terms[extractor.keys[pid]]
+        found[kind].append(term)
+    return found
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_find_all_matches_brute_force(seed):
+    # 小字母表让模式大量重叠、互为前后缀
+    rng = random.Random(seed)
+    alphabet = "abc"
+    patterns = list(dict.fromkeys("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 5)))
+                                  for _ in range(rng.randint(1, 30))))
+    automaton = AhoCorasick(patterns)
+    for _ in range(20):
+        text = "".join(rng.choice(alphabet + "d") for _ in range(rng.randint(0, 60)))
+        matches = automaton.find_all(text)
+        assert len(matches) == len(set(matches))
+        assert set(matches) == brute_force(patterns, text)
+
+
+@pytest.fixture(scope="module", params=GRAPHS)
+def extractor(request):
+    return SymptomExtractor(GraphIndex(load_graph(request.param)))
+
+
+def test_extract_matches_brute_force(extractor):
+    rng = random.Random(0)
+    keys = extractor.keys
+    for _ in range(200):
+        # 由词表中的词、词的片段和无关文字拼成描述
+        parts = []
+        for _ in range(rng.randint(0, 8)):
+            key = rng.choice(keys)
+            roll = rng.random()
+            if roll < 0.5:
+                parts.append(key)
+            elif roll < 0.8:
+                start = rng.randrange(len(key))
+                parts.append(key[start:start + rng.randint(1, len(key))])
+            else:
+                parts.append(rng.choice(["，", "最近", " 总是 ", "Ab", "。"]))
+        text = "".join(parts)
+        assert extractor.extract(text) == brute_force_extract(extractor, text)
@@ -0,0 +1,122 @@
+# 使用统计的摘要结构：HyperLogLog 的误差在容许范围内，Count-Min 只会高估；
+# 增量文件合并进 usage.json 后删除，重复合并不会重复计数，锁被其他进程接管时放弃本次合并
+import json
+import os
+import random
+import time
+from collections import Counter
+
+import pytest
+
+import usage_analytics
+from usage_analytics import CountMinSketch, HyperLogLog, UsageAnalytics, compact, merge_snapshots
+
+
+@pytest.mark.parametrize("n", [100, 5000, 50000])
+def test_hyperloglog_error(n):
+    hll = HyperLogLog()
+    for i in range(n):
+        hll.add(f"session-{i}")
+        hll.add(f"session-{i // 2}")  # 重复的会话不增加计数
+    assert abs(hll.count() - n) <= 0.03 * n  # 相对标准误差约 0.8%
+
+
+def test_hyperloglog_merge_is_union():
+    a, b, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        (a if i % 3 else b).add(str(i))
+        both.add(str(i))
+    a.merge(b)
+    assert a.registers == both.registers
+
+
+def test_count_min_never_underestimates():
+    # 窄草图让大量元素落在同一格，估计值必须仍不低于真实次数
+    rng = random.Random(0)
+    sketch = CountMinSketch(width=64, depth=4)
+    truth = Counter()
+    for _ in range(20000):
+        item = f"症状{int(rng.paretovariate(1.2))}"
+        count = rng.randint(1, 3)
+        sketch.add(item, count)
+        truth[item] += count
+    assert sketch.total == sum(truth.values())
+    assert all(sketch.estimate(item) >= count for item, count in truth.items())
+    assert sketch.estimate("从未出现的症状") <= sketch.total
+
+
+# 同一进程写出的增量文件按编号区分，所以每个测试只用一个 UsageAnalytics
+def write_delta(analytics, selections, session):
+    for symptoms in selections:
+        analytics.record_selection(session, symptoms)
+    analytics.record_diagnoses(session, ["失眠症"])
+    analytics.snapshot()
+
+
+def merged_summary(directory):
+    with open(os.path.join(directory, usage_analytics.MERGED_FILE), "r", encoding="utf-8") as f:
+        return merge_snapshots([json.load(f)])
+
+
+def test_compact_merges_and_deletes_deltas(tmp_path):
+    analytics = UsageAnalytics(str(tmp_path))
+    for i in range(5):
+        write_delta(analytics, [["失眠", "打鼾"], ["失眠"]], f"s{i}")
+    assert len(usage_analytics._delta_files(str(tmp_path))) == 5
+    assert compact(str(tmp_path)) == 5
+    assert usage_analytics._delta_files(str(tmp_path)) == []
+    summary = merged_summary(tmp_path)
+    assert summary["selections"] == 10 and summary["diagnosis_events"] == 5
+    assert summary["sketches"]["symptom"].estimate("失眠") == 10
+    assert summary["sketches"]["pair"].estimate("失眠 + 打鼾") == 5
+
+    # 没有新增量时不改动；新增量只加一次
+    assert compact(str(tmp_path)) == 0
+    write_delta(analytics, [["失眠"]], "s9")
+    assert compact(str(tmp_path)) == 1
+    summary = merged_summary(tmp_path)
+    assert summary["selections"] == 11 and summary["sketches"]["symptom"].estimate("失眠") == 11
+    assert not os.path.exists(os.path.join(tmp_path, usage_analytics.LOCK_FILE))
+
+
+def test_compact_refreshes_lock(tmp_path, monkeypatch):
+    analytics = UsageAnalytics(str(tmp_path))
+    for i in range(3):
+        write_delta(analytics, [["失眠"]], f"s{i}")
+    lock_path = os.path.join(tmp_path, usage_analytics.LOCK_FILE)
+    read_json = usage_analytics._read_json
+    ages = []
+
+    # 模拟很慢的合并：每读一个增量文件前把锁的修改时间调到过期之前
+    def slow_read(path):
+        ages.append(time.time() - os.path.getmtime(lock_path))
+        old = time.time() - 2 * usage_analytics.STALE_LOCK_SECONDS
+        os.utime(lock_path, (old, old))
+        return read_json(path)
+
+    monkeypatch.setattr(usage_analytics, "_read_json", slow_read)
+    assert compact(str(tmp_path)) == 3
+    assert all(age < usage_analytics.STALE_LOCK_SECONDS for age in ages[1:])  # 每次读之前都已刷新
+
+
+def test_compact_gives_up_when_lock_taken_over(tmp_path, monkeypatch):
+    analytics = UsageAnalytics(str(tmp_path))
+    for i in range(3):
+        write_delta(analytics, [["失眠"]], f"s{i}")
+    lock_path = os.path.join(tmp_path, usage_analytics.LOCK_FILE)
+    read_json = usage_analytics._read_json
+
+    # 合并途中另一个进程把锁当作过期删除并重新创建
+    def taken_over(path):
+        if path.endswith(".json") and os.path.basename(path).startswith("usage_"):
+            os.remove(lock_path)
+            with open(lock_path, "w", encoding="utf-8") as f:
+                f.write("other")
+        return read_json(path)
+
+    monkeypatch.setattr(usage_analytics, "_read_json", taken_over)
+    assert compact(str(tmp_path)) == 0
+    assert len(usage_analytics._delta_files(str(tmp_path))) == 3  # 增量文件留给下次合并
+    assert not os.path.exists(os.path.join(tmp_path, usage_analytics.MERGED_FILE))
+    with open(lock_path, "r", encoding="utf-8") as f:
+        assert f.read() == "other"  # 不删除别人的锁
@@ -0,0 +1,374 @@
+# @File   : usage_analytics.py
+# 使用统计：用户选择了哪些症状和症状组合、得到了哪些诊断，用固定大小的流式摘要结构统计，不保存任何会话：
+#   Count-Min 草图   估计每个症状、症状对、诊断被选中/给出的次数（只会高估，误差与草图宽度成反比）
+#   HyperLogLog      估计不同会话数（16384 个寄存器，相对误差约 0.8%）
+#   Top-K            最常见的症状、症状对和诊断（用 Count-Min 的估计值维护一个固定长度的候选表）
+# 内存与用户数无关。只有设置了 SLEEP_ANALYTICS_DIR 才统计（默认关闭，与 SLEEP_USAGE_LOG 一样需要部署方主动开启），
+# 未设置时不记录、不写任何文件。开启后每个进程定期把上次写盘以来的增量写成一个新文件并清空内存中的计数，
+# 增量文件超过 MAX_DELTA_FILES 个或查看统计时合并进 usage.json 并删除（Count-Min 逐格相加，
+# HyperLogLog 逐寄存器取最大值），目录中的文件数有上限，多进程、重启后的统计都不会丢。
+import atexit
+import glob
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from array import array
+from itertools import combinations
+
+ANALYTICS_DIR = os.environ.get("SLEEP_ANALYTICS_DIR", "")  # 为空时不统计
+SNAPSHOT_INTERVAL = float(os.environ.get("SLEEP_ANALYTICS_INTERVAL", "60"))  # 两次写盘之间的最短秒数
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+HLL_PRECISION = 14
+TOP_K = 20
+MAX_DELTA_FILES = 16  # 增量文件超过这个数时合并
+MERGED_FILE = "usage.json"  # 合并后的统计
+LOCK_FILE = "usage.lock"  # 合并时的跨进程锁
+STALE_LOCK_SECONDS = 60  # 锁文件超过这个时间没有刷新，说明持有它的进程已经退出（合并时持续刷新）
+MAX_PAIR_SYMPTOMS = 8  # 一次选择的症状超过这个数时只统计前 8 个的两两组合，避免组合数过多
+
+
+# 稳定的 64 位哈希：与 Python 内置 hash 不同，在不同进程和重启之间结果一致，快照才能合并
+def _hash64(item, salt=b""):
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8, salt=salt).digest(), "little")
+
+
+class CountMinSketch:
+    """depth 行 width 列的计数表；每行用不同的哈希选一列加一，估计值取各行的最小值"""
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = array("Q", table if table is not None else bytes(8 * width * depth))
+        self.total = 0
+
+    def _cells(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [row * self.width + int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+                for row in range(self.depth)]
+
+    # 加 count 次，返回加完后的估计值
+    def add(self, item, count=1):
+        cells = self._cells(item)
+        for cell in cells:
+            self.table[cell] += count
+        self.total += count
+        return min(self.table[cell] for cell in cells)
+
+    def estimate(self, item):
+        return min(self.table[cell] for cell in self._cells(item))
+
+    def merge(self, other):
+        for i, value in enumerate(other.table):
+            self.table[i] += value
+        self.total += other.total
+
+    def to_dict(self):
+        return {"width": self.width, "depth": self.depth, "total": self.total, "table": self.table.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["width"], data["depth"], data["table"])
+        sketch.total = data["total"]
+        return sketch
+
+
+class HyperLogLog:
+    """2^precision 个寄存器，每个记录落入该桶的哈希值中最长的前导零个数 + 1"""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers if registers is not None else self.size)
+
+    def add(self, item):
+        value = _hash64(item, salt=b"hll")
+        bucket = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[bucket]:
+            self.registers[bucket] = rank
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size ** 2 / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)  # 基数较小时用线性计数修正
+        return int(round(estimate))
+
+    def merge(self, other):
+        for i, value in enumerate(other.registers):
+            if value > self.registers[i]:
+                self.registers[i] = value
+
+    def to_dict(self):
+        return {"precision": self.precision, "registers": self.registers.hex()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["precision"], bytes.fromhex(data["registers"]))
+
+
+class TopK:
+    """最多 k 个候选及其估计次数：新元素的估计值超过当前最小的候选时替换它"""
+
+    def __init__(self, k=TOP_K, items=None):
+        self.k = k
+        self.items = dict(items or {})
+
+    def offer(self, item, estimate):
+        if item in self.items or len(self.items) < self.k:
+            self.items[item] = estimate
+            return
+        smallest = min(self.items, key=self.items.get)
+        if estimate > self.items[smallest]:
+            del self.items[smallest]
+            self.items[item] = estimate
+
+    def top(self, n=None):
+        return sorted(self.items.items(), key=lambda kv: (-kv[1], kv[0]))[:n or self.k]
+
+
+# 统计的三类事件：症状、症状对、诊断
+KINDS = ("symptom", "pair", "diagnosis")
+
+
+class UsageAnalytics:
+    """一个进程内尚未写盘的使用统计，所有结构大小固定；线程安全。directory 为空时不记录"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._sequence = 0  # 本进程写出的增量文件编号
+        self._last_snapshot = time.monotonic()
+        self._reset()
+
+    def _reset(self):
+        self.sketches = {kind: CountMinSketch() for kind in KINDS}
+        self.top = {kind: TopK() for kind in KINDS}
+        self.sessions = HyperLogLog()
+        self.selections = 0  # 保存症状的次数
+        self.started = time.time()
+
+    def _add(self, kind, item):
+        self.top[kind].offer(item, self.sketches[kind].add(item))
+
+    # 用户保存了一组症状：统计每个症状和每对症状
+    def record_selection(self, session_id, symptoms):
+        symptoms = sorted(set(symptoms))
+        if not self.directory or not symptoms:
+            return
+        with self._lock:
+            self.selections += 1
+            if session_id:
+                self.sessions.add(str(session_id))
+            for symptom in symptoms:
+                self._add("symptom", symptom)
+            for a, b in combinations(symptoms[:MAX_PAIR_SYMPTOMS], 2):
+                self._add("pair", f"{a} + {b}")
+        self.maybe_snapshot()
+
+    # 用户看到了一组诊断结果
+    def record_diagnoses(self, session_id, names):
+        if not self.directory:
+            return
+        with self._lock:
+            if session_id:
+                self.sessions.add(str(session_id))
+            for name in dict.fromkeys(names):
+                self._add("diagnosis", name)
+        self.maybe_snapshot()
+
+    def _to_dict(self):
+        return {
+            "started": self.started,
+            "selections": self.selections,
+            "sessions": self.sessions.to_dict(),
+            "sketches": {kind: sketch.to_dict() for kind, sketch in self.sketches.items()},
+            "top": {kind: dict(top.items) for kind, top in self.top.items()},
+        }
+
+    def to_dict(self):
+        with self._lock:
+            return self._to_dict()
+
+    # 并入另一份统计：草图和计数相加，两边的候选用合并后的草图重新估计，保留前 k 个
+    def merge(self, data):
+        with self._lock:
+            self.started = min(self.started, data["started"])
+            self.selections += data["selections"]
+            self.sessions.merge(HyperLogLog.from_dict(data["sessions"]))
+            for kind in KINDS:
+                sketch, top = self.sketches[kind], self.top[kind]
+                sketch.merge(CountMinSketch.from_dict(data["sketches"][kind]))
+                candidates = set(top.items) | set(data["top"][kind])
+                top.items = dict(sorted(((item, sketch.estimate(item)) for item in candidates),
+                                        key=lambda kv: (-kv[1], kv[0]))[:top.k])
+
+    def summary(self, top_n=TOP_K):
+        with self._lock:
+            return {
+                "selections": self.selections,
+                "distinct_sessions": self.sessions.count(),
+                "symptom_events": self.sketches["symptom"].total,
+                "diagnosis_events": self.sketches["diagnosis"].total,
+                "top": {kind: self.top[kind].top(top_n) for kind in KINDS},
+                "sketches": self.sketches,
+            }
+
+    # 写快照：把上次写盘以来的增量写成本进程的一个新文件，写成功后清空内存中的计数；没有新记录时不写
+    def snapshot(self):
+        with self._lock:
+            self._last_snapshot = time.monotonic()
+            if not self.directory or not (self.selections or self.sketches["diagnosis"].total):
+                return
+            self._sequence += 1
+            path = os.path.join(self.directory, f"usage_{PROCESS_ID}_{self._sequence:06d}.json")
+            _write_json(path, self._to_dict())
+            self._reset()
+        if len(_delta_files(self.directory)) > MAX_DELTA_FILES:
+            compact(self.directory)
+
+    def maybe_snapshot(self, force=False):
+        if not force and time.monotonic() - self._last_snapshot < SNAPSHOT_INTERVAL:
+            return
+        try:
+            self.snapshot()
+        except OSError:
+            pass  # 目录不可写时统计继续留在内存中，下次再写
+
+
+# 写 JSON 文件：先写本次独有的临时文件再替换，并发写同一个目录也不会互相覆盖临时文件
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# 各进程写出、还没有合并的增量文件
+def _delta_files(directory):
+    return sorted(glob.glob(os.path.join(directory, "usage_*.json")))
+
+
+# 跨进程锁：用 O_EXCL 创建锁文件并写入本次的随机标记，返回 (路径, 标记)；已被占用时返回 None。
+# 持有者异常退出留下的过期锁文件（超过 STALE_LOCK_SECONDS 没有刷新）直接删除
+def _try_lock(directory):
+    path = os.path.join(directory, LOCK_FILE)
+    token = uuid.uuid4().hex
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(path) > STALE_LOCK_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+        return None
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    return path, token
+
+
+# 确认锁仍由自己持有并刷新修改时间：合并耗时较长时不会被其他进程当作过期锁删除；
+# 锁已被删除或换了持有者时返回 False，调用方应放弃本次合并
+def _hold_lock(lock):
+    path, token = lock
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() != token:
+                return False
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def _release_lock(lock):
+    path, token = lock
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == token:
+                os.remove(path)
+    except OSError:
+        pass
+
+
+# 把所有增量文件合并进 usage.json 并删除它们；其他进程正在合并时跳过。返回合并的文件数。
+# 每并入一个文件刷新一次锁；写结果之前锁已经不属于自己时（例如进程长时间暂停）放弃，增量文件留给下次合并
+def compact(directory=ANALYTICS_DIR):
+    if not directory or not os.path.isdir(directory):
+        return 0
+    lock = _try_lock(directory)
+    if lock is None:
+        return 0
+    try:
+        merged_path = os.path.join(directory, MERGED_FILE)
+        merged = UsageAnalytics()
+        data = _read_json(merged_path)
+        if data is not None:
+            merged.merge(data)
+        paths = []
+        for path in _delta_files(directory):
+            if not _hold_lock(lock):
+                return 0
+            data = _read_json(path)
+            if data is not None:
+                merged.merge(data)
+                paths.append(path)
+        if not paths or not _hold_lock(lock):
+            return 0
+        _write_json(merged_path, merged.to_dict())  # 先写合并结果，再删除已并入的增量文件
+        for path in paths:
+            os.remove(path)
+        return len(paths)
+    finally:
+        _release_lock(lock)
+
+
+# 合并多份统计，返回汇总结果
+def merge_snapshots(snapshots, top_n=TOP_K):
+    merged = UsageAnalytics()
+    for data in snapshots:
+        merged.merge(data)
+    return {"snapshots": len(snapshots), **merged.summary(top_n)}
+
+
+PROCESS_ID = uuid.uuid4().hex[:12]  # 增量文件名中的进程标识
+analytics = UsageAnalytics(ANALYTICS_DIR)
+atexit.register(lambda: analytics.maybe_snapshot(force=True))  # 进程退出前写最后一次增量
+
+
+# 汇总统计：先合并增量文件，再读 usage.json、未合并的增量文件和本进程内存中尚未写盘的数据。未开启时返回 None
+def usage_summary(top_n=TOP_K):
+    if not analytics.directory:
+        return None
+    try:
+        compact(analytics.directory)
+    except OSError:
+        pass  # 合并失败时直接读取各文件
+    snapshots = [analytics.to_dict()]
+    for path in [os.path.join(analytics.directory, MERGED_FILE)] + _delta_files(analytics.directory):
+        data = _read_json(path)
+        if data is not None:
+            snapshots.append(data)
+    return merge_snapshots(snapshots, top_n)
@@ -0,0 +1,144 @@
+# @File   : warmup.py
+# 缓存预热：进程启动后在后台线程中把常见的症状组合依次走一遍诊断结果页用到的计算（朴素贝叶斯排序、结果片段、
+# Neo4j 子图、相关疾病网络和疾病详情页），部署后的第一批用户不再承担完整的计算开销。
+# 每个图谱版本预热一次：A/B 测试中各会话固定的版本、热更新切换后的新版本都会在第一次用到时各自预热。
+# 预热不阻塞页面就绪，进度和耗时可随时通过 warmup_status() 查看。
+#
+# 症状组合的来源（按优先级）：
+#   1. 调用 start_warmup 时直接传入的组合列表；
+#   2. SLEEP_WARMUP_FILE 指定的 JSON 文件，内容为症状列表的列表，例如 [["入睡困难", "早醒"], ["打鼾"]]；
+#   3. SLEEP_USAGE_LOG 指定的使用日志（每行 {"symptoms": [...]}），按出现次数取最常见的组合；
+#   4. 以上都没有时，预热图谱中的每个单独症状。
+# 使用日志只有设置了 SLEEP_USAGE_LOG 才会记录，且只记录症状组合本身，不包含任何用户信息。
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from cache_backend import canonical_symptoms
+from graph_index import get_index, diagnosis_record
+from related_graph import get_related_graph
+
+WARMUP_FILE = os.environ.get("SLEEP_WARMUP_FILE", "")
+USAGE_LOG = os.environ.get("SLEEP_USAGE_LOG", "")
+WARMUP_LIMIT = int(os.environ.get("SLEEP_WARMUP_LIMIT", "200"))  # 最多预热的组合数
+
+_log_lock = threading.Lock()
+_lock = threading.Lock()
+_status = {}  # 图谱版本 -> 预热进度
+_threads = {}  # 图谱版本 -> 预热线程
+_latest = None  # 最近一次启动预热的图谱版本
+IDLE_STATUS = {"state": "idle", "total": 0, "done": 0, "errors": 0, "started": None, "seconds": 0.0}
+
+
+# 记录一次症状组合（未设置 SLEEP_USAGE_LOG 时不记录）
+def record_usage(symptoms):
+    if not USAGE_LOG or not symptoms:
+        return
+    line = json.dumps({"symptoms": list(canonical_symptoms(symptoms))}, ensure_ascii=False)
+    try:
+        with _log_lock, open(USAGE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        pass
+
+
+# 从使用日志中统计最常见的症状组合
+def popular_combinations(path=USAGE_LOG, limit=WARMUP_LIMIT):
+    counts = Counter()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    symptoms = json.loads(line).get("symptoms")
+                except ValueError:
+                    continue
+                if symptoms:
+                    counts[canonical_symptoms(symptoms)] += 1
+    except OSError:
+        return []
+    return [list(combo) for combo, _ in counts.most_common(limit)]
+
+
+# 按优先级确定要预热的症状组合
+def warmup_combinations(index, limit=WARMUP_LIMIT):
+    if WARMUP_FILE:
+        try:
+            with open(WARMUP_FILE, "r", encoding="utf-8") as f:
+                return [list(combo) for combo in json.load(f)][:limit]
+        except (OSError, ValueError):
+            pass
+    if USAGE_LOG:
+        combinations = popular_combinations(USAGE_LOG, limit)
+        if combinations:
+            return combinations
+    return [[symptom] for symptom in index.symptoms[:limit]]
+
+
+# 预热一组症状，按诊断结果页的顺序走一遍：诊断结果的疾病行号（与 session_diagnosis_rows 相同）、朴素贝叶斯排序、
+# 每个疾病的结果片段、相关疾病网络的一跳邻域和排在第一位的疾病详情页；extra(diagnoses) 用于页面自己的额外查询（如 Neo4j 子图）。
+# 会话里缓存的疾病行号只是几次位运算，这里预热的是各会话共用、计算量大的部分
+def warm_one(index, symptoms, extra=None):
+    from naive_bayes import get_model  # 按需导入，与诊断结果页相同
+    from prerender import page_html
+    from result_view import disorder_fragment
+
+    knowledge_graph = index.disorders
+    rows = index.match_any(symptoms)
+    if not rows:
+        return
+    ranked = get_model(knowledge_graph).rank(symptoms, rows)
+    diagnoses = [diagnosis_record(knowledge_graph[row]) for row, _ in ranked]
+    for diag in diagnoses:
+        disorder_fragment(diag, index.version)
+    get_related_graph(knowledge_graph).subgraph(rows, hops=1)
+    page_html(knowledge_graph, ranked[0][0])
+    if extra is not None:
+        extra(diagnoses)
+
+
+def _run(index, combinations, extra):
+    status = _status[index.version]
+    start = time.perf_counter()
+    for symptoms in combinations:
+        try:
+            warm_one(index, symptoms, extra)
+        except Exception:  # 单个组合失败（例如 Neo4j 暂时不可用）不影响其余组合
+            with _lock:
+                status["errors"] += 1
+        with _lock:
+            status["done"] += 1
+            status["seconds"] = time.perf_counter() - start
+    with _lock:
+        status["state"] = "finished"
+
+
+# 启动后台预热线程，每个图谱版本只启动一次，立即返回
+def start_warmup(knowledge_graph, combinations=None, extra=None):
+    global _latest
+    index = get_index(knowledge_graph)
+    thread = _threads.get(index.version)
+    if thread is not None:
+        return thread
+    with _lock:
+        thread = _threads.get(index.version)
+        if thread is not None:
+            return thread
+        if combinations is None:
+            combinations = warmup_combinations(index)
+        _status[index.version] = {"state": "running", "total": len(combinations), "done": 0, "errors": 0,
+                                  "started": time.time(), "seconds": 0.0}
+        thread = threading.Thread(target=_run, args=(index, combinations, extra), name="cache-warmup", daemon=True)
+        _threads[index.version] = thread
+        _latest = index.version
+        thread.start()
+        return thread
+
+
+# 预热进度：state 为 idle / running / finished，seconds 为已用时间；
+# 不指定图谱时返回最近一次启动的预热
+def warmup_status(knowledge_graph=None):
+    version = get_index(knowledge_graph).version if knowledge_graph is not None else _latest
+    with _lock:
+        return dict(_status.get(version, IDLE_STATUS))